@@ -0,0 +1,110 @@
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from api.models import Allocation, Sector, TransactionRequest, TransactionResponse
+from api.ranking import RankingIndex, CREDIT, DEBIT
+from api.registry import card_available_gbp
+
+# Same threshold CardOptimizer.optimize uses to decide against splitting
+MIN_SPLIT_TRANSACTION = 50.0
+
+
+def source_rates(entries, category: Sector, best_debit_rate: float):
+    # Per-£ cashback and relative interest rate for every ranked source,
+    # mirroring the branches in CardOptimizer.optimize
+    cashback = np.zeros(len(entries))
+    interest = np.zeros(len(entries))
+    is_credit = np.zeros(len(entries), dtype=bool)
+    for j, entry in enumerate(entries):
+        if entry.kind == CREDIT:
+            cashback[j] = entry.card.cashback_rates.get(category, 0)
+            interest[j] = best_debit_rate
+            is_credit[j] = True
+        elif entry.kind == DEBIT:
+            interest[j] = best_debit_rate - entry.card.annual_interest_rate
+        else:
+            interest[j] = best_debit_rate - entry.card.markup_rate
+    return cashback, interest, is_credit
+
+
+def _optimize_sector(requests: List[TransactionRequest], category: Sector, ranking: RankingIndex) -> List[TransactionResponse]:
+    entries = ranking.ranked(category)
+    n, k = len(requests), len(entries)
+    amounts = np.array([r.amount for r in requests], dtype=float)
+    available = np.array([card_available_gbp(e.card, e.kind) for e in entries], dtype=float)
+    cashback_rate, interest_rate, is_credit = source_rates(entries, category, ranking.best_debit_rate)
+
+    allocated = np.zeros((n, k))
+    used = np.zeros((n, k), dtype=bool)
+    remaining = amounts.copy()
+
+    # Small transactions go on the first ranked source that covers them whole
+    if k:
+        covers = available[None, :] >= amounts[:, None]
+        single = (amounts < MIN_SPLIT_TRANSACTION) & covers.any(axis=1)
+        rows = np.flatnonzero(single)
+        columns = covers[rows].argmax(axis=1)
+        allocated[rows, columns] = amounts[rows]
+        used[rows, columns] = True
+        remaining[rows] = 0.0
+    else:
+        single = np.zeros(n, dtype=bool)
+
+    # Greedy waterfall, one ranked source at a time across the whole batch.
+    # The per-row arithmetic matches the scalar loop exactly.
+    active = ~single
+    for j in range(k):
+        if available[j] <= 0:
+            continue
+        take = active & (remaining > 0)
+        if not take.any():
+            break
+        use = np.minimum(remaining[take], available[j])
+        allocated[take, j] = use
+        used[take, j] = True
+        remaining[take] -= use
+
+    interest = allocated * interest_rate / 12
+    points = allocated * cashback_rate + interest
+
+    results = []
+    for i, request in enumerate(requests):
+        allocations = [
+            Allocation.model_construct(
+                card_id=entries[j].card.id,
+                card_name=entries[j].card.name,
+                amount_utilised=float(allocated[i, j]),
+                interest_saved=float(interest[i, j]),
+                cashback_points=float(points[i, j]),
+                cashback_sector=category if is_credit[j] else None,
+            )
+            for j in np.flatnonzero(used[i])
+        ]
+        results.append(TransactionResponse.model_construct(
+            allocations=allocations,
+            explanation=None,
+            explanation_id=None,
+            explanation_source=None,
+            hold_id=None,
+            total_amount=request.amount,
+            status="success" if remaining[i] == 0 else "insufficient_funds",
+        ))
+    return results
+
+
+# Batch form of CardOptimizer.optimize: transactions are grouped by sector and
+# the single-card choice and waterfall fill run as NumPy operations across
+# each group, against the same (unchanged) card state.
+def optimize_batch(requests: List[TransactionRequest], ranking: RankingIndex) -> List[TransactionResponse]:
+    by_category: Dict[Sector, List[int]] = defaultdict(list)
+    for i, request in enumerate(requests):
+        by_category[Sector(request.category)].append(i)
+
+    results: List[TransactionResponse] = [None] * len(requests)
+    for category, indices in by_category.items():
+        sector_results = _optimize_sector([requests[i] for i in indices], category, ranking)
+        for i, result in zip(indices, sector_results):
+            results[i] = result
+    return results
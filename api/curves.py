@@ -0,0 +1,77 @@
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from api.batch import MIN_SPLIT_TRANSACTION, source_rates
+from api.models import Sector
+from api.ranking import RankingIndex
+from api.registry import CardRegistry, card_available_gbp
+
+
+# For a fixed card state and sector, the optimizer's waterfall is a
+# piecewise-linear function of the amount: each ranked source fills up to its
+# available GBP in turn, so the breakpoints are the cumulative availabilities
+# (plus the £50 single-card threshold). The curve precomputes those tables so
+# any amount is answered with a binary search, and a whole grid of amounts
+# with one searchsorted/clip pass.
+class SectorCurve:
+    def __init__(self, category: Sector, entries, best_debit_rate: float):
+        self.category = Sector(category)
+        self.entries = list(entries)
+        available = np.array([card_available_gbp(e.card, e.kind) for e in self.entries], dtype=float)
+        self.capacity = np.maximum(available, 0.0)
+        self.cumulative = np.cumsum(self.capacity)
+        self.filled_before = self.cumulative - self.capacity
+        # First ranked source able to take an amount whole = first index whose
+        # running maximum availability reaches it
+        self.running_max = np.maximum.accumulate(available) if len(available) else available
+        self.total_available = float(self.cumulative[-1]) if len(self.entries) else 0.0
+        self.cashback_rate, self.interest_rate, self.is_credit = source_rates(
+            self.entries, self.category, best_debit_rate)
+
+    def breakpoints(self) -> List[float]:
+        points = {float(c) for c, cap in zip(self.cumulative, self.capacity) if cap > 0}
+        points.add(MIN_SPLIT_TRANSACTION)
+        return sorted(points)
+
+    def allocate_many(self, amounts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns the amount placed on each ranked source for every amount
+        # (len(amounts) x len(entries)) and whether each amount was covered.
+        amounts = np.asarray(amounts, dtype=float)
+        allocated = np.clip(amounts[:, None] - self.filled_before[None, :], 0.0, self.capacity[None, :])
+        if self.entries:
+            single_index = np.searchsorted(self.running_max, amounts, side="left")
+            single = (amounts < MIN_SPLIT_TRANSACTION) & (single_index < len(self.entries))
+            rows = np.flatnonzero(single)
+            allocated[rows] = 0.0
+            allocated[rows, single_index[rows]] = amounts[rows]
+        covered = allocated.sum(axis=1) >= amounts - 1e-9
+        return allocated, covered
+
+
+# Keeps one SectorCurve per sector for the current card state. Any change to
+# the registry (limits, balances, cards) or the ranking (rates, preferences)
+# bumps a version; curves are rebuilt on first use after such a change.
+class CurveEngine:
+    def __init__(self, registry: CardRegistry, ranking: RankingIndex):
+        self.registry = registry
+        self.ranking = ranking
+        self._lock = threading.Lock()
+        self._state = None
+        self._curves: Dict[Sector, SectorCurve] = {}
+        self.builds = 0
+
+    def curve(self, category: Sector) -> SectorCurve:
+        category = Sector(category)
+        state = (self.registry.version, self.ranking.version)
+        with self._lock:
+            if state != self._state:
+                self._curves = {}
+                self._state = state
+            curve = self._curves.get(category)
+            if curve is None:
+                curve = SectorCurve(category, self.ranking.ranked(category), self.ranking.best_debit_rate)
+                self._curves[category] = curve
+                self.builds += 1
+            return curve
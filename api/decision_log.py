@@ -0,0 +1,432 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from api.models import Allocation, CommitMode, Sector
+
+logger = logging.getLogger(__name__)
+
+# Append-only binary log of optimization decisions; empty keeps decisions and
+# their rollups in memory only
+DECISION_LOG_PATH = os.getenv("OPTIVAULT_DECISION_LOG_PATH", "")
+
+# How often the writer thread appends queued decisions and updates the rollups
+DECISION_LOG_FLUSH_INTERVAL = float(os.getenv("OPTIVAULT_DECISION_LOG_FLUSH_MS", "50")) / 1000
+
+SECTORS = list(Sector)
+COMMIT_MODES = list(CommitMode)
+# What rollups count unless asked otherwise: spend that was actually
+# committed, not previews (commit=none)
+COMMITTED = [CommitMode.SETTLE, CommitMode.RESERVE]
+STATUSES = ["success", "insufficient_funds"]
+# Value -> index, for packing on the request path
+_SECTOR_INDEX = {**{s: i for i, s in enumerate(SECTORS)}, **{s.value: i for i, s in enumerate(SECTORS)}}
+_COMMIT_INDEX = {**{c: i for i, c in enumerate(COMMIT_MODES)}, **{c.value: i for i, c in enumerate(COMMIT_MODES)}}
+_STATUS_INDEX = {s: i for i, s in enumerate(STATUSES)}
+
+# One 64-byte record per allocation, little-endian:
+#   decision sequence number, created_at (unix seconds), month (yyyymm),
+#   user id, card id (both indexes into the id table), sector, status and
+#   commit mode (indexes into the lists above), one pad byte, transaction
+#   amount, amount utilised, cashback and interest saved (GBP)
+RECORD = struct.Struct("<QdIIIBBBxdddd")
+RECORD_DTYPE = np.dtype([
+    ("seq", "<u8"), ("created_at", "<f8"), ("month", "<u4"), ("user", "<u4"), ("card", "<u4"),
+    ("sector", "u1"), ("status", "u1"), ("commit", "u1"), ("pad", "u1"),
+    ("amount", "<f8"), ("utilised", "<f8"), ("cashback", "<f8"), ("interest_saved", "<f8"),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size == 64
+
+
+def ids_path(path: str) -> str:
+    # User and card ids, one JSON string per line; a record's id is the line number
+    return path + ".ids"
+
+
+def segment_path(path: str, index: int) -> str:
+    # Every writing process appends to a segment of its own: the log path
+    # itself, then <path>.1, <path>.2, ...
+    return path if index == 0 else f"{path}.{index}"
+
+
+def segment_paths(path: str) -> List[str]:
+    paths = []
+    while os.path.exists(segment_path(path, len(paths))):
+        paths.append(segment_path(path, len(paths)))
+    return paths
+
+
+def read_ids(path: str, offset: int = 0) -> Tuple[List[str], int]:
+    # Complete lines from `offset` on, and the offset after them; a line still
+    # being written is left for the next read
+    if not os.path.exists(ids_path(path)):
+        return [], offset
+    with open(ids_path(path), "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    complete = data[:data.rfind(b"\n") + 1]
+    return [json.loads(line) for line in complete.splitlines() if line.strip()], offset + len(complete)
+
+
+def month_number(timestamp: float) -> int:
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.year * 100 + moment.month
+
+
+# Read-only view of a decision log. The records are a NumPy structured array
+# over the memory map, so scans and aggregations run without copying the file.
+# A log written by several workers has several segments; they are merged into
+# one array, with ids mapped onto one shared id table (and `seq` numbering
+# decisions within their segment). A torn record at the end (a crash
+# mid-append) is ignored.
+class DecisionLogReader:
+    def __init__(self, path: str):
+        self._files = []
+        self._maps = []
+        segments = []
+        for segment in segment_paths(path) or [path]:
+            ids, _ = read_ids(segment)
+            segments.append((ids, self._map_segment(segment)))
+        if len(segments) == 1:
+            self.ids, self.records = segments[0]
+            return
+        positions: Dict[str, int] = {}
+        parts = []
+        for ids, records in segments:
+            remap = np.array([positions.setdefault(value, len(positions)) for value in ids], dtype=np.uint32)
+            part = records.copy()
+            if len(part):
+                part["user"] = remap[part["user"]]
+                part["card"] = remap[part["card"]]
+            parts.append(part)
+        self.ids = list(positions)
+        self.records = np.concatenate(parts)
+        # Everything is copied; drop the views so the maps can close
+        del segments, records
+        self._release()
+
+    def _map_segment(self, path: str) -> np.ndarray:
+        file = open(path, "rb")
+        self._files.append(file)
+        count = os.fstat(file.fileno()).st_size // RECORD.size
+        if not count:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        self._maps.append(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        return np.frombuffer(self._maps[-1], dtype=RECORD_DTYPE, count=count)
+
+    def _release(self):
+        for view in self._maps:
+            view.close()
+        for file in self._files:
+            file.close()
+        self._maps, self._files = [], []
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def close(self):
+        # Drop the array first; a map can't close while it is exported
+        self.records = None
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Follows one segment as it grows, reading only the complete records (and id
+# lines) appended since the last read. Used to load a log and to fold in what
+# other workers append to theirs.
+class SegmentTail:
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.ids: List[str] = []
+        self.ids_offset = 0
+        self.records = 0
+        self.decisions = 0
+
+    def read(self) -> np.ndarray:
+        try:
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                end = size - size % RECORD.size
+                if end <= self.offset:
+                    return np.zeros(0, dtype=RECORD_DTYPE)
+                f.seek(self.offset)
+                data = f.read(end - self.offset)
+        except FileNotFoundError:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        data = data[:len(data) - len(data) % RECORD.size]
+        self.offset += len(data)
+        records = np.frombuffer(data, dtype=RECORD_DTYPE)
+        # Ids are written before the records that use them
+        ids, self.ids_offset = read_ids(self.path, self.ids_offset)
+        self.ids.extend(ids)
+        self.records += len(records)
+        if len(records):
+            self.decisions = int(records["seq"][-1]) + 1
+        return records
+
+
+# Records every optimization decision, one fixed-width record per allocation,
+# and keeps cashback and interest rollups per user x month x card x sector x
+# commit mode.
+#
+# The request thread only queues a tuple. A writer thread packs the queued
+# decisions, appends them to the file and folds them into the rollups, so the
+# rollups trail the request by at most one flush interval and a query is a
+# dictionary lookup however long the history is. Opening an existing log
+# replays it once, vectorised over the memory map.
+#
+# Every worker appends to a segment of its own, claimed with an exclusive
+# flock, and folds in the other segments as they grow (once per flush
+# interval), so every worker answers for the whole log.
+class DecisionLog:
+    def __init__(self, path: str = DECISION_LOG_PATH, flush_interval: float = DECISION_LOG_FLUSH_INTERVAL,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._ids: Dict[str, int] = {}
+        self._id_list: List[str] = []
+        # (user_id, month) -> {(card_id, sector index, commit index): [allocations, amount, cashback, interest]}
+        self._rollups: Dict[Tuple[str, int], Dict[Tuple[str, int, int], list]] = {}
+        self._rollup_lock = threading.Lock()
+        self._next_seq = 0
+        self.decisions = 0
+        self.records = 0
+        self.write_errors = 0
+        # This process's segment, and the other workers' segments being followed
+        self.segment: Optional[str] = None
+        self._tails: Dict[str, SegmentTail] = {}
+
+        self._file = None
+        self._ids_file = None
+        if path:
+            self._open(path)
+
+        self._pending_lock = threading.Lock()
+        self._pending: List[tuple] = []
+        # Serialises flushes so records land in sequence order
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._wake = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="decision-log-writer", daemon=True)
+        self._writer.start()
+
+    def _open(self, path: str):
+        index = 0
+        while True:
+            segment = segment_path(path, index)
+            handle = open(segment, "ab")
+            try:
+                # Held until closed (or the process exits): one writer per segment
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                handle.close()
+                index += 1
+        size = os.fstat(handle.fileno()).st_size
+        if size % RECORD.size:
+            # Drop a torn record left by a crash mid-append
+            handle.truncate(size - size % RECORD.size)
+        own = SegmentTail(segment)
+        records = own.read()
+        if os.path.exists(ids_path(segment)):
+            # ... and a torn id line
+            os.truncate(ids_path(segment), own.ids_offset)
+        self._id_list = own.ids
+        self._ids = {value: i for i, value in enumerate(own.ids)}
+        # Every decision takes a sequence number, including those that wrote
+        # no records (nothing allocated), so the last one gives the count
+        self._next_seq = self.decisions = own.decisions
+        self.records = own.records
+        self._load(records, own.ids)
+        self.segment = segment
+        self._file = handle
+        self._ids_file = open(ids_path(segment), "a")
+        self._follow()
+
+    def _follow(self):
+        # Fold in whatever the other workers appended since the last call
+        for segment in segment_paths(self.path):
+            if segment == self.segment:
+                continue
+            tail = self._tails.get(segment)
+            if tail is None:
+                tail = self._tails[segment] = SegmentTail(segment)
+            self._load(tail.read(), tail.ids)
+
+    def _load(self, records: np.ndarray, ids: List[str]):
+        if not len(records):
+            return
+        # Group by (user, card) and (month, sector, commit, status) packed into
+        # one int64 key: 1-D uniques sort far faster than row-wise ones
+        pair = records["user"].astype(np.uint64) << np.uint64(32) | records["card"]
+        pairs, pair_index = np.unique(pair, return_inverse=True)
+        tail = ((records["month"].astype(np.int64) * 8 + records["sector"]) * 4 + records["commit"]) * 2 + records["status"]
+        span = int(tail.max()) + 1
+        groups, inverse = np.unique(pair_index.ravel().astype(np.int64) * span + tail, return_inverse=True)
+        inverse = inverse.ravel()
+        sums = {field: np.bincount(inverse, weights=records[field], minlength=len(groups))
+                for field in ("utilised", "cashback", "interest_saved")}
+        counts = np.bincount(inverse, minlength=len(groups))
+        with self._rollup_lock:
+            for g, key in enumerate(groups.tolist()):
+                pair_key, tail_key = divmod(key, span)
+                rest, status = divmod(tail_key, 2)
+                rest, commit = divmod(rest, 4)
+                month, sector = divmod(rest, 8)
+                if STATUSES[status] != "success":
+                    continue
+                user, card = divmod(int(pairs[pair_key]), 1 << 32)
+                cell = self._rollups.setdefault((ids[user], month), {}).setdefault(
+                    (ids[card], sector, commit), [0, 0.0, 0.0, 0.0])
+                cell[0] += int(counts[g])
+                cell[1] += float(sums["utilised"][g])
+                cell[2] += float(sums["cashback"][g])
+                cell[3] += float(sums["interest_saved"][g])
+
+    # --- request path ---
+
+    def append(self, user_id: str, category: Sector, amount: float, status: str, commit_mode: CommitMode,
+               allocations: Iterable[Allocation]):
+        rows = [(a.card_id, a.amount_utilised, a.cashback_points - a.interest_saved, a.interest_saved)
+                for a in allocations]
+        entry = (user_id, self._clock(), _SECTOR_INDEX[category], _STATUS_INDEX[status],
+                 _COMMIT_INDEX[commit_mode], amount, rows)
+        with self._pending_lock:
+            self._pending.append(entry)
+
+    # --- writer thread ---
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if self._file is not None:
+                    self._follow()
+            except OSError:
+                self.write_errors += 1
+                logger.exception("Decision log append failed; will retry")
+
+    def _id(self, value: str, new_ids: List[str]) -> int:
+        index = self._ids.get(value)
+        if index is None:
+            index = self._ids[value] = len(self._id_list)
+            self._id_list.append(value)
+            new_ids.append(value)
+        return index
+
+    def flush(self):
+        with self._write_lock:
+            with self._pending_lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+            new_ids: List[str] = []
+            chunks = []
+            seq = self._next_seq
+            for user_id, created_at, sector, status, commit, amount, rows in batch:
+                user, month = self._id(user_id, new_ids), month_number(created_at)
+                for card_id, utilised, cashback, interest in rows:
+                    chunks.append(RECORD.pack(seq, created_at, month, user, self._id(card_id, new_ids),
+                                              sector, status, commit, amount, utilised, cashback, interest))
+                seq += 1
+            if self._file is not None:
+                try:
+                    # Ids first, so every record on disk can be resolved
+                    if new_ids:
+                        self._ids_file.write("".join(json.dumps(value) + "\n" for value in new_ids))
+                        self._ids_file.flush()
+                    self._file.write(b"".join(chunks))
+                    self._file.flush()
+                except OSError:
+                    with self._pending_lock:
+                        self._pending = batch + self._pending
+                    raise
+            self._next_seq = seq
+            self.decisions += len(batch)
+            self.records += len(chunks)
+            self._fold(batch)
+
+    def _fold(self, batch: List[tuple]):
+        with self._rollup_lock:
+            for user_id, created_at, sector, status, commit, amount, rows in batch:
+                if STATUSES[status] != "success":
+                    continue
+                cells = self._rollups.setdefault((user_id, month_number(created_at)), {})
+                for card_id, utilised, cashback, interest in rows:
+                    cell = cells.get((card_id, sector, commit))
+                    if cell is None:
+                        cell = cells[(card_id, sector, commit)] = [0, 0.0, 0.0, 0.0]
+                    cell[0] += 1
+                    cell[1] += utilised
+                    cell[2] += cashback
+                    cell[3] += interest
+
+    def close(self):
+        self._closed.set()
+        self._wake.set()
+        self._writer.join(timeout=5)
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._ids_file.close()
+
+    # --- queries ---
+
+    def rollup(self, user_id: str, month: str, card_id: Optional[str] = None, sector: Optional[Sector] = None,
+               commit_modes: Optional[Iterable[CommitMode]] = None) -> List[dict]:
+        # Successful decisions in `month` ("YYYY-MM", UTC) per card and sector,
+        # summed over the requested commit modes (default settled and
+        # reserved). Naming both a card and a sector is a fixed number of lookups.
+        year, number = month.split("-")
+        modes = {COMMIT_MODES.index(CommitMode(m)) for m in (commit_modes or COMMITTED)}
+        with self._rollup_lock:
+            cells = self._rollups.get((user_id, int(year) * 100 + int(number)), {})
+            if card_id is not None and sector is not None:
+                s = SECTORS.index(Sector(sector))
+                found = [((card_id, s, c), cells.get((card_id, s, c))) for c in modes]
+                matched = [(key, cell[:]) for key, cell in found if cell is not None]
+            else:
+                matched = [(key, cell[:]) for key, cell in cells.items()
+                           if key[2] in modes
+                           and (card_id is None or key[0] == card_id)
+                           and (sector is None or SECTORS[key[1]] == sector)]
+        merged: Dict[Tuple[str, int], list] = {}
+        for (card, s, _), cell in matched:
+            total = merged.setdefault((card, s), [0, 0.0, 0.0, 0.0])
+            for i, value in enumerate(cell):
+                total[i] += value
+        return [{"card_id": card, "sector": SECTORS[s], "allocations": cell[0], "amount": cell[1],
+                 "cashback": cell[2], "interest_saved": cell[3]}
+                for (card, s), cell in sorted(merged.items())]
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            pending = len(self._pending)
+        tails = list(self._tails.values())
+        return {
+            "path": self.path or None,
+            "segment": self.segment,
+            "segments": len(tails) + (self.segment is not None),
+            "decisions": self.decisions + sum(tail.decisions for tail in tails),
+            "records": self.records + sum(tail.records for tail in tails),
+            "pending": pending,
+            "write_errors": self.write_errors,
+        }
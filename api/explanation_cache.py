@@ -0,0 +1,132 @@
+import math
+import re
+import threading
+from typing import Dict, List, Optional
+
+from api.cache import TTLCache
+from api.models import Allocation, Sector
+
+# Amounts within the same ~25% band share a cache entry; the exact figures
+# are re-filled into the cached text on every hit.
+AMOUNT_BAND_RATIO = 1.25
+
+# Money-like numbers in an LLM reply: optional thousands separators and decimals
+_NUMBER_RE = re.compile(r"(?<![\w.,])\d+(?:,\d{3})*(?:\.\d+)?(?!\w)(?![.,]\d)")
+
+# Bare integers below this that don't match an allocation value ("3 accounts")
+# are treated as part of the prose rather than as amounts.
+_MAX_VERBATIM_INTEGER = 10
+
+
+def _amount_band(value: float) -> int:
+    if value <= 0:
+        return 0
+    return int(math.floor(math.log(value, AMOUNT_BAND_RATIO))) + 1
+
+
+def allocation_fingerprint(allocations: List[Allocation], total_amount: float, category: Sector, mode: str) -> tuple:
+    rows = tuple(
+        (a.card_id, a.cashback_sector is not None, _amount_band(a.amount_utilised))
+        for a in allocations
+    )
+    return (Sector(category).value, mode, _amount_band(total_amount), rows)
+
+
+def _slot_values(allocations: List[Allocation], total_amount: float) -> Dict[str, float]:
+    values = {"t": total_amount}
+    for i, a in enumerate(allocations):
+        values[f"a{i}"] = a.amount_utilised
+        values[f"s{i}"] = a.interest_saved
+        values[f"p{i}"] = a.cashback_points
+        # Cashback alone, without the interest component folded into the points
+        values[f"c{i}"] = a.cashback_points - a.interest_saved
+    return values
+
+
+def _render(value: float, decimals: int, grouped: bool) -> str:
+    return f"{value:,.{decimals}f}" if grouped else f"{value:.{decimals}f}"
+
+
+# A cached reply is stored as literal text segments interleaved with number
+# slots. Each slot lists every allocation value the original number matched,
+# plus how it was formatted, so the text can be re-rendered with new amounts.
+class ExplanationTemplate:
+    def __init__(self, parts: List[object]):
+        self.parts = parts
+
+    @classmethod
+    def from_text(cls, text: str, values: Dict[str, float]) -> Optional["ExplanationTemplate"]:
+        parts: List[object] = []
+        last = 0
+        for match in _NUMBER_RE.finditer(text):
+            token = match.group(0)
+            grouped = "," in token
+            decimals = len(token.split(".", 1)[1]) if "." in token else 0
+            number = float(token.replace(",", ""))
+            candidates = tuple(
+                name for name, value in values.items()
+                if _render(value, decimals, False) == _render(number, decimals, False)
+            )
+            is_percent = text[match.end():match.end() + 1] == "%"
+            if candidates and not is_percent:
+                parts.append(text[last:match.start()])
+                parts.append((candidates, decimals, grouped))
+                last = match.end()
+            elif is_percent or (decimals == 0 and number < _MAX_VERBATIM_INTEGER):
+                # Rates and small counts depend only on the fingerprinted cards
+                continue
+            else:
+                # A figure we can't trace back to the allocation would go stale
+                return None
+        parts.append(text[last:])
+        return cls(parts)
+
+    def fill(self, values: Dict[str, float]) -> Optional[str]:
+        out = []
+        for part in self.parts:
+            if isinstance(part, str):
+                out.append(part)
+                continue
+            candidates, decimals, grouped = part
+            rendered = {_render(values[name], decimals, grouped) for name in candidates if name in values}
+            if len(rendered) != 1:
+                # The slot was ambiguous and the new values disagree
+                return None
+            out.append(rendered.pop())
+        return "".join(out)
+
+
+class ExplanationCache:
+    def __init__(self, maxsize: int = 2048, ttl: float = 3600.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.uncacheable = 0
+        self.refill_failures = 0
+
+    def lookup(self, allocations: List[Allocation], total_amount: float, category: Sector, mode: str) -> Optional[str]:
+        template = self._cache.get(allocation_fingerprint(allocations, total_amount, category, mode))
+        if template is None:
+            return None
+        text = template.fill(_slot_values(allocations, total_amount))
+        if text is None:
+            with self._lock:
+                self.refill_failures += 1
+        return text
+
+    def store(self, allocations: List[Allocation], total_amount: float, category: Sector, mode: str, text: str) -> bool:
+        template = ExplanationTemplate.from_text(text, _slot_values(allocations, total_amount))
+        if template is None:
+            with self._lock:
+                self.uncacheable += 1
+            return False
+        self._cache.set(allocation_fingerprint(allocations, total_amount, category, mode), template)
+        return True
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, object]:
+        stats = self._cache.stats()
+        stats["uncacheable"] = self.uncacheable
+        stats["refill_failures"] = self.refill_failures
+        return stats
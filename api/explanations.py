@@ -0,0 +1,248 @@
+import asyncio
+import math
+import os
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from api.models import Allocation, Sector, ExplanationResponse, ExplanationStatus, ExplanationSource
+from api.explanation_cache import ExplanationCache
+from api.metrics import observe_stage, stage
+from api.prompts import build_explanation_prompt
+from api.template_explainer import template_explanation
+from llm.admission import AdmissionQueue, LoadShed, LLM_SHED_MODE, INTERACTIVE, DEFERRED
+from llm.async_client import AsyncLLMClient
+from llm.circuit_breaker import CircuitBreaker
+from llm.groq_api import groq_api_call
+
+# Default time an inline request waits for the LLM before falling back to the template
+EXPLANATION_BUDGET_MS = float(os.getenv("EXPLANATION_BUDGET_MS", "5000"))
+
+
+def generate_explanation(allocations: List[Allocation], total_amount: float, category: Sector, mode: str) -> str:
+    # Blocking LLM round-trip; callers on the event loop must go through ExplanationService
+    prompt = build_explanation_prompt(allocations, total_amount, category, mode)
+    try:
+        return groq_api_call(prompt)
+    except Exception:
+        return template_explanation(allocations, total_amount, category, mode)
+
+
+def _consume_exception(task: asyncio.Future):
+    # Failures are reported through get(); don't log them as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+# Produces explanations without ever blocking the event loop: completions
+# go through the shared AsyncLLMClient (pooled, concurrency-capped and
+# single-flight). Deferred jobs are kept in a bounded store so they can be
+# fetched later by id; the oldest jobs are dropped (and cancelled) once
+# `max_jobs` is reached.
+# Replies are cached by allocation fingerprint, so repeated shapes skip the LLM.
+#
+# Tail latency is bounded: when the LLM misses the request's latency budget,
+# fails, or the circuit breaker is open, the deterministic template explanation
+# is returned instead. A completion that overruns its budget keeps running in
+# the background so its reply still lands in the cache.
+#
+# Completions wait for a slot in the admission queue (interactive before
+# deferred, which is never shed). Interactive requests the queue sheds get the
+# template explanation; with shed_mode "reject", check_admission() lets
+# endpoints fail fast instead. Callers with the same prompt in flight share
+# one admission slot and one upstream call.
+class ExplanationService:
+    def __init__(self, llm: Optional[AsyncLLMClient] = None, max_jobs: int = 1000, cache: Optional[ExplanationCache] = None,
+                 breaker: Optional[CircuitBreaker] = None, default_budget_ms: Optional[float] = EXPLANATION_BUDGET_MS,
+                 admission: Optional[AdmissionQueue] = None, shed_mode: str = LLM_SHED_MODE):
+        self.llm = llm if llm is not None else AsyncLLMClient()
+        self.admission = admission if admission is not None else AdmissionQueue(concurrency=self.llm.max_inflight)
+        self.shed_mode = shed_mode
+        # Time to first token and total completion time go to the stage histograms
+        self.llm.on_timing = observe_stage
+        self.cache = cache if cache is not None else ExplanationCache()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.default_budget_ms = default_budget_ms
+        self._jobs: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self.max_jobs = max_jobs
+        # prompt -> [task, callers waiting on it, admitted]
+        self._inflight: Dict[str, list] = {}
+
+    def _budget_seconds(self, budget_ms: Optional[float]) -> Optional[float]:
+        budget_ms = self.default_budget_ms if budget_ms is None else budget_ms
+        if budget_ms is None or math.isinf(budget_ms):
+            return None
+        return max(budget_ms, 0.0) / 1000.0
+
+    def check_admission(self, priority: int = INTERACTIVE):
+        # Raises LoadShed when shedding is set to reject and the queue is full,
+        # so the endpoint can answer 503 before doing any work
+        if self.shed_mode == "reject" and self.admission.would_shed(priority):
+            self.admission.reject()
+
+    async def _complete(self, allocations: List[Allocation], total_amount: float, category: Sector, mode: str,
+                        priority: int = INTERACTIVE) -> str:
+        # Joins the in-flight completion for the same prompt, or starts one.
+        # The completion runs on while anyone waits for it; once the last
+        # caller gives up before it was admitted, it leaves the queue.
+        with stage("llm_prompt"):
+            prompt = build_explanation_prompt(allocations, total_amount, category, mode)
+        flight = self._inflight.get(prompt)
+        if flight is None:
+            flight = self._inflight[prompt] = [None, 0, False]
+            flight[0] = asyncio.ensure_future(self._call(flight, prompt, allocations, total_amount, category, mode,
+                                                         priority))
+            flight[0].add_done_callback(_consume_exception)
+            flight[0].add_done_callback(lambda _: self._inflight.pop(prompt, None))
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[2]:
+                flight[0].cancel()
+
+    async def _call(self, flight: list, prompt: str, allocations: List[Allocation], total_amount: float,
+                    category: Sector, mode: str, priority: int) -> str:
+        # The one place that reports the upstream outcome to the breaker
+        try:
+            await self.admission.acquire(priority)
+        except (LoadShed, asyncio.CancelledError):
+            # Never reached the upstream, so no verdict
+            self.breaker.release()
+            raise
+        flight[2] = True
+        try:
+            text = await self.llm.complete(prompt)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.admission.release()
+        self.breaker.record_success()
+        self.cache.store(allocations, total_amount, category, mode, text)
+        return text
+
+    async def explain(self, allocations: List[Allocation], total_amount: float, category: Sector, mode: str,
+                      budget_ms: Optional[float] = None, priority: int = INTERACTIVE) -> Tuple[str, ExplanationSource]:
+        cached = self.cache.lookup(allocations, total_amount, category, mode)
+        if cached is not None:
+            return cached, ExplanationSource.CACHE
+        if not self.breaker.allow():
+            return template_explanation(allocations, total_amount, category, mode), ExplanationSource.TEMPLATE
+
+        budget = self._budget_seconds(budget_ms)
+        try:
+            if budget is None:
+                # Nothing times this caller out; cancelling it (a dropped
+                # deferred job) gives up its place in the queue
+                text = await self._complete(allocations, total_amount, category, mode, priority)
+            else:
+                task = asyncio.ensure_future(self._complete(allocations, total_amount, category, mode, priority))
+                task.add_done_callback(_consume_exception)
+                text = await asyncio.wait_for(asyncio.shield(task), timeout=budget)
+        except Exception:
+            # Budget overrun (the completion carries on in the background), a
+            # shed request or an upstream error, which _complete has already reported
+            return template_explanation(allocations, total_amount, category, mode), ExplanationSource.TEMPLATE
+        return text, ExplanationSource.LLM
+
+    def submit(self, allocations: List[Allocation], total_amount: float, category: Sector, mode: str) -> str:
+        # Deferred jobs have no caller waiting, so only the breaker applies
+        explanation_id = uuid.uuid4().hex
+        task = asyncio.ensure_future(self.explain(allocations, total_amount, category, mode, budget_ms=math.inf,
+                                                  priority=DEFERRED))
+        task.add_done_callback(_consume_exception)
+        self._jobs[explanation_id] = task
+        while len(self._jobs) > self.max_jobs:
+            # Nobody can fetch a dropped job any more, so stop spending LLM capacity on it
+            _, dropped = self._jobs.popitem(last=False)
+            dropped.cancel()
+        return explanation_id
+
+    async def stream(self, allocations: List[Allocation], total_amount: float, category: Sector, mode: str,
+                     budget_ms: Optional[float] = None) -> AsyncIterator[str]:
+        # The budget applies to the first token; once tokens flow they are forwarded as-is
+        cached = self.cache.lookup(allocations, total_amount, category, mode)
+        if cached is not None:
+            yield cached
+            return
+        if not self.breaker.allow():
+            yield template_explanation(allocations, total_amount, category, mode)
+            return
+
+        with stage("llm_prompt"):
+            prompt = build_explanation_prompt(allocations, total_amount, category, mode)
+        try:
+            await self.admission.acquire(INTERACTIVE)
+        except LoadShed:
+            self.breaker.release()
+            yield template_explanation(allocations, total_amount, category, mode)
+            return
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        tokens = self.llm.stream(prompt)
+        # Whether the upstream answered; None (budget overrun, client gone)
+        # reports no verdict and just frees the breaker's trial slot
+        upstream_ok = None
+        try:
+            try:
+                first = await asyncio.wait_for(tokens.__anext__(), timeout=self._budget_seconds(budget_ms))
+            except StopAsyncIteration:
+                upstream_ok = True
+                return
+            except asyncio.TimeoutError:
+                await tokens.aclose()
+                yield template_explanation(allocations, total_amount, category, mode)
+                return
+            except Exception:
+                upstream_ok = False
+                await tokens.aclose()
+                yield template_explanation(allocations, total_amount, category, mode)
+                return
+            upstream_ok = True
+
+            received = [first]
+            yield first
+            try:
+                async for token in tokens:
+                    received.append(token)
+                    yield token
+            finally:
+                await tokens.aclose()
+            self.cache.store(allocations, total_amount, category, mode, "".join(received))
+        finally:
+            self.admission.release()
+            if upstream_ok is True:
+                self.breaker.record_success()
+            elif upstream_ok is False:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+
+    async def get(self, explanation_id: str, wait: float = 0.0) -> Optional[ExplanationResponse]:
+        task = self._jobs.get(explanation_id)
+        if task is None:
+            return None
+
+        if wait > 0 and not task.done():
+            await asyncio.wait({task}, timeout=wait)
+
+        if not task.done():
+            return ExplanationResponse(explanation_id=explanation_id, status=ExplanationStatus.PENDING)
+        if task.cancelled():
+            return ExplanationResponse(explanation_id=explanation_id, status=ExplanationStatus.FAILED, error="cancelled")
+        error = task.exception()
+        if error is not None:
+            return ExplanationResponse(explanation_id=explanation_id, status=ExplanationStatus.FAILED, error=str(error))
+        text, source = task.result()
+        return ExplanationResponse(explanation_id=explanation_id, status=ExplanationStatus.READY, explanation=text, source=source)
+
+    async def shutdown(self):
+        for task in self._jobs.values():
+            task.cancel()
+        await self.llm.aclose()
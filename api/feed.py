@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Callable, Dict, Optional, Set
+
+from api.registry import card_available_gbp
+from api.state import UserState
+
+# Changes are collected and published at most once per tick
+FEED_TICK = float(os.getenv("FEED_TICK_MS", "100")) / 1000
+
+# Messages a slow subscriber may fall behind by before it is resynced
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "64"))
+
+
+def card_fields(state: UserState, card_id: str) -> Optional[dict]:
+    card = state.registry.get(card_id)
+    if card is None:
+        return None
+    kind = state.registry.kind_of(card_id)
+    return {
+        "id": card.id,
+        "name": card.name,
+        "kind": kind,
+        "current_balance": card.current_balance,
+        "monthly_spend_limit": card.monthly_spend_limit,
+        "month_to_date_spend": card.month_to_date_spend,
+        "reserved": card.reserved,
+        "available_gbp": card_available_gbp(card, kind),
+    }
+
+
+def snapshot(state: UserState, seq: int) -> str:
+    cards = [card.id for card in (*state.debit_cards, *state.credit_cards, *state.international_cards)]
+    return json.dumps({
+        "type": "snapshot",
+        "seq": seq,
+        "cards": [card_fields(state, card_id) for card_id in cards],
+        "preferences": state.preferences.model_dump(mode="json"),
+        "totals": state.registry.totals(),
+    })
+
+
+# One serialized update, shared by every subscriber of the user; the SSE
+# framing is built once, on first use
+class FeedMessage:
+    __slots__ = ("text", "_sse")
+
+    def __init__(self, text: str):
+        self.text = text
+        self._sse: Optional[str] = None
+
+    @property
+    def sse(self) -> str:
+        if self._sse is None:
+            self._sse = f"event: change\ndata: {self.text}\n\n"
+        return self._sse
+
+
+# Per-user change feed for the dashboards.
+#
+# UserState.on_change only marks what changed (card ids, preferences). Once
+# per tick the feed turns each user's marks into one delta, with the changed
+# cards' current values, removed card ids, the preferences when they changed
+# and the new totals, serializes it once and hands the same message to every
+# subscriber's queue. Many changes in a tick cost one message, and N
+# subscribers cost N queue puts rather than N serializations.
+#
+# A subscriber that falls FEED_QUEUE_SIZE messages behind is dropped back to a
+# fresh snapshot instead of buffering without bound.
+#
+# With several workers, changes made by another worker never pass through this
+# worker's on_change hooks. Each tick the feed therefore asks `stale` whether a
+# watched user changed elsewhere and, if so, loads it again through `reload`
+# (in a thread, as that reads the database) and publishes it in full.
+class ChangeFeed:
+    def __init__(self, lookup: Callable[[str], Optional[UserState]], tick: float = FEED_TICK,
+                 queue_size: int = FEED_QUEUE_SIZE):
+        self._lookup = lookup
+        self.tick = tick
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # user_id -> (changed card ids, preferences changed)
+        self._dirty: Dict[str, list] = {}
+        self._subscribers: Dict[str, Set["Subscription"]] = {}
+        self._seq: Dict[str, int] = {}
+        self._loop = None
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+        self.resyncs = 0
+        # Optional hooks (multi-worker mode): stale(user_id) is a cheap check
+        # whether another worker changed the user, reload(user_id) loads it again
+        self.stale: Optional[Callable[[str], bool]] = None
+        self.reload: Optional[Callable[[str], UserState]] = None
+
+    def mark(self, user_id: str, card_id: Optional[str]):
+        # UserState.on_change hook; unwatched users cost a dict lookup
+        if user_id not in self._subscribers:
+            return
+        with self._lock:
+            entry = self._dirty.get(user_id)
+            if entry is None:
+                entry = self._dirty[user_id] = [set(), False]
+            if card_id is None:
+                entry[1] = True
+            else:
+                entry[0].add(card_id)
+
+    def attach(self, state: UserState) -> UserState:
+        # Called for every state a request uses; a watched user whose state was
+        # reloaded (changed by another worker) gets a full update
+        if state.on_change is None:
+            state.on_change = self.mark
+            if state.user_id in self._subscribers:
+                for card in (*state.debit_cards, *state.credit_cards, *state.international_cards):
+                    self.mark(state.user_id, card.id)
+                self.mark(state.user_id, None)
+        return state
+
+    def subscribe(self, user_id: str) -> "Subscription":
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._subscribers = {}
+            self._task = None
+        subscription = Subscription(self, user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return subscription
+
+    def _unsubscribe(self, subscription: "Subscription"):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def snapshot(self, user_id: str) -> Optional[str]:
+        state = self._lookup(user_id)
+        return None if state is None else snapshot(state, self._seq.get(user_id, 0))
+
+    async def _run(self):
+        while self._subscribers:
+            await asyncio.sleep(self.tick)
+            if self.stale is not None:
+                for user_id in [user_id for user_id in list(self._subscribers) if self.stale(user_id)]:
+                    self.attach(await asyncio.to_thread(self.reload, user_id))
+            self.publish()
+
+    def publish(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        for user_id, (card_ids, preferences_changed) in dirty.items():
+            subscribers = self._subscribers.get(user_id)
+            state = self._lookup(user_id)
+            if not subscribers or state is None:
+                continue
+            seq = self._seq[user_id] = self._seq.get(user_id, 0) + 1
+            delta = {"type": "delta", "seq": seq, "cards": [], "removed": []}
+            for card_id in sorted(card_ids):
+                fields = card_fields(state, card_id)
+                if fields is None:
+                    delta["removed"].append(card_id)
+                else:
+                    delta["cards"].append(fields)
+            if preferences_changed:
+                delta["preferences"] = state.preferences.model_dump(mode="json")
+            delta["totals"] = state.registry.totals()
+            message = FeedMessage(json.dumps(delta))
+            self.published += 1
+            for subscription in list(subscribers):
+                subscription.push(message)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "resyncs": self.resyncs,
+        }
+
+
+class Subscription:
+    def __init__(self, feed: ChangeFeed, user_id: str):
+        self.feed = feed
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=feed.queue_size)
+        # Set when messages were dropped; the next get() returns a snapshot
+        self.resync = False
+
+    def push(self, message: FeedMessage):
+        try:
+            self.queue.put_nowait(message)
+            self.feed.delivered += 1
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resync = True
+            self.feed.resyncs += 1
+            # Wake a waiting get()
+            self.queue.put_nowait(None)
+
+    async def get(self) -> Optional[str]:
+        # The next message text; None if the user is no longer resident
+        message = await self.queue.get()
+        if message is None or self.resync:
+            self.resync = False
+            return self.feed.snapshot(self.user_id)
+        return message.text
+
+    async def get_sse(self) -> Optional[str]:
+        message = await self.queue.get()
+        if message is None or self.resync:
+            self.resync = False
+            text = self.feed.snapshot(self.user_id)
+            return None if text is None else FeedMessage(text).sse
+        return message.sse
+
+    def close(self):
+        self.feed._unsubscribe(self)
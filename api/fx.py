@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# JSON file of {"INR": 122.5, "USD": 1.27, ...} (units of currency per GBP);
+# unset keeps every card's own gbp_conversion
+FX_RATES_PATH = os.getenv("FX_RATES_PATH", "")
+# Rates older than this are refreshed in the background
+FX_RATE_TTL = float(os.getenv("FX_RATE_TTL", "3600"))
+
+# Returns currency -> units per GBP; may raise, in which case the old rates stay
+RateProvider = Callable[[], Dict[str, float]]
+
+
+class StaticRateProvider:
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = dict(rates)
+
+    def __call__(self) -> Dict[str, float]:
+        return dict(self.rates)
+
+
+class FileRateProvider:
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self) -> Dict[str, float]:
+        with open(self.path) as f:
+            return {currency.upper(): float(rate) for currency, rate in json.load(f).items()}
+
+
+def provider_from_env() -> Optional[RateProvider]:
+    return FileRateProvider(FX_RATES_PATH) if FX_RATES_PATH else None
+
+
+# Current FX rates for every currency, as a read-only mapping swapped whole on
+# each refresh, so readers never take a lock.
+#
+# Nothing on the request path waits for the provider: `refresh_if_stale` only
+# starts a background refresh (at most one at a time) once the rates are older
+# than `ttl`, and requests keep using the last good rates meanwhile. A failed
+# refresh keeps them too and is retried after another `ttl`. `version` changes
+# whenever a rate does, which is what per-user states compare against.
+class FxRateTable:
+    def __init__(self, provider: Optional[RateProvider] = None, ttl: float = FX_RATE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.provider = provider
+        self.ttl = ttl
+        self._clock = clock
+        self._rates: Mapping[str, float] = MappingProxyType({})
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._checked_at: Optional[float] = None
+        self.fetched_at: Optional[float] = None
+        self.version = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def rates(self) -> Mapping[str, float]:
+        return self._rates
+
+    def rate(self, currency: str) -> Optional[float]:
+        return self._rates.get(currency)
+
+    @property
+    def stale(self) -> bool:
+        return self._checked_at is None or self._clock() - self._checked_at >= self.ttl
+
+    def refresh(self) -> bool:
+        # Fetch synchronously; returns whether any rate changed
+        if self.provider is None:
+            return False
+        try:
+            fetched = {currency: rate for currency, rate in self.provider().items() if rate > 0}
+        except Exception as exc:
+            logger.warning("FX rate refresh failed: %s", exc)
+            with self._lock:
+                self.failures += 1
+                self.last_error = str(exc)
+                self._checked_at = self._clock()
+            return False
+        with self._lock:
+            rates = dict(self._rates)
+            changed = any(rates.get(currency) != rate for currency, rate in fetched.items())
+            rates.update(fetched)
+            self._rates = MappingProxyType(rates)
+            self.fetched_at = self._checked_at = self._clock()
+            self.refreshes += 1
+            self.last_error = None
+            if changed:
+                self.version += 1
+        return changed
+
+    def refresh_if_stale(self):
+        if self.provider is None or not self.stale:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="fx-refresh", daemon=True).start()
+
+    def stats(self) -> dict:
+        age = None if self.fetched_at is None else self._clock() - self.fetched_at
+        return {
+            "rates": dict(self._rates),
+            "version": self.version,
+            "age_seconds": age,
+            "stale": self.stale,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
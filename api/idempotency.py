@@ -0,0 +1,85 @@
+import asyncio
+import os
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from api.cache import TTLCache
+
+# How long a completed response is replayed for its Idempotency-Key
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+# Most completed responses kept; the least recently used are dropped first
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+T = TypeVar("T")
+
+
+class IdempotencyConflict(Exception):
+    # The key was already used for a different request
+    pass
+
+
+# Runs each (scope, Idempotency-Key) once. The first successful result is kept
+# in a bounded TTL cache and handed back to retries; duplicates that arrive
+# while it is still computing await the same task (single-flight) instead of
+# starting their own. The task is shielded, so a client that disconnects
+# mid-request doesn't lose a commit its retry should get back. Failures are
+# not stored, so a retry after an error runs again.
+#
+# Each key is bound to a fingerprint of the request; reusing it for a
+# different request raises IdempotencyConflict rather than replaying.
+class IdempotencyStore:
+    def __init__(self, maxsize: int = IDEMPOTENCY_MAX_KEYS, ttl: float = IDEMPOTENCY_TTL):
+        self._results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[Hashable, Tuple[Hashable, asyncio.Task]] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.replayed = 0
+        self.coalesced = 0
+        self.conflicts = 0
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    async def run(self, key: Hashable, fingerprint: Hashable, compute: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        # Returns (result, replayed); replayed is False only for the caller
+        # whose request actually ran
+        stored = self._results.get(key)
+        if stored is not None:
+            stored_fingerprint, result = stored
+            if stored_fingerprint != fingerprint:
+                self._count("conflicts")
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+            self._count("replayed")
+            return result, True
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            inflight_fingerprint, task = inflight
+            if inflight_fingerprint != fingerprint:
+                self._count("conflicts")
+                raise IdempotencyConflict("Idempotency-Key is in use by a different request")
+            self._count("coalesced")
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = (fingerprint, task)
+        self._count("executed")
+
+        def done(finished: asyncio.Task):
+            self._inflight.pop(key, None)
+            if not finished.cancelled() and finished.exception() is None:
+                self._results.set(key, (fingerprint, finished.result()))
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task), False
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self) -> Dict[str, object]:
+        stats = self._results.stats()
+        stats.update(inflight=len(self._inflight), executed=self.executed, replayed=self.replayed,
+                     coalesced=self.coalesced, conflicts=self.conflicts)
+        return stats
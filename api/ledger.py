@@ -0,0 +1,257 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from api.cache import TTLCache
+from api.models import Allocation, HoldStatus
+from api.ranking import INTERNATIONAL
+from api.registry import CardRegistry, card_available_gbp
+
+# Authorisations that never settle are released after this many seconds
+HOLD_TTL = float(os.getenv("LEDGER_HOLD_TTL", str(7 * 24 * 3600)))
+
+# Settled/released holds stay queryable for a day
+CLOSED_HOLD_TTL = 24 * 3600.0
+
+# Allocations are computed without locks and re-checked against the card under
+# its lock; this much float slack is allowed in that check
+TOLERANCE = 1e-9
+
+
+class LedgerConflict(Exception):
+    # A card's headroom was taken by a concurrent commit between optimizing and
+    # reserving; the caller re-optimizes against the new state and retries
+    pass
+
+
+class HoldClosed(Exception):
+    def __init__(self, status: HoldStatus):
+        super().__init__(f"Hold already {status.value}")
+        self.status = status
+
+
+class Hold:
+    __slots__ = ("hold_id", "amounts", "created_at", "status")
+
+    def __init__(self, hold_id: str, amounts: Dict[str, float], created_at: float):
+        self.hold_id = hold_id
+        # card_id -> amount held, in the card's own currency
+        self.amounts = amounts
+        self.created_at = created_at
+        self.status = HoldStatus.RESERVED
+
+
+def month_key(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m")
+
+
+# Month-to-date spend and open authorisation holds per card.
+#
+# Optimization runs lock-free against a snapshot of the cards; committing then
+# re-checks each allocated card under that card's own lock (taken in card id
+# order, so concurrent commits can't deadlock) and either reserves all of it or
+# raises LedgerConflict. Commits touching different cards never contend.
+# Settling moves a hold into month-to-date spend and debits the balance;
+# releasing (or expiry after HOLD_TTL) just drops it. Month-to-date spend resets
+# on the first ledger operation of a new calendar month (UTC).
+class SpendLedger:
+    def __init__(self, registry: CardRegistry, hold_ttl: float = HOLD_TTL, clock: Callable[[], float] = time.time,
+                 month: Optional[str] = None):
+        self.registry = registry
+        self.hold_ttl = hold_ttl
+        self._clock = clock
+        self._card_locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        # Open holds in creation order, so expiry only looks at the oldest
+        self._holds: Dict[str, Hold] = {}
+        self._holds_lock = threading.Lock()
+        # Settled and released holds; created on the first close
+        self._closed: Optional[TTLCache] = None
+        self._rollover_lock = threading.Lock()
+        # Month the stored month-to-date spend belongs to
+        self.month = month or month_key(clock())
+        self.conflicts = 0
+        # Optional persistence hooks: on_hold(hold) when a hold opens or closes,
+        # on_rollover(month) after month-to-date spend was reset
+        self.on_hold: Optional[Callable[[Hold], None]] = None
+        self.on_rollover: Optional[Callable[[str], None]] = None
+
+    def _lock_for(self, card_id: str) -> threading.Lock:
+        lock = self._card_locks.get(card_id)
+        if lock is None:
+            with self._locks_lock:
+                lock = self._card_locks.setdefault(card_id, threading.Lock())
+        return lock
+
+    def _acquire(self, card_ids: List[str]) -> List[threading.Lock]:
+        locks = [self._lock_for(card_id) for card_id in sorted(card_ids)]
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    def refresh(self):
+        # Apply any due month rollover and hold expiry. Call before reading card
+        # availability, since optimizing reads the cards directly.
+        self._housekeep()
+
+    def due(self) -> bool:
+        # True when refresh() would roll the month over or expire a hold
+        now = self._clock()
+        if month_key(now) != self.month:
+            return True
+        with self._holds_lock:
+            oldest = next(iter(self._holds.values()), None)
+        return oldest is not None and now - oldest.created_at >= self.hold_ttl
+
+    def _housekeep(self):
+        now = self._clock()
+        month = month_key(now)
+        if month != self.month:
+            self._rollover(month)
+        self._expire(now)
+
+    def _rollover(self, month: str):
+        with self._rollover_lock:
+            if month == self.month:
+                return
+            for lists in (self.registry.debit_cards, self.registry.credit_cards, self.registry.international_cards):
+                for card in list(lists):
+                    with self._lock_for(card.id):
+                        self.registry.update_spend(card.id, card.current_balance, 0.0, card.reserved)
+            self.month = month
+        if self.on_rollover is not None:
+            self.on_rollover(month)
+
+    def _expire(self, now: float):
+        expired = []
+        with self._holds_lock:
+            for hold_id, hold in self._holds.items():
+                if now - hold.created_at < self.hold_ttl:
+                    break
+                expired.append(hold)
+            for hold in expired:
+                del self._holds[hold.hold_id]
+        for hold in expired:
+            self._close(hold, HoldStatus.EXPIRED)
+
+    def _local_amount(self, card_id: str, amount_gbp: float) -> float:
+        if self.registry.kind_of(card_id) == INTERNATIONAL:
+            return amount_gbp * self.registry.get(card_id).gbp_conversion
+        return amount_gbp
+
+    def reserve(self, allocations: List[Allocation]) -> Hold:
+        self._housekeep()
+        needed: Dict[str, float] = {}
+        for a in allocations:
+            needed[a.card_id] = needed.get(a.card_id, 0.0) + a.amount_utilised
+
+        locks = self._acquire(list(needed))
+        try:
+            for card_id, amount in needed.items():
+                card = self.registry.get(card_id)
+                if card is None or card_available_gbp(card, self.registry.kind_of(card_id)) < amount - TOLERANCE:
+                    self.conflicts += 1
+                    raise LedgerConflict(card_id)
+            amounts = {}
+            for card_id, amount in needed.items():
+                card = self.registry.get(card_id)
+                amounts[card_id] = self._local_amount(card_id, amount)
+                self.registry.update_spend(card_id, card.current_balance, card.month_to_date_spend,
+                                           card.reserved + amounts[card_id])
+        finally:
+            for lock in locks:
+                lock.release()
+
+        hold = Hold(uuid.uuid4().hex, amounts, self._clock())
+        with self._holds_lock:
+            self._holds[hold.hold_id] = hold
+        if self.on_hold is not None:
+            self.on_hold(hold)
+        return hold
+
+    def restore(self, hold_id: str, amounts: Dict[str, float], created_at: float):
+        # Re-open a persisted hold; its amounts are already in the cards' reserved
+        hold = Hold(hold_id, amounts, created_at)
+        with self._holds_lock:
+            self._holds[hold_id] = hold
+
+    def _take(self, hold_id: str) -> Optional[Hold]:
+        with self._holds_lock:
+            hold = self._holds.pop(hold_id, None)
+        if hold is None:
+            closed = self._closed.get(hold_id) if self._closed is not None else None
+            if closed is not None:
+                raise HoldClosed(closed.status)
+        return hold
+
+    def _close(self, hold: Hold, status: HoldStatus):
+        locks = self._acquire(list(hold.amounts))
+        try:
+            for card_id, amount in hold.amounts.items():
+                card = self.registry.get(card_id)
+                if card is None:
+                    continue
+                reserved = max(card.reserved - amount, 0.0)
+                if status == HoldStatus.SETTLED:
+                    self.registry.update_spend(card_id, card.current_balance - amount,
+                                               card.month_to_date_spend + amount, reserved)
+                else:
+                    self.registry.update_spend(card_id, card.current_balance, card.month_to_date_spend, reserved)
+        finally:
+            for lock in locks:
+                lock.release()
+        hold.status = status
+        if self._closed is None:
+            with self._holds_lock:
+                if self._closed is None:
+                    self._closed = TTLCache(maxsize=10000, ttl=CLOSED_HOLD_TTL)
+        self._closed.set(hold.hold_id, hold)
+        if self.on_hold is not None:
+            self.on_hold(hold)
+
+    def settle(self, hold_id: str) -> Optional[Hold]:
+        self._housekeep()
+        hold = self._take(hold_id)
+        if hold is not None:
+            self._close(hold, HoldStatus.SETTLED)
+        return hold
+
+    def release(self, hold_id: str) -> Optional[Hold]:
+        self._housekeep()
+        hold = self._take(hold_id)
+        if hold is not None:
+            self._close(hold, HoldStatus.RELEASED)
+        return hold
+
+    def get(self, hold_id: str) -> Optional[Hold]:
+        self._housekeep()
+        with self._holds_lock:
+            hold = self._holds.get(hold_id)
+        if hold is None and self._closed is not None:
+            hold = self._closed.get(hold_id)
+        return hold
+
+    def commit(self, allocations: List[Allocation]) -> Hold:
+        # Reserve and settle in one step, for payments that clear immediately
+        hold = self.reserve(allocations)
+        self.settle(hold.hold_id)
+        return hold
+
+    def snapshot(self) -> dict:
+        self._housekeep()
+        cards = []
+        for lists in (self.registry.debit_cards, self.registry.credit_cards, self.registry.international_cards):
+            for card in lists:
+                cards.append({
+                    "card_id": card.id,
+                    "month_to_date_spend": card.month_to_date_spend,
+                    "reserved": card.reserved,
+                    "monthly_spend_limit": card.monthly_spend_limit,
+                    "remaining_limit": card.monthly_spend_limit - card.month_to_date_spend - card.reserved,
+                })
+        with self._holds_lock:
+            open_holds = len(self._holds)
+        return {"month": self.month, "cards": cards, "open_holds": open_holds, "conflicts": self.conflicts}
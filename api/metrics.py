@@ -0,0 +1,166 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Upper bounds (seconds) of the latency buckets, Prometheus style (+Inf implied)
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Cumulative-bucket histogram with one series per label value, rendered in the
+# Prometheus text exposition format. Observing is a bisect and three adds
+# under one lock.
+class Histogram:
+    def __init__(self, name: str, help: str, label: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # [per-bucket counts (last is +Inf), sum, count]
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def count(self, label_value: str) -> int:
+        with self._lock:
+            series = self._series.get(label_value)
+            return series[2] if series else 0
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(value, list(s[0]), s[1], s[2]) for value, s in sorted(self._series.items())]
+        for value, counts, total, count in snapshot:
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total!r}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram("optivault_stage_seconds", "Time spent in each hot-path stage.", "stage")
+request_seconds = Histogram("optivault_request_seconds", "Time to produce each API response.", "route")
+
+# Stage durations of the request being handled: name -> seconds. Set by
+# TimedRoute; tasks started during the request (e.g. LLM completions) inherit it.
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+# When the endpoint function started and returned, for the validation/serialization split
+_endpoint_marks: ContextVar[Optional[Dict[str, float]]] = ContextVar("endpoint_marks", default=None)
+
+
+def observe_stage(name: str, seconds: float):
+    stage_seconds.observe(name, seconds)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+def server_timing(stages: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in stages.items())
+
+
+def render_metrics() -> str:
+    return stage_seconds.render() + request_seconds.render()
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    # functools.wraps keeps the signature FastAPI reads parameters from
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            marks = _endpoint_marks.get()
+            if marks is not None:
+                marks["start"] = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                if marks is not None:
+                    marks["end"] = time.perf_counter()
+    else:
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            marks = _endpoint_marks.get()
+            if marks is not None:
+                marks["start"] = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                if marks is not None:
+                    marks["end"] = time.perf_counter()
+    return timed
+
+
+# Route class that times every request and reports its stages in a
+# Server-Timing header (milliseconds) as well as in the histograms.
+#
+# The endpoint itself is wrapped, so the handler's time splits into
+# `validation` (body parsing, validation and dependencies such as loading the
+# user), the endpoint's own stages, and `serialization` (response model
+# validation and JSON encoding). Streaming responses send their headers before
+# the body, so stages inside the stream only reach the histograms.
+class TimedRoute(APIRoute):
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def timed_handler(request: Request) -> Response:
+            stages: Dict[str, float] = {}
+            marks: Dict[str, float] = {}
+            stages_token = _request_stages.set(stages)
+            marks_token = _endpoint_marks.set(marks)
+            started = time.perf_counter()
+            try:
+                response = await handler(request)
+            finally:
+                finished = time.perf_counter()
+                _request_stages.reset(stages_token)
+                _endpoint_marks.reset(marks_token)
+            request_seconds.observe(route, finished - started)
+            if "end" in marks:
+                for name, seconds in (("validation", marks["start"] - started),
+                                      ("serialization", finished - marks["end"])):
+                    stage_seconds.observe(name, seconds)
+                    stages[name] = seconds
+            stages["total"] = finished - started
+            response.headers["Server-Timing"] = server_timing(stages)
+            return response
+
+        return timed_handler
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
 from enum import Enum
+from datetime import date
 
 
 class CardType(str, Enum):
@@ -23,12 +24,34 @@ class OptimizationMode(str, Enum):
     INTEREST_ONLY = "interest_only"
 
 
+class ExplanationMode(str, Enum):
+    INLINE = "inline"
+    DEFERRED = "deferred"
+    NONE = "none"
+
+
+class ExplanationSource(str, Enum):
+    LLM = "llm"
+    CACHE = "cache"
+    TEMPLATE = "template"
+
+
+class ExplanationStatus(str, Enum):
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
+
 class CardBase(BaseModel):
     id: str
     name: str
     type: CardType
     monthly_spend_limit: float
     current_balance: float
+    # Maintained by the spend ledger: settled spend this month and amounts
+    # held for authorisations that have not settled yet (card currency)
+    month_to_date_spend: float = 0.0
+    reserved: float = 0.0
 
 
 class DebitCard(CardBase):
@@ -42,6 +65,8 @@ class CreditCard(CardBase):
 class InternationalCard(CardBase):
     markup_rate: float  # e.g., 0.06 for 6%
     gbp_conversion: float  # 122.5 (1 GBP = 122.5 INR)
+    # ISO code of the card's currency; when set, gbp_conversion follows the FX rate table
+    currency: Optional[str] = None
 
 
 class UserPreferences(BaseModel):
@@ -51,6 +76,9 @@ class UserPreferences(BaseModel):
 class TransactionRequest(BaseModel):
     amount: float
     category: Sector
+    # How long the caller will wait for an LLM explanation before the
+    # template explanation is used instead; None uses the server default
+    latency_budget_ms: Optional[float] = None
 
 
 class Allocation(BaseModel):
@@ -62,12 +90,170 @@ class Allocation(BaseModel):
     cashback_sector: Optional[Sector] = None
 
 
+class StrategyImpact(BaseModel):
+    strategy: str
+    # Total debit balance and net value (interest earned + cashback - fees)
+    # at the statement date and at the end of the horizon
+    eom_balance: float
+    eom_value: float
+    horizon_balance: float
+    horizon_value: float
+    cashback: float
+    fees: float
+
+
+# The optimized allocation against paying from the primary account, in the
+# shape the simulator screen reads
+class EomImpact(BaseModel):
+    horizon_days: int
+    # Days from today until the statement closes at month end
+    eom_day: int
+    total_cashback_earned: float
+    total_interest_saved: float
+    total_interest_opportunity_lost: float
+    total_fx_costs: float
+    net_eom_benefit: float
+    net_horizon_benefit: float
+    strategies: List[StrategyImpact]
+
+
 class TransactionResponse(BaseModel):
     allocations: List[Allocation]
     explanation: Optional[str] = None
+    explanation_id: Optional[str] = None
+    explanation_source: Optional[ExplanationSource] = None
+    # Set when the allocation was reserved on the spend ledger (commit=reserve)
+    hold_id: Optional[str] = None
     total_amount: float
     status: str = "success"
+    eom_impact: Optional[EomImpact] = None
+
+
+class CommitMode(str, Enum):
+    NONE = "none"
+    RESERVE = "reserve"
+    SETTLE = "settle"
+
+
+class HoldStatus(str, Enum):
+    RESERVED = "reserved"
+    SETTLED = "settled"
+    RELEASED = "released"
+    EXPIRED = "expired"
+
+
+class HoldResponse(BaseModel):
+    hold_id: str
+    status: HoldStatus
+    # card_id -> amount held, in the card's own currency
+    amounts: Dict[str, float]
+
+
+class CardLedgerEntry(BaseModel):
+    card_id: str
+    month_to_date_spend: float
+    reserved: float
+    monthly_spend_limit: float
+    remaining_limit: float
+
+
+class LedgerResponse(BaseModel):
+    month: str
+    cards: List[CardLedgerEntry]
+    open_holds: int
+    conflicts: int
+
 
+class BatchOptimizeResponse(BaseModel):
+    results: List[TransactionResponse]
+    succeeded: int
+    insufficient_funds: int
+
+
+# Largest grid the what-if endpoint will evaluate in one call
+MAX_WHAT_IF_POINTS = 5000
+
+
+class WhatIfRequest(BaseModel):
+    category: Sector
+    # Either explicit amounts, or an evenly spaced grid from start to stop
+    amounts: Optional[List[float]] = Field(None, max_length=MAX_WHAT_IF_POINTS)
+    start: float = 0.0
+    stop: Optional[float] = None
+    points: int = Field(100, gt=0, le=MAX_WHAT_IF_POINTS)
+
+
+class WhatIfSeries(BaseModel):
+    card_id: str
+    card_name: str
+    amounts: List[float]
+
+
+class WhatIfResponse(BaseModel):
+    category: Sector
+    mode: str
+    amounts: List[float]
+    breakpoints: List[float]
+    series: List[WhatIfSeries]
+    cashback_points: List[float]
+    interest_saved: List[float]
+    covered: List[bool]
+
+
+# Most purchases one plan request may queue
+MAX_PLANNED_PURCHASES = 1000
+
+
+class PlannedPurchase(BaseModel):
+    amount: float = Field(gt=0)
+    category: Sector
+    date: date
+
+
+class PlanRequest(BaseModel):
+    purchases: List[PlannedPurchase] = Field(max_length=MAX_PLANNED_PURCHASES)
+
+
+class PlannedTransaction(BaseModel):
+    date: date
+    category: Sector
+    amount: float
+    allocations: List[Allocation]
+    # Part of the amount no card could take
+    shortfall: float = 0.0
+    status: str = "success"
+
+
+class PlanResponse(BaseModel):
+    purchases: List[PlannedTransaction]
+    total_cashback: float
+    total_interest_saved: float
+    # Cashback plus interest saved, the quantity the plan maximises
+    total_value: float
+    # What committing the purchases one by one through the optimizer would earn
+    greedy_value: float
+    unfunded: int
+
+
+class ProjectionSeries(BaseModel):
+    strategy: str
+    # One value per day, day 0 being today
+    debit_balance: List[float]
+    value: List[float]
+
+
+class ProjectionResponse(BaseModel):
+    horizon_days: int
+    eom_day: int
+    series: List[ProjectionSeries]
+
+
+class ExplanationResponse(BaseModel):
+    explanation_id: str
+    status: ExplanationStatus
+    explanation: Optional[str] = None
+    source: Optional[ExplanationSource] = None
+    error: Optional[str] = None
 
 
 class UpdateLimitRequest(BaseModel):
@@ -79,3 +265,152 @@ class TotalBalanceResponse(BaseModel):
     total_debit_balance: float
     total_credit_balance: float
     total_gbp_balance: float
+    # Spendable now: min(monthly limit, balance) per card, international converted to GBP
+    total_debit_available: float = 0.0
+    total_credit_available: float = 0.0
+    total_international_available_gbp: float = 0.0
+
+
+class StateStoreStats(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    loads: int
+    evictions: int
+
+
+class IdempotencyStats(BaseModel):
+    size: int
+    maxsize: int
+    ttl_seconds: float
+    inflight: int
+    # Requests that ran, retries answered from the store, duplicates that
+    # waited on an in-flight request, and keys reused for another request
+    executed: int
+    replayed: int
+    coalesced: int
+    conflicts: int
+    evictions: int
+    expirations: int
+
+
+class FxRatesResponse(BaseModel):
+    # Units of each currency per GBP
+    rates: Dict[str, float]
+    version: int
+    age_seconds: Optional[float] = None
+    stale: bool
+    refreshes: int
+    failures: int
+    last_error: Optional[str] = None
+
+
+class ExplanationCacheStats(BaseModel):
+    size: int
+    maxsize: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    hit_rate: float
+    uncacheable: int
+    refill_failures: int
+
+
+class AdmissionStats(BaseModel):
+    concurrency: int
+    running: int
+    depth: int
+    max_depth: int
+    # Deferred jobs waiting in their own, unbounded lane
+    deferred: int
+    max_wait_seconds: float
+    admitted: int
+    queued: int
+    # Shed interactive requests by reason: queue_full, queue_timeout and
+    # rejected (503 in reject mode)
+    shed: Dict[str, int]
+
+
+class FeedStats(BaseModel):
+    users: int
+    subscribers: int
+    # Deltas built (one per user per tick with changes) and queued to subscribers
+    published: int
+    delivered: int
+    resyncs: int
+
+
+class TokenUsageRecord(BaseModel):
+    prompt_tokens: int
+    completion_tokens: int
+    estimated: bool = False
+
+
+class TokenUsageStats(BaseModel):
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    avg_prompt_tokens: float
+    avg_completion_tokens: float
+    estimated_calls: int
+    recent: List[TokenUsageRecord]
+
+
+class CardOverride(BaseModel):
+    monthly_spend_limit: Optional[float] = None
+    current_balance: Optional[float] = None
+
+
+# A what-if variant of a portfolio for transaction replay: other
+# preferences and/or other limits and balances on named cards
+class ReplayScenario(BaseModel):
+    preferences: Optional[UserPreferences] = None
+    cards: Dict[str, CardOverride] = {}
+
+
+class ScenarioTotals(BaseModel):
+    transactions: int = 0
+    amount: float = 0.0
+    cashback: float = 0.0
+    interest_saved: float = 0.0
+    # Transactions the portfolio could not fully fund, and the unfunded total
+    shortfalls: int = 0
+    shortfall_amount: float = 0.0
+
+
+class ReplayReport(BaseModel):
+    lines: int
+    invalid: int
+    scenarios: Dict[str, ScenarioTotals]
+
+
+class DecisionRollup(BaseModel):
+    card_id: str
+    sector: Sector
+    # Allocations to this card in the sector, and their totals (GBP)
+    allocations: int
+    amount: float
+    cashback: float
+    interest_saved: float
+
+
+class DecisionAnalyticsResponse(BaseModel):
+    month: str
+    commit_modes: List[CommitMode]
+    rollups: List[DecisionRollup]
+    total_amount: float
+    total_cashback: float
+    total_interest_saved: float
+
+
+class DecisionLogStats(BaseModel):
+    path: Optional[str] = None
+    # This worker's segment of the log, and how many segments it merges
+    segment: Optional[str] = None
+    segments: int
+    decisions: int
+    records: int
+    pending: int
+    write_errors: int
@@ -1,16 +1,34 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from api.models import DebitCard, CreditCard, InternationalCard, UserPreferences, Sector, Allocation, TransactionResponse, TransactionRequest
 import math
-from llm.groq_api import groq_api_call
+import time
+from itertools import chain
+from api.explanations import generate_explanation
+from api.metrics import observe_stage
+from api.ranking import RankingIndex, BALANCED_SECTORS, lazy_ranked
+from api.registry import card_available_gbp
+
+
+def select_mode(category: Sector) -> str:
+    # Automatic Mode Selection based on Category
+    # Balanced: hotel, travel, fuel, shopping
+    # Interest Only: everything else (general, grocery)
+    if category in BALANCED_SECTORS:
+        return "balanced"
+    return "interest_only"
 
 
 class CardOptimizer:
-    def __init__(self, debit_cards: List[DebitCard], credit_cards: List[CreditCard], international_cards: List[InternationalCard], preferences: UserPreferences):
-        self.debit_cards = sorted(
-            debit_cards, key=lambda x: x.annual_interest_rate, reverse=True)
+    # `ranking` is the persistent per-sector RankingIndex kept by the API; when
+    # omitted, sources are selected lazily from a heap on each call, so only the
+    # sources a transaction actually uses are ever ordered.
+    def __init__(self, debit_cards: List[DebitCard], credit_cards: List[CreditCard], international_cards: List[InternationalCard], preferences: UserPreferences,
+                 ranking: Optional[RankingIndex] = None):
+        self.debit_cards = debit_cards
         self.credit_cards = credit_cards
         self.international_cards = international_cards
         self.preferences = preferences
+        self.ranking = ranking
 
     def _calculate_interest_benefit(self, amount: float, annual_rate: float) -> float:
         # Simplified: Interest saved for 1 month if this amount stays in the account
@@ -20,22 +38,8 @@ class CardOptimizer:
         return amount * rate
 
     def _get_llm_explanation(self, allocations: List[Allocation], total_amount: float, category: Sector, mode: str):
-        # Construct a detailed prompt for Groq
-        prompt = f'''Based on the allocations made by the optimization model, give the user the summary 
-        of the payment allocations and make it user-friendly for a common man.
-        Use the term 'Net Savings' when referring to interest preserved in savings accounts.
-        {str(allocations)}. Maximise the explanation to only 3 sentences
-        '''
-        print(allocations)
-        try:
-            raw = groq_api_call(prompt)
-            print(raw)
-            return raw
-        except Exception as e:
-            raise Exception(e)
-
-            # Attempt to parse JSON
-            
+        # Blocking call - the API routes this through ExplanationService instead
+        return generate_explanation(allocations, total_amount, category, mode)
 
     def _is_split_worthwhile(self, amount: float, potential_benefit: float) -> bool:
         # Realistic thresholds:
@@ -50,17 +54,11 @@ class CardOptimizer:
             return False
         return True
 
-    def optimize(self, request: TransactionRequest) -> TransactionResponse:
+    def optimize(self, request: TransactionRequest, explain: bool = True) -> TransactionResponse:
         amount = request.amount
         category = request.category
 
-        # Automatic Mode Selection based on Category
-        # Balanced: hotel, travel, fuel, shopping
-        # Interest Only: everything else (general, grocery)
-        if category in [Sector.HOTEL, Sector.TRAVEL, Sector.FUEL, Sector.SHOPPING]:
-            mode = "balanced"
-        else:
-            mode = "interest_only"
+        mode = select_mode(category)
 
         allocations: List[Allocation] = []
         remaining_amount = amount
@@ -69,70 +67,21 @@ class CardOptimizer:
         # Benefit = (Cashback Rate) - (Opportunity Cost of Interest Loss)
         # We want to maximize this Benefit across all utilized sources.
 
-        indexed_cards = []
-
-        # Best debit rate to calculate "Interest Saved" comparison
-        best_debit_rate = max(
-            [dc.annual_interest_rate for dc in self.debit_cards] + [0])
-
-        for cc in self.credit_cards:
-            if mode == "interest_only":
-                # Only utilise debit cards in interest_only/general mode.
-                continue
-
-            rate = cc.cashback_rates.get(category, 0)
-
-            # Calculate a tiny priority bonus (0 to 0.0001) based on sector priority
-            priority_bonus = 0.0
-            if category in self.preferences.point_priority:
-                rank = self.preferences.point_priority.index(category)
-                priority_bonus = (len(Sector) - rank) * 0.00001
-
-            final_benefit = rate + priority_bonus
-
-            indexed_cards.append({
-                "obj": cc,
-                "benefit": final_benefit,
-                "type": "credit",
-                "available_gbp": min(cc.monthly_spend_limit, cc.current_balance)
-            })
-
-        for dc in self.debit_cards:
-            indexed_cards.append({
-                "obj": dc,
-                "benefit": -dc.annual_interest_rate,
-                "type": "debit",
-                "available_gbp": min(dc.monthly_spend_limit, dc.current_balance)
-            })
-
-        for ic in self.international_cards:
-            if mode == "interest_only":
-                # Only utilise debit cards in interest_only/general mode.
-                continue
-
-            # International balance/limit is in local currency (e.g. INR)
-            # Convert to GBP equivalent for optimization logic
-            available_gbp = min(ic.monthly_spend_limit,
-                                ic.current_balance) / ic.gbp_conversion
-
-            indexed_cards.append({
-                "obj": ic,
-                "benefit": -ic.markup_rate,
-                "type": "international",
-                "available_gbp": available_gbp
-            })
-
-        # Sort all sources by benefit (highest first)
-        ranked_cards = sorted(
-            indexed_cards, key=lambda x: x["benefit"], reverse=True)
-
-        # Pre-calculate potential best single card that covers the whole amount,
-        # respecting mode-specific preferences.
-        best_single_card = None
-        for item in ranked_cards:
-            if item["available_gbp"] >= amount:
-                best_single_card = item
-                break
+        started = time.perf_counter()
+
+        # Best debit rate to calculate "Interest Saved" comparison, and the
+        # sources in benefit order (highest first); interest_only sectors only
+        # hold debit accounts. Either way the sources are consumed lazily.
+        if self.ranking is not None:
+            best_debit_rate = self.ranking.best_debit_rate
+            ranked_cards = iter(self.ranking.ranked(category))
+        else:
+            best_debit_rate = max([card.annual_interest_rate for card in self.debit_cards] + [0])
+            ranked_cards = lazy_ranked(self.debit_cards, self.credit_cards, self.international_cards,
+                                       self.preferences, category)
+        # Heap pops during the walk below count towards allocation
+        ranked_at = time.perf_counter()
+        observe_stage("ranking", ranked_at - started)
 
         # Decision: To split or not to split?
         # We only consider splitting if the best single card is NOT the absolute best benefit card,
@@ -142,18 +91,32 @@ class CardOptimizer:
         if amount < 50.0:
             should_split = False
 
+        # Potential best single card that covers the whole amount, respecting
+        # mode-specific preferences. Only small transactions use it, so the
+        # search (which may walk far down the ranking) is skipped otherwise;
+        # sources it passes over are replayed for the split below.
+        best_single_card = None
+        if not should_split:
+            passed = []
+            for item in ranked_cards:
+                if card_available_gbp(item.card, item.kind) >= amount:
+                    best_single_card = item
+                    break
+                passed.append(item)
+            ranked_cards = chain(passed, ranked_cards)
+
         if not should_split and best_single_card:
             # Fallback to single best card
-            card = best_single_card["obj"]
+            card = best_single_card.card
             cashback = 0.0
             # Logic for positive interest_saved:
             # How much better is this card than the highest interest debit account?
-            if best_single_card["type"] == "credit":
+            if best_single_card.kind == "credit":
                 rate = card.cashback_rates.get(category, 0)
                 cashback = self._calculate_cashback_benefit(amount, rate)
                 interest_saved = self._calculate_interest_benefit(
                     amount, best_debit_rate)
-            elif best_single_card["type"] == "debit":
+            elif best_single_card.kind == "debit":
                 # If we use a 2% account instead of 5%, we "save" 3%.
                 # If we use the 5% account, we save 0%.
                 rel_rate = best_debit_rate - card.annual_interest_rate
@@ -171,7 +134,7 @@ class CardOptimizer:
                 amount_utilised=amount,
                 interest_saved=interest_saved,
                 cashback_points= cashback + interest_saved,
-                cashback_sector=category if best_single_card["type"] == "credit" else None
+                cashback_sector=category if best_single_card.kind == "credit" else None
             ))
             remaining_amount = 0
         else:
@@ -180,20 +143,20 @@ class CardOptimizer:
                 if remaining_amount <= 0:
                     break
 
-                card = item["obj"]
-                available = item["available_gbp"]
+                card = item.card
+                available = card_available_gbp(card, item.kind)
 
                 if available > 0:
                     use_amount = min(remaining_amount, available)
 
                     cashback = 0.0
-                    if item["type"] == "credit":
+                    if item.kind == "credit":
                         rate = card.cashback_rates.get(category, 0)
                         cashback = self._calculate_cashback_benefit(
                             use_amount, rate)
                         interest_saved = self._calculate_interest_benefit(
                             use_amount, best_debit_rate)
-                    elif item["type"] == "debit":
+                    elif item.kind == "debit":
                         rel_rate = best_debit_rate - card.annual_interest_rate
                         interest_saved = self._calculate_interest_benefit(
                             use_amount, rel_rate)
@@ -208,13 +171,16 @@ class CardOptimizer:
                         amount_utilised=use_amount,
                         interest_saved=interest_saved,
                         cashback_points=cashback + interest_saved,
-                        cashback_sector=category if item["type"] == "credit" else None
+                        cashback_sector=category if item.kind == "credit" else None
                     ))
                     remaining_amount -= use_amount
 
         status = "success" if remaining_amount == 0 else "insufficient_funds"
-        explanation_text = self._get_llm_explanation(
-            allocations, amount, category, mode)
+        observe_stage("allocation", time.perf_counter() - ranked_at)
+        explanation_text = None
+        if explain:
+            explanation_text = self._get_llm_explanation(
+                allocations, amount, category, mode)
 
 
         
@@ -224,6 +190,6 @@ class CardOptimizer:
             total_amount=amount,
             status=status
         )
-        return resp 
-        # Attach eom_impact to ui_hints for frontend convenience
+        # The API attaches eom_impact from the state's ProjectionEngine
+        return resp
       
\ No newline at end of file
@@ -0,0 +1,229 @@
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Tuple
+
+from api.batch import MIN_SPLIT_TRANSACTION, source_rates
+from api.models import Allocation, PlannedPurchase, PlannedTransaction, PlanResponse, Sector
+from api.ranking import INTERNATIONAL, RankingIndex
+from api.registry import card_available_gbp
+
+# Flows below this (in GBP) are treated as zero
+EPSILON = 1e-9
+
+
+def min_cost_flow(node_count: int, edges: List[Tuple[int, int, float, float]], source: int, sink: int) -> List[float]:
+    # Successive shortest paths (Bellman-Ford, so negative costs are fine on
+    # this acyclic graph) for a minimum-cost maximum flow. `edges` are
+    # (from, to, capacity, cost per unit); returns the flow on each edge.
+    graph: List[List[int]] = [[] for _ in range(node_count)]
+    to, cap, cost = [], [], []
+    for u, v, c, w in edges:
+        for a, b, capacity, unit_cost in ((u, v, c, w), (v, u, 0.0, -w)):
+            graph[a].append(len(to))
+            to.append(b)
+            cap.append(capacity)
+            cost.append(unit_cost)
+
+    while True:
+        dist = [float("inf")] * node_count
+        via = [-1] * node_count
+        dist[source] = 0.0
+        for _ in range(node_count - 1):
+            changed = False
+            for u in range(node_count):
+                if dist[u] == float("inf"):
+                    continue
+                for e in graph[u]:
+                    if cap[e] > EPSILON and dist[u] + cost[e] < dist[to[e]] - 1e-15:
+                        dist[to[e]] = dist[u] + cost[e]
+                        via[to[e]] = e
+                        changed = True
+            if not changed:
+                break
+        if via[sink] < 0:
+            break
+
+        push, node = float("inf"), sink
+        while node != source:
+            e = via[node]
+            push = min(push, cap[e])
+            node = to[e ^ 1]
+        node = sink
+        while node != source:
+            e = via[node]
+            cap[e] -= push
+            cap[e ^ 1] += push
+            node = to[e ^ 1]
+
+    return [cap[2 * i + 1] for i in range(len(edges))]
+
+
+def _month(day: date) -> Tuple[int, int]:
+    return day.year, day.month
+
+
+# Plans a queue of upcoming purchases jointly instead of one at a time.
+#
+# Within a sector every purchase earns the same per-£ benefit on a given card,
+# so each month reduces to a small transportation problem: sectors supply
+# their total spend, cards absorb up to their headroom for that month, and
+# each sector -> card edge costs minus that card's per-£ benefit (cashback plus
+# relative interest, exactly as the greedy optimizer scores allocations). A
+# min-cost max-flow over that sectors x cards graph gives the best month, and
+# the per-sector card flows are then dealt out to the sector's purchases in
+# date order. Months are planned in sequence: monthly limits reset, balances
+# carry over what earlier months used.
+class PlanOptimizer:
+    def __init__(self, ranking: RankingIndex, current_month: Tuple[int, int]):
+        self.ranking = ranking
+        self.current_month = current_month
+
+    def _headroom(self, used_local: Dict[str, float], first_month: bool) -> Dict[str, float]:
+        # GBP each source can still take in the month being planned
+        headroom = {}
+        for category in Sector:
+            for entry in self.ranking.ranked(category):
+                card = entry.card
+                if card.id in headroom:
+                    continue
+                if first_month:
+                    local = card_available_gbp(card, entry.kind) * (card.gbp_conversion if entry.kind == INTERNATIONAL else 1)
+                else:
+                    local = min(card.monthly_spend_limit, card.current_balance) - card.reserved
+                local = min(local, card.current_balance - card.reserved - used_local.get(card.id, 0.0))
+                gbp = local / card.gbp_conversion if entry.kind == INTERNATIONAL else local
+                headroom[card.id] = max(gbp, 0.0)
+        return headroom
+
+    def _benefits(self, category: Sector):
+        entries = self.ranking.ranked(category)
+        cashback, interest, is_credit = source_rates(entries, category, self.ranking.best_debit_rate)
+        return entries, cashback, interest, is_credit
+
+    def _plan_month(self, purchases: List[Tuple[int, PlannedPurchase]], headroom: Dict[str, float]):
+        by_sector: Dict[Sector, List[Tuple[int, PlannedPurchase]]] = defaultdict(list)
+        for item in purchases:
+            by_sector[Sector(item[1].category)].append(item)
+        sectors = list(by_sector)
+        card_ids = list(headroom)
+        card_node = {card_id: 1 + len(sectors) + i for i, card_id in enumerate(card_ids)}
+        source, sink = 0, 1 + len(sectors) + len(card_ids)
+
+        edges, edge_info = [], []
+        benefits = {}
+        for i, category in enumerate(sectors):
+            edges.append((source, 1 + i, sum(p.amount for _, p in by_sector[category]), 0.0))
+            edge_info.append(None)
+            entries, cashback, interest, is_credit = self._benefits(category)
+            benefits[category] = (entries, cashback, interest, is_credit)
+            for j, entry in enumerate(entries):
+                edges.append((1 + i, card_node[entry.card.id], float("inf"), -(cashback[j] + interest[j] / 12)))
+                edge_info.append((category, j))
+        for card_id in card_ids:
+            edges.append((card_node[card_id], sink, headroom[card_id], 0.0))
+            edge_info.append(None)
+
+        flows = min_cost_flow(sink + 1, edges, source, sink)
+
+        results = {}
+        for category in sectors:
+            entries, cashback, interest, is_credit = benefits[category]
+            # Per ranked source, GBP this sector puts on it this month
+            pools = [0.0] * len(entries)
+            for flow, info in zip(flows, edge_info):
+                if info is not None and info[0] == category and flow > EPSILON:
+                    pools[info[1]] += flow
+            # Deal the pools out in ranking order to the purchases by date
+            j = 0
+            for index, purchase in sorted(by_sector[category], key=lambda item: (item[1].date, item[1].amount)):
+                remaining = purchase.amount
+                allocations = []
+                while remaining > EPSILON and j < len(entries):
+                    if pools[j] <= EPSILON:
+                        j += 1
+                        continue
+                    use = min(remaining, pools[j])
+                    pools[j] -= use
+                    remaining -= use
+                    saved = use * interest[j] / 12
+                    allocations.append(Allocation(
+                        card_id=entries[j].card.id,
+                        card_name=entries[j].card.name,
+                        amount_utilised=use,
+                        interest_saved=saved,
+                        cashback_points=use * cashback[j] + saved,
+                        cashback_sector=category if is_credit[j] else None,
+                    ))
+                    headroom[entries[j].card.id] -= use
+                results[index] = (allocations, remaining)
+        return results
+
+    def plan(self, purchases: List[PlannedPurchase]) -> PlanResponse:
+        by_month: Dict[Tuple[int, int], List[Tuple[int, PlannedPurchase]]] = defaultdict(list)
+        for index, purchase in enumerate(purchases):
+            by_month[max(_month(purchase.date), self.current_month)].append((index, purchase))
+
+        cards = {entry.card.id: entry for category in Sector for entry in self.ranking.ranked(category)}
+        used_local: Dict[str, float] = defaultdict(float)
+        planned: List[PlannedTransaction] = [None] * len(purchases)
+        for month in sorted(by_month):
+            headroom = self._headroom(used_local, first_month=month == self.current_month)
+            for index, (allocations, remaining) in self._plan_month(by_month[month], headroom).items():
+                for a in allocations:
+                    entry = cards[a.card_id]
+                    conversion = entry.card.gbp_conversion if entry.kind == INTERNATIONAL else 1
+                    used_local[a.card_id] += a.amount_utilised * conversion
+                purchase = purchases[index]
+                planned[index] = PlannedTransaction(
+                    date=purchase.date,
+                    category=purchase.category,
+                    amount=purchase.amount,
+                    allocations=allocations,
+                    shortfall=max(remaining, 0.0),
+                    status="success" if remaining <= EPSILON else "insufficient_funds",
+                )
+
+        total_value = sum(a.cashback_points for p in planned for a in p.allocations)
+        return PlanResponse(
+            purchases=planned,
+            total_cashback=sum(a.cashback_points - a.interest_saved for p in planned for a in p.allocations),
+            total_interest_saved=sum(a.interest_saved for p in planned for a in p.allocations),
+            total_value=total_value,
+            greedy_value=self.greedy_value(purchases),
+            unfunded=sum(1 for p in planned if p.status != "success"),
+        )
+
+    def greedy_value(self, purchases: List[PlannedPurchase]) -> float:
+        # What committing each purchase through the one-at-a-time optimizer
+        # (single card under £50, otherwise the ranked waterfall) would earn
+        used_local: Dict[str, float] = defaultdict(float)
+        value = 0.0
+        ordered = sorted(purchases, key=lambda p: p.date)
+        month = None
+        headroom: Dict[str, float] = {}
+        for purchase in ordered:
+            purchase_month = max(_month(purchase.date), self.current_month)
+            if purchase_month != month:
+                month = purchase_month
+                headroom = self._headroom(used_local, first_month=month == self.current_month)
+            entries, cashback, interest, _ = self._benefits(Sector(purchase.category))
+            amount = purchase.amount
+            uses = []
+            single = next((j for j, e in enumerate(entries) if headroom[e.card.id] >= amount), None)
+            if amount < MIN_SPLIT_TRANSACTION and single is not None:
+                uses = [(single, amount)]
+            else:
+                remaining = amount
+                for j, entry in enumerate(entries):
+                    if remaining <= 0:
+                        break
+                    use = min(remaining, headroom[entry.card.id])
+                    if use > 0:
+                        uses.append((j, use))
+                        remaining -= use
+            for j, use in uses:
+                entry = entries[j]
+                headroom[entry.card.id] -= use
+                used_local[entry.card.id] += use * (entry.card.gbp_conversion if entry.kind == INTERNATIONAL else 1)
+                value += use * cashback[j] + use * interest[j] / 12
+        return value
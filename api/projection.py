@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from api.models import Allocation, EomImpact, ProjectionResponse, ProjectionSeries, Sector, StrategyImpact
+from api.ranking import CREDIT, DEBIT, INTERNATIONAL, RankingIndex
+from api.registry import CardRegistry, card_available_gbp
+
+# Days simulated after a transaction (multi-month by default)
+PROJECTION_HORIZON_DAYS = int(os.getenv("PROJECTION_HORIZON_DAYS", "90"))
+
+# Upper bound for the horizon a caller may ask for
+MAX_PROJECTION_DAYS = 3 * 365
+
+OPTIMIZED = "optimized"
+DEBIT_ONLY = "debit_only"
+PRIMARY_ACCOUNT = "primary_account"
+
+# Alternative ways to fund the same transaction. Each returns card_id -> GBP.
+# debit_only spends from the lowest-rate debit accounts first (the ranking's
+# debit order); primary_account is what paying without the optimizer looks
+# like: the largest current account, overflowing to the next largest.
+
+
+def _waterfall(entries, amount: float) -> Dict[str, float]:
+    funded, remaining = {}, amount
+    for entry in entries:
+        if remaining <= 0:
+            break
+        use = min(remaining, card_available_gbp(entry.card, entry.kind))
+        if use > 0:
+            funded[entry.card.id] = use
+            remaining -= use
+    return funded
+
+
+def _debit_only(ranking: RankingIndex, category: Sector, amount: float) -> Dict[str, float]:
+    return _waterfall([e for e in ranking.ranked(category) if e.kind == DEBIT], amount)
+
+
+def _primary_account(ranking: RankingIndex, category: Sector, amount: float) -> Dict[str, float]:
+    debits = [e for e in ranking.ranked(category) if e.kind == DEBIT]
+    return _waterfall(sorted(debits, key=lambda e: -e.card.current_balance), amount)
+
+
+STRATEGIES: Dict[str, Callable[[RankingIndex, Sector, float], Dict[str, float]]] = {
+    DEBIT_ONLY: _debit_only,
+    PRIMARY_ACCOUNT: _primary_account,
+}
+
+
+def days_to_month_end(timestamp: float) -> int:
+    # Days from today until the first of next month (UTC), when statements close
+    today = datetime.fromtimestamp(timestamp, timezone.utc).date()
+    first = today.replace(year=today.year + today.month // 12, month=today.month % 12 + 1, day=1)
+    return (first - today).days
+
+
+# Projects what a transaction's funding does to the user's money over time.
+#
+# Debit balances compound daily at each account's annual rate. Spend put on a
+# credit card is repaid from the best-rate debit account when the statement
+# closes at month end, and its cashback is credited then; international spend
+# costs its markup up front. Every strategy is simulated at once as a
+# scenarios x accounts x days array, using the closed form
+#     balance[d] = (start - drawn) * g**d - repaid * g**(d - t) * [d >= t]
+# with g = 1 + rate/365 and t the statement day, so a projection is a handful
+# of NumPy operations regardless of horizon. The per-account growth table is
+# cached until a card or rate changes.
+class ProjectionEngine:
+    def __init__(self, registry: CardRegistry, ranking: RankingIndex, clock: Callable[[], float] = time.time,
+                 horizon_days: int = PROJECTION_HORIZON_DAYS):
+        self.registry = registry
+        self.ranking = ranking
+        self.horizon_days = horizon_days
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = None
+        self._growth: Dict[int, np.ndarray] = {}
+
+    def _accounts(self, horizon: int):
+        # Debit ids, starting balances, rates and the (accounts, days) growth table
+        state = (self.registry.version, self.ranking.version)
+        with self._lock:
+            if state != self._state:
+                self._state = state
+                self._growth = {}
+                cards = self.registry.debit_cards
+                self._ids = {card.id: i for i, card in enumerate(cards)}
+                self._start = np.array([card.current_balance for card in cards], dtype=float)
+                self._rates = np.array([card.annual_interest_rate for card in cards], dtype=float)
+            growth = self._growth.get(horizon)
+            if growth is None:
+                days = np.arange(horizon + 1, dtype=float)
+                growth = self._growth[horizon] = (1 + self._rates / 365)[:, None] ** days[None, :]
+            return self._ids, self._start, self._rates, growth
+
+    def _funding(self, allocations: List[Allocation], category: Sector, amount: float) -> Dict[str, Dict[str, float]]:
+        funding = {OPTIMIZED: {}}
+        for a in allocations:
+            funding[OPTIMIZED][a.card_id] = funding[OPTIMIZED].get(a.card_id, 0.0) + a.amount_utilised
+        for name, strategy in STRATEGIES.items():
+            funding[name] = strategy(self.ranking, category, amount)
+        return funding
+
+    def simulate(self, allocations: List[Allocation], category: Sector, amount: float, horizon_days: int = None):
+        # Returns strategy names, the statement day, per-strategy (strategies x
+        # days) debit balance, interest and net value, and per-strategy
+        # cashback and fees
+        category = Sector(category)
+        horizon = self.horizon_days if horizon_days is None else horizon_days
+        ids, start, rates, growth = self._accounts(horizon)
+        funding = self._funding(allocations, category, amount)
+        names = list(funding)
+        n_strategies, n_accounts = len(names), len(ids)
+        statement = min(days_to_month_end(self._clock()), horizon)
+
+        drawn = np.zeros((n_strategies, n_accounts))
+        repaid = np.zeros((n_strategies, n_accounts))
+        cashback = np.zeros(n_strategies)
+        fees = np.zeros(n_strategies)
+        best = int(np.argmax(rates)) if n_accounts else -1
+        for s, name in enumerate(names):
+            for card_id, gbp in funding[name].items():
+                kind = self.registry.kind_of(card_id)
+                card = self.registry.get(card_id)
+                if kind == DEBIT:
+                    drawn[s, ids[card_id]] += gbp
+                elif kind == CREDIT:
+                    cashback[s] += gbp * card.cashback_rates.get(category, 0)
+                    if best >= 0:
+                        repaid[s, best] += gbp
+                elif kind == INTERNATIONAL:
+                    fees[s] += gbp * card.markup_rate
+
+        settled = np.zeros_like(growth)
+        settled[:, statement:] = growth[:, :growth.shape[1] - statement]
+        after = (np.arange(horizon + 1) >= statement).astype(float)
+        principal = (start[None, :] - drawn)[:, :, None]
+        balance = principal * growth[None] - repaid[:, :, None] * settled[None]
+        flat = principal - repaid[:, :, None] * after[None, None, :]
+
+        total_balance = balance.sum(axis=1)
+        interest = total_balance - flat.sum(axis=1)
+        value = interest + cashback[:, None] * after[None, :] - fees[:, None]
+        return names, statement, total_balance, interest, value, cashback, fees
+
+    def eom_impact(self, allocations: List[Allocation], category: Sector, amount: float) -> EomImpact:
+        names, statement, total_balance, interest, value, cashback, fees = self.simulate(allocations, category, amount)
+        strategies = [
+            StrategyImpact(
+                strategy=name,
+                eom_balance=float(total_balance[s, statement]),
+                eom_value=float(value[s, statement]),
+                horizon_balance=float(total_balance[s, -1]),
+                horizon_value=float(value[s, -1]),
+                cashback=float(cashback[s]),
+                fees=float(fees[s]),
+            )
+            for s, name in enumerate(names)
+        ]
+        optimized, baseline = names.index(OPTIMIZED), names.index(PRIMARY_ACCOUNT)
+        # Interest the optimized funding keeps (or loses) by the statement date
+        kept = interest[optimized, statement] - interest[baseline, statement]
+        return EomImpact(
+            horizon_days=self.horizon_days,
+            eom_day=statement,
+            total_cashback_earned=float(cashback[optimized]),
+            total_interest_saved=float(max(kept, 0.0)),
+            total_interest_opportunity_lost=float(max(-kept, 0.0)),
+            total_fx_costs=float(fees[optimized]),
+            net_eom_benefit=float(value[optimized, statement] - value[baseline, statement]),
+            net_horizon_benefit=float(value[optimized, -1] - value[baseline, -1]),
+            strategies=strategies,
+        )
+
+    def projection(self, allocations: List[Allocation], category: Sector, amount: float,
+                   horizon_days: int) -> ProjectionResponse:
+        names, statement, total_balance, _, value, _, _ = self.simulate(allocations, category, amount, horizon_days)
+        return ProjectionResponse(
+            horizon_days=horizon_days,
+            eom_day=statement,
+            series=[
+                ProjectionSeries(strategy=name, debit_balance=total_balance[s].tolist(), value=value[s].tolist())
+                for s, name in enumerate(names)
+            ],
+        )
@@ -0,0 +1,55 @@
+import os
+from typing import List
+
+from api.models import Allocation, Sector
+from llm.token_usage import estimate_tokens
+
+# Upper bound on the explanation prompt; rows beyond it are folded together
+PROMPT_TOKEN_BUDGET = int(os.getenv("EXPLANATION_PROMPT_TOKENS", "300"))
+
+INSTRUCTIONS = (
+    "Explain this card payment split to a customer in at most 3 short, plain sentences. "
+    "Call interest kept in savings 'Net Savings'. Quote amounts exactly as given, in £.")
+
+HEADER = "card|amount|cashback|net_savings"
+
+
+def _row(name: str, amount: float, cashback: float, net_savings: float) -> str:
+    return f"{name}|{amount:.2f}|{cashback:.2f}|{net_savings:.2f}"
+
+
+def _allocation_row(a: Allocation) -> str:
+    return _row(a.card_name, a.amount_utilised, a.cashback_points - a.interest_saved, a.interest_saved)
+
+
+# Compact tabular prompt: one pipe-separated row per funding source with
+# amounts rounded to pence, instead of the verbose Pydantic repr. If the table
+# would exceed `max_tokens`, the trailing (last-resort) rows of the waterfall
+# are folded into a single "other sources" row.
+def build_explanation_prompt(allocations: List[Allocation], total_amount: float, category: Sector, mode: str,
+                             max_tokens: int = PROMPT_TOKEN_BUDGET) -> str:
+    head = [INSTRUCTIONS, f"Payment: £{total_amount:.2f} {Sector(category).value} ({mode})", HEADER]
+    rows = [_allocation_row(a) for a in allocations]
+
+    prompt = "\n".join(head + rows)
+    if len(rows) <= 1 or estimate_tokens(prompt) <= max_tokens:
+        return prompt
+
+    # Keep the largest prefix of rows that fits alongside a folded remainder row
+    used = estimate_tokens("\n".join(head)) + estimate_tokens(_row("99 other sources", total_amount, 0.0, 0.0)) + 1
+    kept = 0
+    for row in rows[:-1]:
+        cost = estimate_tokens(row) + 1
+        if kept and used + cost > max_tokens:
+            break
+        used += cost
+        kept += 1
+
+    rest = allocations[kept:]
+    folded = _row(
+        f"{len(rest)} other sources",
+        sum(a.amount_utilised for a in rest),
+        sum(a.cashback_points - a.interest_saved for a in rest),
+        sum(a.interest_saved for a in rest),
+    )
+    return "\n".join(head + rows[:kept] + [folded])
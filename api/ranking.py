@@ -0,0 +1,186 @@
+import heapq
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from api.models import DebitCard, CreditCard, InternationalCard, UserPreferences, Sector
+
+Card = Union[DebitCard, CreditCard, InternationalCard]
+
+CREDIT = "credit"
+DEBIT = "debit"
+INTERNATIONAL = "international"
+
+# Ties on benefit keep the optimizer's historical order: credit cards first,
+# then debit, then international, each in portfolio order.
+_GROUP_ORDER = {CREDIT: 0, DEBIT: 1, INTERNATIONAL: 2}
+
+BALANCED_SECTORS = (Sector.HOTEL, Sector.TRAVEL, Sector.FUEL, Sector.SHOPPING)
+
+
+def priority_bonus(preferences: UserPreferences, category: Sector) -> float:
+    # Calculate a tiny priority bonus (0 to 0.0001) based on sector priority
+    if category in preferences.point_priority:
+        rank = preferences.point_priority.index(category)
+        return (len(Sector) - rank) * 0.00001
+    return 0.0
+
+
+def source_benefit(card: Card, kind: str, category: Sector, bonus: float) -> float:
+    if kind == CREDIT:
+        return card.cashback_rates.get(category, 0) + bonus
+    if kind == DEBIT:
+        return -card.annual_interest_rate
+    return -card.markup_rate
+
+
+def sectors_for(kind: str):
+    # Only debit accounts are used in interest_only sectors
+    return Sector if kind == DEBIT else BALANCED_SECTORS
+
+
+class RankedSource:
+    __slots__ = ("card", "kind", "benefit")
+
+    def __init__(self, card: Card, kind: str, benefit: float):
+        self.card = card
+        self.kind = kind
+        self.benefit = benefit
+
+
+# Persistent per-sector ranking of funding sources, highest benefit first.
+#
+# Each sector keeps a sorted list of RankedSource entries (plus a parallel list
+# of sort keys for bisection). Card or preference changes re-position only the
+# affected entries instead of re-sorting the whole portfolio, so the optimize
+# hot path is a walk over a ready ranking. Availability (limit/balance) is not
+# part of the ordering and is read from the card during the walk.
+class RankingIndex:
+    def __init__(self, debit_cards: List[DebitCard], credit_cards: List[CreditCard],
+                 international_cards: List[InternationalCard], preferences: UserPreferences):
+        self.preferences = preferences
+        self._cards: Dict[str, Tuple[Card, str, int]] = {}
+        self._bonus: Dict[Sector, float] = {s: priority_bonus(preferences, s) for s in Sector}
+        self._keys: Dict[Sector, List[tuple]] = {s: [] for s in Sector}
+        self._entries: Dict[Sector, List[RankedSource]] = {s: [] for s in Sector}
+        self._current_keys: Dict[Tuple[Sector, str], tuple] = {}
+        self._best_debit_rate: Optional[float] = None
+        self._next_position = {CREDIT: 0, DEBIT: 0, INTERNATIONAL: 0}
+        # Bumped on every change to the ordering or benefits
+        self.version = 0
+
+        # Built with one sort per sector; inserting card by card would cost a
+        # list shift per card, quadratic for large portfolios
+        rows: Dict[Sector, list] = {s: [] for s in Sector}
+        for kind, cards in ((CREDIT, credit_cards), (DEBIT, debit_cards), (INTERNATIONAL, international_cards)):
+            for card in cards:
+                position = self._next_position[kind]
+                self._next_position[kind] += 1
+                self._cards[card.id] = (card, kind, position)
+                for category in self._sectors_for(kind):
+                    benefit = self._benefit(card, kind, category)
+                    rows[category].append(((-benefit, _GROUP_ORDER[kind], position), card, kind, benefit))
+        for category, sector_rows in rows.items():
+            sector_rows.sort(key=lambda row: row[0])
+            self._keys[category] = [key for key, _, _, _ in sector_rows]
+            self._entries[category] = [RankedSource(card, kind, benefit) for _, card, kind, benefit in sector_rows]
+            for key, card, _, _ in sector_rows:
+                self._current_keys[(category, card.id)] = key
+
+    def _benefit(self, card: Card, kind: str, category: Sector) -> float:
+        return source_benefit(card, kind, category, self._bonus[category])
+
+    def _sectors_for(self, kind: str):
+        return sectors_for(kind)
+
+    def _insert(self, category: Sector, card: Card, kind: str, position: int):
+        benefit = self._benefit(card, kind, category)
+        key = (-benefit, _GROUP_ORDER[kind], position)
+        i = bisect_left(self._keys[category], key)
+        self._current_keys[(category, card.id)] = key
+        self._keys[category].insert(i, key)
+        self._entries[category].insert(i, RankedSource(card, kind, benefit))
+
+    def _remove(self, category: Sector, card_id: str):
+        # Keys are unique (group, position), so bisection finds the exact entry
+        key = self._current_keys.pop((category, card_id))
+        i = bisect_left(self._keys[category], key)
+        del self._keys[category][i]
+        del self._entries[category][i]
+
+    def add_card(self, card: Card, kind: str):
+        position = self._next_position[kind]
+        self._next_position[kind] += 1
+        self._cards[card.id] = (card, kind, position)
+        for category in self._sectors_for(kind):
+            self._insert(category, card, kind, position)
+        if kind == DEBIT:
+            self._best_debit_rate = None
+        self.version += 1
+
+    def remove_card(self, card_id: str):
+        card, kind, _ = self._cards.pop(card_id)
+        for category in self._sectors_for(kind):
+            self._remove(category, card_id)
+        if kind == DEBIT:
+            self._best_debit_rate = None
+        self.version += 1
+
+    def update_card(self, card_id: str):
+        # Re-position one card after its rates changed; other entries stay put
+        card, kind, position = self._cards[card_id]
+        for category in self._sectors_for(kind):
+            self._remove(category, card_id)
+            self._insert(category, card, kind, position)
+        if kind == DEBIT:
+            self._best_debit_rate = None
+        self.version += 1
+
+    def set_preferences(self, preferences: UserPreferences):
+        # The bonus is shared by every credit card in a sector, so only sectors
+        # whose priority moved need their credit entries re-keyed
+        self.preferences = preferences
+        for category in BALANCED_SECTORS:
+            bonus = priority_bonus(preferences, category)
+            if bonus == self._bonus[category]:
+                continue
+            self._bonus[category] = bonus
+            for card, kind, position in list(self._cards.values()):
+                if kind == CREDIT:
+                    self._remove(category, card.id)
+                    self._insert(category, card, kind, position)
+        for category in Sector:
+            # Keep interest_only sectors in step even though they hold no credit entries
+            self._bonus[category] = priority_bonus(preferences, category)
+        self.version += 1
+
+    @property
+    def best_debit_rate(self) -> float:
+        if self._best_debit_rate is None:
+            self._best_debit_rate = max(
+                [card.annual_interest_rate for card, kind, _ in self._cards.values() if kind == DEBIT] + [0])
+        return self._best_debit_rate
+
+    def ranked(self, category: Sector) -> List[RankedSource]:
+        return self._entries[category]
+
+
+def lazy_ranked(debit_cards: List[DebitCard], credit_cards: List[CreditCard],
+                international_cards: List[InternationalCard], preferences: UserPreferences,
+                category: Sector) -> Iterator[RankedSource]:
+    # The same order as RankingIndex.ranked, for one-off optimizers without a
+    # persistent index: the keys are heapified in O(n) and sources are popped
+    # as the caller consumes them, so a walk that stops after k sources costs
+    # O(n + k log n) instead of a full sort. Rows are plain tuples (the
+    # (group, position) part of the key is unique, so cards are never compared).
+    bonus = priority_bonus(preferences, category)
+    heap = []
+    for kind, cards in ((CREDIT, credit_cards), (DEBIT, debit_cards), (INTERNATIONAL, international_cards)):
+        if category not in sectors_for(kind):
+            continue
+        group = _GROUP_ORDER[kind]
+        for position, card in enumerate(cards):
+            heap.append((-source_benefit(card, kind, category, bonus), group, position, kind, card))
+    heapq.heapify(heap)
+    while heap:
+        negative_benefit, _, _, kind, card = heapq.heappop(heap)
+        yield RankedSource(card, kind, -negative_benefit)
@@ -0,0 +1,103 @@
+import sys
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Union
+
+from api.models import CardType, CreditCard, DebitCard, InternationalCard, Sector
+
+Card = Union[DebitCard, CreditCard, InternationalCard]
+
+
+# Compact in-memory card records for the per-user state store. They expose the
+# same attributes the optimizer, registry and ledger read from the Pydantic
+# models, but are slotted (no per-instance __dict__ or validation state), and
+# identical cashback tables are shared read-only between cards, so a process
+# can keep a very large number of portfolios resident. The Pydantic models
+# remain the API/wire format; convert with compact_card/to_model.
+class CardRecord:
+    __slots__ = ("id", "name", "monthly_spend_limit", "current_balance", "month_to_date_spend", "reserved")
+    type: CardType
+
+    def __init__(self, id: str, name: str, monthly_spend_limit: float, current_balance: float,
+                 month_to_date_spend: float = 0.0, reserved: float = 0.0):
+        self.id = sys.intern(id)
+        self.name = sys.intern(name)
+        self.monthly_spend_limit = float(monthly_spend_limit)
+        self.current_balance = float(current_balance)
+        self.month_to_date_spend = float(month_to_date_spend)
+        self.reserved = float(reserved)
+
+    def _base_fields(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "type": self.type,
+            "monthly_spend_limit": self.monthly_spend_limit,
+            "current_balance": self.current_balance,
+            "month_to_date_spend": self.month_to_date_spend,
+            "reserved": self.reserved,
+        }
+
+
+class DebitRecord(CardRecord):
+    __slots__ = ("annual_interest_rate",)
+    type = CardType.DEBIT
+
+    def __init__(self, *args, annual_interest_rate: float, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.annual_interest_rate = float(annual_interest_rate)
+
+    def to_model(self) -> DebitCard:
+        return DebitCard(annual_interest_rate=self.annual_interest_rate, **self._base_fields())
+
+
+class CreditRecord(CardRecord):
+    __slots__ = ("cashback_rates",)
+    type = CardType.CREDIT
+
+    def __init__(self, *args, cashback_rates: Mapping[Sector, float], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cashback_rates = intern_rates(cashback_rates)
+
+    def to_model(self) -> CreditCard:
+        return CreditCard(cashback_rates=dict(self.cashback_rates), **self._base_fields())
+
+
+class InternationalRecord(CardRecord):
+    __slots__ = ("markup_rate", "gbp_conversion", "currency")
+    type = CardType.INTERNATIONAL
+
+    def __init__(self, *args, markup_rate: float, gbp_conversion: float, currency: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.markup_rate = float(markup_rate)
+        self.gbp_conversion = float(gbp_conversion)
+        self.currency = sys.intern(currency) if currency else None
+
+    def to_model(self) -> InternationalCard:
+        return InternationalCard(markup_rate=self.markup_rate, gbp_conversion=self.gbp_conversion,
+                                 currency=self.currency, **self._base_fields())
+
+
+# Cashback tables by content; cards with the same product share one read-only table
+_RATE_TABLES: Dict[tuple, Mapping[Sector, float]] = {}
+
+
+def intern_rates(rates: Mapping[Sector, float]) -> Mapping[Sector, float]:
+    key = tuple(sorted((Sector(sector).value, float(rate)) for sector, rate in rates.items()))
+    table = _RATE_TABLES.get(key)
+    if table is None:
+        table = _RATE_TABLES.setdefault(key, MappingProxyType({Sector(s): r for s, r in key}))
+    return table
+
+
+def compact_card(card: Card) -> CardRecord:
+    if isinstance(card, CardRecord):
+        return card
+    base = dict(id=card.id, name=card.name, monthly_spend_limit=card.monthly_spend_limit,
+                current_balance=card.current_balance, month_to_date_spend=card.month_to_date_spend,
+                reserved=card.reserved)
+    if isinstance(card, CreditCard):
+        return CreditRecord(cashback_rates=card.cashback_rates, **base)
+    if isinstance(card, InternationalCard):
+        return InternationalRecord(markup_rate=card.markup_rate, gbp_conversion=card.gbp_conversion,
+                                   currency=card.currency, **base)
+    return DebitRecord(annual_interest_rate=card.annual_interest_rate, **base)
@@ -0,0 +1,153 @@
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from api.models import DebitCard, CreditCard, InternationalCard
+from api.ranking import CREDIT, DEBIT, INTERNATIONAL
+
+Card = Union[DebitCard, CreditCard, InternationalCard]
+
+# Running totals are adjusted by deltas on every mutation; they are re-summed
+# exactly after this many mutations so float rounding can't accumulate.
+RESUM_EVERY = 1024
+
+
+def card_available_gbp(card: Card, kind: str) -> float:
+    # Month-to-date spend counts against the limit; open holds against both
+    available = min(card.monthly_spend_limit - card.month_to_date_spend, card.current_balance) - card.reserved
+    if kind == INTERNATIONAL:
+        # International balance/limit is in local currency (e.g. INR)
+        # Convert to GBP equivalent for optimization logic
+        return available / card.gbp_conversion
+    return available
+
+
+# Card portfolio with an id -> card index and per-type running totals of
+# balance and available liquidity (min of limit and balance, in GBP). All
+# mutations go through the registry so the totals stay current and lookups
+# and aggregate reads are O(1) regardless of portfolio size.
+class CardRegistry:
+    def __init__(self, debit_cards: List[DebitCard], credit_cards: List[CreditCard], international_cards: List[InternationalCard]):
+        self.debit_cards = debit_cards
+        self.credit_cards = credit_cards
+        self.international_cards = international_cards
+        self._by_id: Dict[str, Tuple[Card, str]] = {}
+        for kind, cards in self._lists().items():
+            for card in cards:
+                self._by_id[card.id] = (card, kind)
+        self._balance: Dict[str, float] = {}
+        self._available: Dict[str, float] = {}
+        self._mutations = 0
+        self.version = 0
+        # Guards the running totals; card fields are guarded by their owners
+        # (e.g. the ledger's per-card locks)
+        self._lock = threading.Lock()
+        # Optional persistence hooks: on_change(card, kind) after a card is
+        # added or updated, on_remove(card, kind) after it is removed
+        self.on_change: Optional[Callable[[Card, str], None]] = None
+        self.on_remove: Optional[Callable[[Card, str], None]] = None
+        self._resum()
+
+    def _lists(self) -> Dict[str, List[Card]]:
+        return {DEBIT: self.debit_cards, CREDIT: self.credit_cards, INTERNATIONAL: self.international_cards}
+
+    def _resum(self):
+        for kind, cards in self._lists().items():
+            self._balance[kind] = math.fsum(card.current_balance for card in cards)
+            self._available[kind] = math.fsum(card_available_gbp(card, kind) for card in cards)
+        self._mutations = 0
+
+    def _mutated(self):
+        self.version += 1
+        self._mutations += 1
+        if self._mutations >= RESUM_EVERY:
+            self._resum()
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self._by_id
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, card_id: str) -> Optional[Card]:
+        entry = self._by_id.get(card_id)
+        return None if entry is None else entry[0]
+
+    def kind_of(self, card_id: str) -> Optional[str]:
+        entry = self._by_id.get(card_id)
+        return None if entry is None else entry[1]
+
+    def add_card(self, card: Card, kind: str):
+        if card.id in self._by_id:
+            raise ValueError(f"Card {card.id} already registered")
+        with self._lock:
+            self._lists()[kind].append(card)
+            self._by_id[card.id] = (card, kind)
+            self._balance[kind] += card.current_balance
+            self._available[kind] += card_available_gbp(card, kind)
+            self._mutated()
+        if self.on_change is not None:
+            self.on_change(card, kind)
+
+    def remove_card(self, card_id: str) -> Optional[Card]:
+        with self._lock:
+            entry = self._by_id.pop(card_id, None)
+            if entry is None:
+                return None
+            card, kind = entry
+            cards = self._lists()[kind]
+            del cards[next(i for i, c in enumerate(cards) if c is card)]
+            self._balance[kind] -= card.current_balance
+            self._available[kind] -= card_available_gbp(card, kind)
+            self._mutated()
+        if self.on_remove is not None:
+            self.on_remove(card, kind)
+        return card
+
+    def _update(self, card_id: str, **fields: float) -> Optional[Card]:
+        entry = self._by_id.get(card_id)
+        if entry is None:
+            return None
+        card, kind = entry
+        with self._lock:
+            old_balance = card.current_balance
+            old_available = card_available_gbp(card, kind)
+            for field, value in fields.items():
+                setattr(card, field, value)
+            self._balance[kind] += card.current_balance - old_balance
+            self._available[kind] += card_available_gbp(card, kind) - old_available
+            self._mutated()
+        if self.on_change is not None:
+            self.on_change(card, kind)
+        return card
+
+    def update_limit(self, card_id: str, new_limit: float) -> Optional[Card]:
+        return self._update(card_id, monthly_spend_limit=new_limit)
+
+    def update_balance(self, card_id: str, new_balance: float) -> Optional[Card]:
+        return self._update(card_id, current_balance=new_balance)
+
+    def update_conversion(self, card_id: str, gbp_conversion: float) -> Optional[Card]:
+        # New FX rate for an international card; its GBP availability follows
+        return self._update(card_id, gbp_conversion=gbp_conversion)
+
+    def update_spend(self, card_id: str, current_balance: float, month_to_date_spend: float, reserved: float) -> Optional[Card]:
+        return self._update(card_id, current_balance=current_balance,
+                            month_to_date_spend=month_to_date_spend, reserved=reserved)
+
+    def total_balance(self, kind: str) -> float:
+        return self._balance[kind]
+
+    def total_available(self, kind: str) -> float:
+        return self._available[kind]
+
+    def totals(self) -> Dict[str, float]:
+        # The TotalBalanceResponse fields
+        return {
+            "total_debit_balance": self._balance[DEBIT],
+            "total_credit_balance": self._balance[CREDIT],
+            "total_gbp_balance": self._balance[DEBIT] + self._balance[CREDIT],
+            "total_debit_available": self._available[DEBIT],
+            "total_credit_available": self._available[CREDIT],
+            "total_international_available_gbp": self._available[INTERNATIONAL],
+        }
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from api.data_seeding import seed_data
+from api.models import ReplayReport, ReplayScenario, ScenarioTotals, TransactionRequest
+from api.optimizer import CardOptimizer
+from api.ranking import RankingIndex
+
+# Log lines handed to a worker at a time
+REPLAY_CHUNK_SIZE = int(os.getenv("REPLAY_CHUNK_SIZE", "2000"))
+
+# The scenario every replay reports, the portfolio exactly as given
+BASELINE = "baseline"
+
+# Per-scenario partial totals as a plain list while replaying (cheap to pickle
+# between processes): transactions, amount, cashback, interest saved,
+# shortfalls, shortfall amount
+_FIELDS = ("transactions", "amount", "cashback", "interest_saved", "shortfalls", "shortfall_amount")
+
+
+def load_scenarios(path: Optional[str]) -> Dict[str, ReplayScenario]:
+    # {"name": {"preferences": {...}, "cards": {"cc_1": {"monthly_spend_limit": 500}}}}
+    scenarios = {BASELINE: ReplayScenario()}
+    if path:
+        with open(path) as f:
+            for name, scenario in json.load(f).items():
+                scenarios[name] = ReplayScenario.model_validate(scenario)
+    return scenarios
+
+
+def build_optimizer(scenario: ReplayScenario, portfolio=None) -> CardOptimizer:
+    debit, credit, international, preferences = portfolio or seed_data()
+    cards = {card.id: card for card in (*debit, *credit, *international)}
+    unknown = set(scenario.cards) - set(cards)
+    if unknown:
+        raise ValueError(f"Scenario overrides unknown cards: {', '.join(sorted(unknown))}")
+
+    def override(card):
+        changes = scenario.cards.get(card.id)
+        return card.model_copy(update=changes.model_dump(exclude_none=True)) if changes else card
+
+    debit = [override(card) for card in debit]
+    credit = [override(card) for card in credit]
+    international = [override(card) for card in international]
+    preferences = scenario.preferences or preferences
+    return CardOptimizer(debit, credit, international, preferences,
+                         ranking=RankingIndex(debit, credit, international, preferences))
+
+
+# One set of optimizers per worker process, built once by the pool initializer
+_optimizers: Dict[str, CardOptimizer] = {}
+
+
+def _init_worker(scenarios: Dict[str, dict]):
+    _optimizers.clear()
+    for name, scenario in scenarios.items():
+        _optimizers[name] = build_optimizer(ReplayScenario.model_validate(scenario))
+
+
+def _replay_chunk(lines: List[str]) -> Tuple[int, Dict[str, list]]:
+    # Every transaction is optimized against each scenario's portfolio as it
+    # stands; replay does not spend down limits between transactions
+    invalid = 0
+    totals = {name: [0, 0.0, 0.0, 0.0, 0, 0.0] for name in _optimizers}
+    for line in lines:
+        try:
+            request = TransactionRequest.model_validate_json(line)
+        except ValidationError:
+            invalid += 1
+            continue
+        for name, optimizer in _optimizers.items():
+            result = optimizer.optimize(request, explain=False)
+            t = totals[name]
+            t[0] += 1
+            t[1] += request.amount
+            for allocation in result.allocations:
+                t[2] += allocation.cashback_points - allocation.interest_saved
+                t[3] += allocation.interest_saved
+            if result.status != "success":
+                t[4] += 1
+                t[5] += request.amount - sum(a.amount_utilised for a in result.allocations)
+    return invalid, totals
+
+
+def chunked(lines: Iterable[str], size: int) -> Iterator[List[str]]:
+    # Blank lines are skipped rather than counted as invalid
+    it = (line for line in lines if line.strip())
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Streams a JSONL log of TransactionRequests through CardOptimizer.optimize
+# (no explanations) for each scenario and returns the aggregated totals.
+#
+# `lines` is consumed lazily and at most 2 * workers chunks are in flight, so
+# memory stays flat however long the log is. workers=0 replays in-process.
+def replay(lines: Iterable[str], scenarios: Optional[Dict[str, ReplayScenario]] = None,
+           workers: Optional[int] = None, chunk_size: int = REPLAY_CHUNK_SIZE) -> ReplayReport:
+    scenarios = scenarios if scenarios is not None else load_scenarios(None)
+    # Fail on a bad scenario before starting any workers
+    for scenario in scenarios.values():
+        build_optimizer(scenario)
+    payload = {name: scenario.model_dump(mode="json") for name, scenario in scenarios.items()}
+
+    report = {name: [0, 0.0, 0.0, 0.0, 0, 0.0] for name in scenarios}
+    counts = {"lines": 0, "invalid": 0}
+
+    def merge(chunk_len: int, result: Tuple[int, Dict[str, list]]):
+        invalid, totals = result
+        counts["lines"] += chunk_len
+        counts["invalid"] += invalid
+        for name, partial in totals.items():
+            report[name] = [a + b for a, b in zip(report[name], partial)]
+
+    if workers == 0:
+        _init_worker(payload)
+        for chunk in chunked(lines, chunk_size):
+            merge(len(chunk), _replay_chunk(chunk))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(payload,)) as pool:
+            pending = deque()
+            for chunk in chunked(lines, chunk_size):
+                if len(pending) >= 2 * workers:
+                    size, future = pending.popleft()
+                    merge(size, future.result())
+                pending.append((len(chunk), pool.submit(_replay_chunk, chunk)))
+            while pending:
+                size, future = pending.popleft()
+                merge(size, future.result())
+
+    return ReplayReport(
+        lines=counts["lines"],
+        invalid=counts["invalid"],
+        scenarios={name: ScenarioTotals(**dict(zip(_FIELDS, totals))) for name, totals in report.items()},
+    )
+
+
+def format_report(report: ReplayReport) -> str:
+    width = max([len(name) for name in report.scenarios] + [8])
+    lines = [f"{report.lines} lines, {report.invalid} invalid",
+             f"{'scenario':<{width}}  {'txns':>8}  {'cashback':>12}  {'interest':>12}  {'shortfalls':>10}  {'unfunded':>12}"]
+    for name, t in report.scenarios.items():
+        lines.append(f"{name:<{width}}  {t.transactions:>8}  {t.cashback:>12.2f}  {t.interest_saved:>12.2f}  "
+                     f"{t.shortfalls:>10}  {t.shortfall_amount:>12.2f}")
+    return "\n".join(lines)
+
+
+# Replays a transaction log against the demo portfolio and any what-if scenarios.
+#
+#   python -m api.replay transactions.jsonl
+#   python -m api.replay transactions.jsonl --scenarios scenarios.json --workers 8
+#   cat transactions.jsonl | python -m api.replay - --json
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a JSONL transaction log through the optimizer")
+    parser.add_argument("log", help="JSONL file of TransactionRequests, or - for stdin")
+    parser.add_argument("--scenarios", help="JSON file of named ReplayScenarios")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count, 0 in-process)")
+    parser.add_argument("--chunk-size", type=int, default=REPLAY_CHUNK_SIZE)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios)
+    if args.log == "-":
+        report = replay(sys.stdin, scenarios, args.workers, args.chunk_size)
+    else:
+        with open(args.log) as f:
+            report = replay(f, scenarios, args.workers, args.chunk_size)
+    print(report.model_dump_json(indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Iterator, Set
+
+from api.state import StateStore, UserState
+from api.storage import SQLiteStore
+
+# Number of version counters; users hash onto them, so a collision only costs
+# an unnecessary reload
+BOARD_BUCKETS = int(os.getenv("OPTIVAULT_BOARD_BUCKETS", "4096"))
+
+_COUNTER = struct.Struct("<Q")
+
+
+# Per-user version counters in a small mmap-backed file shared by every worker
+# process on the host. Layout: BOARD_BUCKETS little-endian uint64 counters,
+# then one byte per bucket used as an fcntl lock for writers of that bucket's
+# users, then one byte locking counter updates.
+#
+# Reading a version is a hash and an 8-byte unpack from the mapping, with no
+# syscall or lock, so checking freshness on every request costs nothing
+# measurable and read throughput scales with the number of workers.
+class VersionBoard:
+    def __init__(self, path: str, buckets: int = BOARD_BUCKETS):
+        self.path = path
+        self.buckets = buckets
+        self._counters_size = buckets * _COUNTER.size
+        size = self._counters_size + buckets + 1
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # fcntl locks are per process, so threads of one worker also need these
+        self._bucket_locks = [threading.Lock() for _ in range(buckets)]
+        self._bump_lock = threading.Lock()
+
+    def bucket(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode()) % self.buckets
+
+    def read(self, user_id: str) -> int:
+        return _COUNTER.unpack_from(self._map, self.bucket(user_id) * _COUNTER.size)[0]
+
+    def bump(self, user_id: str) -> tuple:
+        # Returns (old, new) for the user's bucket
+        offset = self.bucket(user_id) * _COUNTER.size
+        with self._bump_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._counters_size + self.buckets)
+            try:
+                old = _COUNTER.unpack_from(self._map, offset)[0]
+                _COUNTER.pack_into(self._map, offset, old + 1)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._counters_size + self.buckets)
+        return old, old + 1
+
+    @contextmanager
+    def lock(self, user_id: str) -> Iterator[None]:
+        # Exclusive across all workers (and their threads) for the user's bucket
+        bucket = self.bucket(user_id)
+        with self._bucket_locks[bucket]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._counters_size + bucket)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._counters_size + bucket)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+# Keeps per-worker resident states consistent with the shared SQLite database.
+#
+# - Every committed write-behind batch bumps the touched users' counters, so
+#   other workers notice within one flush interval and reload on their next
+#   request for that user.
+# - Mutations run under the user's cross-process lock against a fresh copy and
+#   are flushed before the lock is released, so writes from different workers
+#   (e.g. two ledger commits) are serialised rather than racing on stale state.
+class SharedStateCoordinator:
+    def __init__(self, states: StateStore, storage: SQLiteStore, board: VersionBoard,
+                 loader: Callable[[str], UserState]):
+        self.states = states
+        self.storage = storage
+        self.board = board
+        self.reloads = 0
+
+        def load(user_id: str) -> UserState:
+            # Read the version first: a change landing during the load then
+            # shows up as stale and is picked up on the next request
+            version = board.read(user_id)
+            state = loader(user_id)
+            state.board_version = version
+            return state
+
+        # An evicted user's queued rows land before it can be loaded again
+        states.reset(load, on_evict=lambda state: storage.flush())
+        storage.on_flushed = self._flushed
+
+    def _flushed(self, user_ids: Set[str]):
+        for user_id in user_ids:
+            old, new = self.board.bump(user_id)
+            state = self.states.peek(user_id)
+            # Our own write: stay current unless another worker moved the bucket too
+            if state is not None and state.board_version == old:
+                state.board_version = new
+
+    def stale(self, user_id: str) -> bool:
+        # Whether the resident copy of the user is behind another worker's write
+        state = self.states.peek(user_id)
+        return state is not None and self.board.read(user_id) != state.board_version
+
+    def get(self, user_id: str) -> UserState:
+        state = self.states.get(user_id)
+        if self.board.read(user_id) != state.board_version:
+            self.reloads += 1
+            state = self.states.reload(user_id)
+        return state
+
+    @contextmanager
+    def exclusive(self, user_id: str) -> Iterator[UserState]:
+        with self.board.lock(user_id):
+            try:
+                yield self.get(user_id)
+            finally:
+                # Whatever the change got to apply lands before another worker can look
+                self.storage.flush()
@@ -0,0 +1,289 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
+from typing import Callable, Dict, List, Optional
+
+from api.curves import CurveEngine
+from api.data_seeding import seed_data
+from api.fx import FxRateTable
+from api.ledger import SpendLedger, month_key
+from api.models import HoldStatus, UserPreferences
+from api.optimizer import CardOptimizer
+from api.projection import ProjectionEngine
+from api.ranking import RankingIndex, CREDIT, DEBIT, INTERNATIONAL
+from api.records import Card, compact_card
+from api.registry import CardRegistry
+from api.storage import SQLiteStore
+
+# Portfolios kept resident; the least recently used are evicted beyond this
+USER_STATE_CACHE_SIZE = int(os.getenv("USER_STATE_CACHE_SIZE", "10000"))
+
+DEFAULT_USER_ID = "demo"
+
+
+# Everything the API keeps for one user: compact card records, preferences and
+# the structures derived from them (registry totals, ranking index, spend
+# ledger, what-if curves). With a `storage` backend every card, preference,
+# hold and rollover change is queued for write-behind as it happens.
+#
+# Only the cards and registry are built up front. The ranking index (most of
+# a portfolio's memory) and the spend ledger are built on first use, so the
+# many resident users that are only read (totals, feed) stay small.
+class UserState:
+    def __init__(self, user_id: str, debit_cards: List[Card], credit_cards: List[Card],
+                 international_cards: List[Card], preferences: UserPreferences,
+                 storage: Optional[SQLiteStore] = None, positions: Optional[Dict[str, int]] = None,
+                 ledger_month: Optional[str] = None):
+        self.user_id = user_id
+        self.debit_cards = [compact_card(c) for c in debit_cards]
+        self.credit_cards = [compact_card(c) for c in credit_cards]
+        self.international_cards = [compact_card(c) for c in international_cards]
+        self.preferences = preferences
+        self.registry = CardRegistry(self.debit_cards, self.credit_cards, self.international_cards)
+        # Month the stored month-to-date spend belongs to, until the ledger is built
+        self._ledger_month = ledger_month
+
+        # Stored row order of each card; new cards go after all existing ones
+        cards = self.debit_cards + self.credit_cards + self.international_cards
+        self._positions = positions if positions is not None else {c.id: i for i, c in enumerate(cards)}
+        self._next_position = max(self._positions.values(), default=-1) + 1
+
+        self.storage = storage
+        # Changed since loaded and not backed by storage: evicting would lose it
+        self.modified = False
+        # Shared version of this user's bucket when loaded (multi-worker mode)
+        self.board_version = 0
+        # FX table version last applied to the international cards
+        self.fx_version: Optional[int] = None
+        # Optional hook: on_change(user_id, card_id) after a card is added,
+        # updated or removed, with card_id None when the preferences change
+        self.on_change: Optional[Callable[[str, Optional[str]], None]] = None
+        self.registry.on_change = self._save_card
+        self.registry.on_remove = self._delete_card
+
+    @cached_property
+    def ranking(self) -> RankingIndex:
+        return RankingIndex(self.debit_cards, self.credit_cards, self.international_cards, self.preferences)
+
+    @cached_property
+    def ledger(self) -> SpendLedger:
+        ledger = SpendLedger(self.registry, month=self._ledger_month)
+        ledger.on_hold = self._save_hold
+        ledger.on_rollover = lambda month: self._save_user()
+        return ledger
+
+    @property
+    def month(self) -> str:
+        # The ledger's month, without building the ledger
+        if "ledger" in self.__dict__:
+            return self.ledger.month
+        return self._ledger_month or month_key(time.time())
+
+    def update_ranking(self, card_id: str):
+        # After a card's rates change; an unbuilt index will read them when built
+        if "ranking" in self.__dict__:
+            self.ranking.update_card(card_id)
+
+    def refresh_ledger(self):
+        # Ledger housekeeping, for users that have a ledger or need one now
+        if "ledger" in self.__dict__ or self._ledger_month not in (None, month_key(time.time())):
+            self.ledger.refresh()
+
+    @property
+    def evictable(self) -> bool:
+        # With storage every change is queued for write-behind (and the store
+        # flushes on eviction), so any state can go; without it only untouched ones
+        return self.storage is not None or not self.modified
+
+    def _save_card(self, card: Card, kind: str):
+        if self.on_change is not None:
+            self.on_change(self.user_id, card.id)
+        if self.storage is None:
+            self.modified = True
+            return
+        position = self._positions.get(card.id)
+        if position is None:
+            position = self._positions[card.id] = self._next_position
+            self._next_position += 1
+        self.storage.save_card(self.user_id, card, kind, position)
+
+    def _delete_card(self, card: Card, kind: str):
+        if self.on_change is not None:
+            self.on_change(self.user_id, card.id)
+        if self.storage is None:
+            self.modified = True
+            return
+        self.storage.delete_card(self.user_id, card.id)
+
+    def _save_hold(self, hold):
+        if self.storage is None:
+            self.modified = True
+            return
+        if hold.status == HoldStatus.RESERVED:
+            self.storage.save_hold(self.user_id, hold.hold_id, hold.amounts, hold.created_at)
+        else:
+            self.storage.delete_hold(self.user_id, hold.hold_id)
+
+    def _save_user(self):
+        if self.storage is None:
+            self.modified = True
+            return
+        self.storage.save_user(self.user_id, self.preferences, self.month)
+
+    # Only built for users that ask for what-if curves
+    @cached_property
+    def curves(self) -> CurveEngine:
+        return CurveEngine(self.registry, self.ranking)
+
+    @cached_property
+    def projections(self) -> ProjectionEngine:
+        return ProjectionEngine(self.registry, self.ranking)
+
+    def optimizer(self) -> CardOptimizer:
+        return CardOptimizer(self.debit_cards, self.credit_cards, self.international_cards,
+                             self.preferences, ranking=self.ranking)
+
+    def apply_rates(self, rates: FxRateTable):
+        # Cards naming a currency follow the shared rate table. Applied once per
+        # table version, so between refreshes this is a single comparison.
+        for card_id, rate in self._rate_changes(rates):
+            self.registry.update_conversion(card_id, rate)
+        self.fx_version = rates.version
+
+    def _rate_changes(self, rates: FxRateTable) -> List[tuple]:
+        if self.fx_version == rates.version:
+            return []
+        changes = []
+        for card in list(self.international_cards):
+            rate = rates.rate(card.currency) if card.currency else None
+            if rate is not None and rate != card.gbp_conversion:
+                changes.append((card.id, rate))
+        if not changes:
+            self.fx_version = rates.version
+        return changes
+
+    def housekeeping_due(self, rates: FxRateTable) -> bool:
+        # True when refresh_ledger() or apply_rates() would write to any card
+        if "ledger" in self.__dict__:
+            due = self.ledger.due()
+        else:
+            due = self._ledger_month not in (None, month_key(time.time()))
+        return due or bool(self._rate_changes(rates))
+
+    def set_preferences(self, preferences: UserPreferences):
+        self.preferences = preferences
+        if "ranking" in self.__dict__:
+            self.ranking.set_preferences(preferences)
+        self._save_user()
+        if self.on_change is not None:
+            self.on_change(self.user_id, None)
+
+
+def seed_user_state(user_id: str) -> UserState:
+    # Until users have stored portfolios, everyone starts from the demo fixture
+    debit, credit, international, preferences = seed_data()
+    return UserState(user_id, debit, credit, international, preferences)
+
+
+def storage_loader(storage: SQLiteStore) -> Callable[[str], UserState]:
+    # Loads users from SQLite; unknown users get the demo fixture, stored on first use
+    def load(user_id: str) -> UserState:
+        stored = storage.load_user(user_id)
+        if stored is None:
+            seed = seed_user_state(user_id)
+            cards = ([(c, DEBIT) for c in seed.debit_cards] + [(c, CREDIT) for c in seed.credit_cards]
+                     + [(c, INTERNATIONAL) for c in seed.international_cards])
+            storage.create_user(user_id, seed.preferences, seed.month, cards)
+            stored = storage.load_user(user_id)
+        state = UserState(user_id, stored.cards[DEBIT], stored.cards[CREDIT], stored.cards[INTERNATIONAL],
+                          stored.preferences, storage=storage, positions=stored.positions,
+                          ledger_month=stored.ledger_month)
+        for hold_id, amounts, created_at in stored.holds:
+            state.ledger.restore(hold_id, amounts, created_at)
+        return state
+    return load
+
+
+# LRU of resident UserStates keyed by user id. Misses call `loader`; beyond
+# `maxsize` the least recently used evictable states are dropped and handed to
+# `on_evict`. States holding changes that exist nowhere else (no storage) are
+# never evicted, so the store can grow past `maxsize` by those alone.
+# Loading happens outside the lock; if two requests race to load the same user
+# the first state inserted wins and the other is discarded.
+class StateStore:
+    def __init__(self, loader: Callable[[str], UserState] = seed_user_state, maxsize: int = USER_STATE_CACHE_SIZE,
+                 on_evict: Optional[Callable[[UserState], None]] = None):
+        self.maxsize = maxsize
+        self._loader = loader
+        self._on_evict = on_evict
+        self._states: "OrderedDict[str, UserState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> UserState:
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None:
+                self._states.move_to_end(user_id)
+                self.hits += 1
+                return state
+
+        loaded = self._loader(user_id)
+        evicted = []
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is None:
+                state = self._states[user_id] = loaded
+                self.loads += 1
+                evicted = self._evict(keep=user_id)
+        if self._on_evict is not None:
+            for old in evicted:
+                self._on_evict(old)
+        return state
+
+    def _evict(self, keep: str) -> List[UserState]:
+        evicted = []
+        excess = len(self._states) - self.maxsize
+        if excess <= 0:
+            return evicted
+        for user_id, state in list(self._states.items()):
+            if state.evictable and user_id != keep:
+                evicted.append(self._states.pop(user_id))
+                if len(evicted) == excess:
+                    break
+        self.evictions += len(evicted)
+        return evicted
+
+    def reload(self, user_id: str) -> UserState:
+        # Drop the resident copy and load the user again
+        with self._lock:
+            self._states.pop(user_id, None)
+        return self.get(user_id)
+
+    def reset(self, loader: Callable[[str], UserState], on_evict: Optional[Callable[[UserState], None]] = None):
+        # Switch loaders (e.g. once storage is opened); resident states are dropped
+        with self._lock:
+            self._loader = loader
+            self._on_evict = on_evict
+            self._states.clear()
+
+    def peek(self, user_id: str) -> Optional[UserState]:
+        with self._lock:
+            return self._states.get(user_id)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._states),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,370 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from api.models import Sector, UserPreferences
+from api.ranking import CREDIT, DEBIT, INTERNATIONAL
+from api.records import CardRecord, CreditRecord, DebitRecord, InternationalRecord
+
+logger = logging.getLogger(__name__)
+
+# Persistence is opt-in: unset or empty keeps all state in memory
+DB_PATH = os.getenv("OPTIVAULT_DB_PATH", "")
+DB_POOL_SIZE = int(os.getenv("OPTIVAULT_DB_POOL_SIZE", "4"))
+# Pending writes are flushed in one transaction at most this often
+FLUSH_INTERVAL = float(os.getenv("OPTIVAULT_FLUSH_INTERVAL_MS", "50")) / 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    preferences TEXT NOT NULL,
+    ledger_month TEXT
+);
+CREATE TABLE IF NOT EXISTS cards (
+    user_id TEXT NOT NULL,
+    card_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    monthly_spend_limit REAL NOT NULL,
+    current_balance REAL NOT NULL,
+    month_to_date_spend REAL NOT NULL DEFAULT 0,
+    reserved REAL NOT NULL DEFAULT 0,
+    annual_interest_rate REAL,
+    cashback_rates TEXT,
+    markup_rate REAL,
+    gbp_conversion REAL,
+    currency TEXT,
+    PRIMARY KEY (user_id, card_id)
+);
+CREATE TABLE IF NOT EXISTS holds (
+    hold_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    amounts TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS holds_by_user ON holds (user_id, created_at);
+CREATE TABLE IF NOT EXISTS decisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    status TEXT NOT NULL,
+    commit_mode TEXT NOT NULL,
+    hold_id TEXT,
+    allocations TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    user_id TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    response TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key)
+);
+CREATE INDEX IF NOT EXISTS idempotency_by_expiry ON idempotency (expires_at);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL only fsyncs at checkpoints; a crash can lose the last
+    # transactions but never corrupts the database
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = DB_POOL_SIZE):
+        self._connections: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(size):
+            self._connections.put(connect(path))
+        self.size = size
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+    def close(self):
+        for _ in range(self.size):
+            self._connections.get().close()
+
+
+def card_row(user_id: str, card: CardRecord, kind: str, position: int) -> tuple:
+    return (
+        user_id, card.id, kind, position, card.name, card.monthly_spend_limit, card.current_balance,
+        card.month_to_date_spend, card.reserved,
+        getattr(card, "annual_interest_rate", None),
+        json.dumps({s.value: r for s, r in card.cashback_rates.items()}) if kind == CREDIT else None,
+        getattr(card, "markup_rate", None),
+        getattr(card, "gbp_conversion", None),
+        getattr(card, "currency", None),
+    )
+
+
+def card_from_row(row) -> Tuple[str, int, CardRecord]:
+    (_, card_id, kind, position, name, limit, balance, spent, reserved, interest, cashback, markup, conversion,
+     currency) = row
+    base = dict(id=card_id, name=name, monthly_spend_limit=limit, current_balance=balance,
+                month_to_date_spend=spent, reserved=reserved)
+    if kind == CREDIT:
+        rates = {Sector(s): r for s, r in json.loads(cashback).items()}
+        return kind, position, CreditRecord(cashback_rates=rates, **base)
+    if kind == INTERNATIONAL:
+        return kind, position, InternationalRecord(markup_rate=markup, gbp_conversion=conversion,
+                                                        currency=currency, **base)
+    return kind, position, DebitRecord(annual_interest_rate=interest, **base)
+
+
+class StoredUser:
+    __slots__ = ("cards", "positions", "preferences", "ledger_month", "holds")
+
+    def __init__(self, cards, positions, preferences, ledger_month, holds):
+        # {kind: [CardRecord, ...]} in portfolio order, and card_id -> stored position
+        self.cards = cards
+        self.positions = positions
+        self.preferences = preferences
+        self.ledger_month = ledger_month
+        # [(hold_id, {card_id: amount}, created_at), ...] oldest first
+        self.holds = holds
+
+
+# SQLite (WAL) persistence for portfolios, preferences, open holds,
+# optimization decisions and the responses of idempotent commits.
+#
+# The in-memory StateStore stays the read path; SQLite is only read when a user
+# is loaded (or a commit checks its Idempotency-Key). Writes are recorded on the request thread as plain tuples keyed by
+# row (so repeated updates to a card coalesce into one) and a write-behind
+# thread flushes them in a single transaction every FLUSH_INTERVAL, keeping
+# disk I/O off the request path.
+class SQLiteStore:
+    def __init__(self, path: str = DB_PATH, pool_size: int = DB_POOL_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pool = ConnectionPool(path, pool_size)
+        with self._pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(cards)")}
+            if "currency" not in columns:
+                # Databases created before cards had a currency
+                conn.execute("ALTER TABLE cards ADD COLUMN currency TEXT")
+
+        self._pending_lock = threading.Lock()
+        # A value of None deletes the row
+        self._cards: Dict[Tuple[str, str], Optional[tuple]] = {}
+        self._users: Dict[str, tuple] = {}
+        self._holds: Dict[str, Optional[tuple]] = {}
+        self._decisions: List[tuple] = []
+        # (user_id, Idempotency-Key) -> stored response row
+        self._responses: Dict[Tuple[str, str], tuple] = {}
+        # Users whose state rows are in the pending batch
+        self._touched: Set[str] = set()
+        # Optional hook called with those user ids after each batch commits
+        self.on_flushed: Optional[Callable[[Set[str]], None]] = None
+        # Serialises flushes so an older batch can never land after a newer one
+        self._write_lock = threading.Lock()
+
+        self.flushes = 0
+        self.rows_written = 0
+        self.write_errors = 0
+        self._closed = threading.Event()
+        self._wake = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="sqlite-write-behind", daemon=True)
+        self._writer.start()
+
+    # --- write path (request thread): record the latest row values ---
+
+    def save_card(self, user_id: str, card: CardRecord, kind: str, position: int):
+        row = card_row(user_id, card, kind, position)
+        with self._pending_lock:
+            self._cards[(user_id, card.id)] = row
+            self._touched.add(user_id)
+
+    def delete_card(self, user_id: str, card_id: str):
+        with self._pending_lock:
+            self._cards[(user_id, card_id)] = None
+            self._touched.add(user_id)
+
+    def save_user(self, user_id: str, preferences: UserPreferences, ledger_month: Optional[str]):
+        row = (user_id, json.dumps([s.value for s in preferences.point_priority]), ledger_month)
+        with self._pending_lock:
+            self._users[user_id] = row
+            self._touched.add(user_id)
+
+    def save_hold(self, user_id: str, hold_id: str, amounts: Dict[str, float], created_at: float):
+        row = (hold_id, user_id, json.dumps(amounts), created_at)
+        with self._pending_lock:
+            self._holds[hold_id] = row
+            self._touched.add(user_id)
+
+    def delete_hold(self, user_id: str, hold_id: str):
+        with self._pending_lock:
+            self._holds[hold_id] = None
+            self._touched.add(user_id)
+
+    def record_decision(self, user_id: str, category: Sector, amount: float, status: str,
+                        commit_mode: str, hold_id: Optional[str], allocations: List[Tuple[str, float]]):
+        # Serialised by the writer thread
+        with self._pending_lock:
+            self._decisions.append((user_id, time.time(), Sector(category).value, amount, status,
+                                    commit_mode, hold_id, allocations))
+
+    def save_response(self, user_id: str, key: str, fingerprint: str, response: str, expires_at: float):
+        # Queued like any other row: saved inside a user's lock, it lands in the
+        # same transaction as the ledger changes it describes
+        with self._pending_lock:
+            self._responses[(user_id, key)] = (user_id, key, fingerprint, response, expires_at)
+
+    def load_response(self, user_id: str, key: str) -> Optional[Tuple[str, str]]:
+        # (fingerprint, response) stored for the key and not yet expired
+        with self._pending_lock:
+            row = self._responses.get((user_id, key))
+        if row is not None:
+            return row[2], row[3]
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT fingerprint, response FROM idempotency"
+                " WHERE user_id = ? AND idempotency_key = ? AND expires_at > ?",
+                (user_id, key, time.time())).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    # --- write-behind ---
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                self.write_errors += 1
+                logger.exception("Write-behind flush failed; will retry")
+
+    def _pending(self) -> bool:
+        return bool(self._cards or self._users or self._holds or self._decisions or self._responses)
+
+    def flush(self):
+        with self._write_lock:
+            with self._pending_lock:
+                if not self._pending():
+                    return
+                cards, self._cards = self._cards, {}
+                users, self._users = self._users, {}
+                holds, self._holds = self._holds, {}
+                decisions, self._decisions = self._decisions, []
+                responses, self._responses = self._responses, {}
+                touched, self._touched = self._touched, set()
+            try:
+                self._write(cards, users, holds, decisions, responses)
+            except sqlite3.Error:
+                # Put the batch back underneath anything newer that arrived meanwhile
+                with self._pending_lock:
+                    self._cards = {**cards, **self._cards}
+                    self._users = {**users, **self._users}
+                    self._holds = {**holds, **self._holds}
+                    self._decisions = decisions + self._decisions
+                    self._responses = {**responses, **self._responses}
+                    self._touched |= touched
+                raise
+            if touched and self.on_flushed is not None:
+                self.on_flushed(touched)
+
+    def _write(self, cards, users, holds, decisions, responses):
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?)", list(users.values()))
+                upserts = [row for row in cards.values() if row is not None]
+                conn.executemany("INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", upserts)
+                conn.executemany("DELETE FROM cards WHERE user_id = ? AND card_id = ?",
+                                 [key for key, row in cards.items() if row is None])
+                conn.executemany("INSERT OR REPLACE INTO holds VALUES (?, ?, ?, ?)",
+                                 [row for row in holds.values() if row is not None])
+                conn.executemany("DELETE FROM holds WHERE hold_id = ?",
+                                 [(hold_id,) for hold_id, row in holds.items() if row is None])
+                conn.executemany(
+                    "INSERT INTO decisions (user_id, created_at, category, amount, status, commit_mode, hold_id, allocations)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(*d[:7], json.dumps(d[7])) for d in decisions])
+                conn.executemany("INSERT OR REPLACE INTO idempotency VALUES (?, ?, ?, ?, ?)", list(responses.values()))
+                if responses:
+                    conn.execute("DELETE FROM idempotency WHERE expires_at <= ?", (time.time(),))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        self.flushes += 1
+        self.rows_written += len(users) + len(cards) + len(holds) + len(decisions) + len(responses)
+
+    def create_user(self, user_id: str, preferences: UserPreferences, ledger_month: Optional[str],
+                    cards: List[Tuple[CardRecord, str]]):
+        # Written synchronously and only if the user doesn't exist yet, so
+        # concurrent first loads (e.g. in two workers) agree on one portfolio
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                created = conn.execute(
+                    "INSERT OR IGNORE INTO users VALUES (?, ?, ?)",
+                    (user_id, json.dumps([s.value for s in preferences.point_priority]), ledger_month)).rowcount
+                if created:
+                    conn.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     [card_row(user_id, card, kind, i) for i, (card, kind) in enumerate(cards)])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    # --- read path (user load) ---
+
+    def load_user(self, user_id: str) -> Optional[StoredUser]:
+        # Doesn't flush first: pending rows may have been queued from a copy that
+        # is stale by now, and writing them here would undo newer commits
+        with self._pool.connection() as conn:
+            user = conn.execute("SELECT preferences, ledger_month FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if user is None:
+                return None
+            rows = conn.execute("SELECT * FROM cards WHERE user_id = ? ORDER BY position", (user_id,)).fetchall()
+            holds = conn.execute("SELECT hold_id, amounts, created_at FROM holds WHERE user_id = ? ORDER BY created_at",
+                                 (user_id,)).fetchall()
+        cards = {DEBIT: [], CREDIT: [], INTERNATIONAL: []}
+        positions = {}
+        for row in rows:
+            kind, position, card = card_from_row(row)
+            cards[kind].append(card)
+            positions[card.id] = position
+        preferences = UserPreferences(point_priority=json.loads(user[0]))
+        return StoredUser(cards, positions, preferences, user[1], [(h[0], json.loads(h[1]), h[2]) for h in holds])
+
+    def decision_count(self, user_id: str) -> int:
+        self.flush()
+        with self._pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM decisions WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            pending = (len(self._cards) + len(self._users) + len(self._holds) + len(self._decisions)
+                       + len(self._responses))
+        return {"path": self.path, "pending": pending, "flushes": self.flushes,
+                "rows_written": self.rows_written, "write_errors": self.write_errors}
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._wake.set()
+        self._writer.join()
+        self.flush()
+        self._pool.close()
@@ -0,0 +1,46 @@
+from typing import List
+
+from api.models import Allocation, Sector
+
+
+def _money(value: float) -> str:
+    return f"£{value:,.2f}"
+
+
+def _join(items: List[str]) -> str:
+    if len(items) == 1:
+        return items[0]
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+# Deterministic, offline explanation built straight from the allocation fields.
+# Used whenever the LLM is unavailable, too slow for the request's latency
+# budget, or disabled; it runs in microseconds and never fails.
+def template_explanation(allocations: List[Allocation], total_amount: float, category: Sector, mode: str) -> str:
+    sector = Sector(category).value
+    if not allocations:
+        return f"No funding source could cover this {_money(total_amount)} {sector} payment."
+
+    if len(allocations) == 1:
+        sentences = [f"Your {_money(total_amount)} {sector} payment goes entirely on {allocations[0].card_name}."]
+    else:
+        parts = [f"{a.card_name} ({_money(a.amount_utilised)})" for a in allocations]
+        sentences = [f"Your {_money(total_amount)} {sector} payment is split across {len(allocations)} sources: {_join(parts)}."]
+
+    cashback = sum(a.cashback_points - a.interest_saved for a in allocations if a.cashback_sector is not None)
+    net_savings = sum(a.interest_saved for a in allocations)
+
+    benefits = []
+    if cashback > 0:
+        benefits.append(f"earns {_money(cashback)} cashback on {sector} spend")
+    if net_savings > 0:
+        benefits.append(f"keeps {_money(net_savings)} in Net Savings by leaving your best savings balance untouched")
+    elif net_savings < 0:
+        benefits.append(f"costs {_money(-net_savings)} in lost interest or FX markup")
+    if benefits:
+        sentences.append(f"This {_join(benefits)}.")
+
+    if mode == "interest_only":
+        sentences.append("For this category only your debit accounts are used, to protect the interest you earn.")
+
+    return " ".join(sentences[:3])
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+import main
+from api.explanations import ExplanationService
+from benchmarks.harness import summarize
+from llm.async_client import AsyncLLMClient
+from llm.fake_groq import create_fake_groq_app
+
+BALANCED = ("shopping", "hotel", "travel", "fuel")
+
+
+def distinct(i: int, offset: int = 0) -> dict:
+    # A different whole-pound amount/sector per request; the explanation cache
+    # still answers amounts in an already explained band, as it would live
+    return {"amount": 60 + offset + i // len(BALANCED), "category": BALANCED[i % len(BALANCED)]}
+
+
+# (name, method, path, body for request i)
+SCENARIOS = (
+    ("total_balance", "GET", "/api/cards/total-balance", None),
+    ("optimize/no_explanation", "POST", "/api/optimize-transaction?explanation=none",
+     lambda i: {"amount": 120 + i % 500, "category": "hotel"}),
+    ("optimize/inline_llm", "POST", "/api/optimize-transaction", distinct),
+    ("optimize/deferred_llm", "POST", "/api/optimize-transaction?explanation=deferred",
+     lambda i: distinct(i, offset=700)),
+    ("optimize_batch/100", "POST", "/api/optimize-batch",
+     lambda i: [{"amount": 20 + (i + j) % 900, "category": "fuel"} for j in range(100)]),
+)
+
+
+async def _load(client: httpx.AsyncClient, method: str, path: str, body: Optional[Callable[[int], object]],
+                requests: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    counter = iter(range(requests))
+    clock = time.perf_counter
+
+    async def worker():
+        for i in counter:
+            t0 = clock()
+            response = await client.request(method, path, json=body(i) if body else None,
+                                            headers={"X-User-Id": "bench"})
+            latencies.append(clock() - t0)
+            if response.status_code != 200:
+                raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.text}")
+
+    started = clock()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, clock() - started)
+
+
+async def _run(requests: int, concurrency: int, llm_latency: float, only: Optional[List[str]]):
+    # The app runs in-process over ASGI, with the Groq client pointed at the
+    # local fake (a fixed `llm_latency` per completion)
+    fake = create_fake_groq_app(latency=llm_latency)
+    llm = AsyncLLMClient(api_key="bench", base_url="http://fake-groq", max_retries=0,
+                         transport=httpx.ASGITransport(app=fake))
+    saved = main.explanation_service
+    main.explanation_service = ExplanationService(llm=llm)
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, method, path, body in SCENARIOS:
+                if only and name not in only:
+                    continue
+                # Warm up (user load, ranking, connection pool) before measuring
+                await _load(client, method, path, body, requests=concurrency, concurrency=concurrency)
+                results[f"http/{name}"] = await _load(client, method, path, body, requests, concurrency)
+        await main.explanation_service.shutdown()
+    finally:
+        main.explanation_service = saved
+    return results
+
+
+def run(requests: int = 2000, concurrency: int = 50, llm_latency: float = 0.2,
+        only: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    return asyncio.run(_run(requests, concurrency, llm_latency, only))
@@ -0,0 +1,55 @@
+from typing import Dict, Iterable
+
+from api.data_seeding import seed_data
+from api.models import Sector, TransactionRequest
+from api.optimizer import CardOptimizer
+from api.ranking import RankingIndex
+from benchmarks.harness import measure
+
+# Funding sources per portfolio; 8 is the demo fixture
+PORTFOLIO_SIZES = (8, 100, 1000, 10000)
+
+# (label, amount, sector): under £50 takes the single-card path, the others
+# split; grocery is an interest_only sector (debit accounts only)
+CASES = (
+    ("single", 20.0, Sector.HOTEL),
+    ("split", 2500.0, Sector.SHOPPING),
+    ("interest_only", 900.0, Sector.GROCERY),
+)
+
+
+def portfolio(size: int):
+    # The demo fixture repeated (with unique ids and varied rates) up to `size` sources
+    debit, credit, international, prefs = seed_data()
+    if size <= len(debit) + len(credit) + len(international):
+        return debit, credit, international, prefs
+    each = size // 3
+    debits = [debit[i % len(debit)].model_copy(update={
+        "id": f"dc_{i}", "annual_interest_rate": 0.01 + (i % 9) / 200}) for i in range(each)]
+    credits = [credit[i % len(credit)].model_copy(update={
+        "id": f"cc_{i}", "cashback_rates": {s: r * (1 + (i % 5) / 10) for s, r in credit[i % len(credit)].cashback_rates.items()}})
+        for i in range(each)]
+    intl = [international[0].model_copy(update={"id": f"ic_{i}", "markup_rate": 0.02 + (i % 4) / 100})
+            for i in range(size - 2 * each)]
+    return debits, credits, intl, prefs
+
+
+def run(sizes: Iterable[int] = PORTFOLIO_SIZES, iterations: int = 2000) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for size in sizes:
+        debit, credit, international, prefs = portfolio(size)
+        index = RankingIndex(debit, credit, international, prefs)
+        optimizers = {
+            # The API path: a persistent index kept per user
+            "index": CardOptimizer(debit, credit, international, prefs, ranking=index),
+            # One-off optimizers select sources lazily from a heap
+            "heap": CardOptimizer(debit, credit, international, prefs),
+        }
+        # Large portfolios get fewer iterations so a full run stays short
+        n = max(iterations * 100 // max(size, 100), 50)
+        for label, amount, category in CASES:
+            request = TransactionRequest(amount=amount, category=category)
+            for ranking, optimizer in optimizers.items():
+                results[f"optimize/{size}/{label}/{ranking}"] = measure(
+                    lambda: optimizer.optimize(request, explain=False), iterations=n)
+    return results
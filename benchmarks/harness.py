@@ -0,0 +1,84 @@
+import json
+import math
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+# Stored results to compare against, one entry per benchmark name
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# A benchmark whose p50 is more than this much slower than its baseline is a regression
+REGRESSION_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    # Nearest-rank percentile of already sorted samples
+    if not sorted_samples:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_samples)) - 1, 0)
+    return sorted_samples[min(rank, len(sorted_samples) - 1)]
+
+
+def summarize(samples: List[float], wall: float) -> Dict[str, float]:
+    # `samples` are per-operation latencies and `wall` the elapsed time for all
+    # of them, both in seconds; throughput is ops over wall time, so
+    # concurrent load reports what the server sustained
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "ops_per_sec": len(ordered) / wall if wall > 0 else 0.0,
+        "p50_us": percentile(ordered, 50) * 1e6,
+        "p99_us": percentile(ordered, 99) * 1e6,
+        "mean_us": sum(ordered) / len(ordered) * 1e6 if ordered else 0.0,
+    }
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 10) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    clock = time.perf_counter
+    started = clock()
+    for _ in range(iterations):
+        t0 = clock()
+        fn()
+        samples.append(clock() - t0)
+    return summarize(samples, clock() - started)
+
+
+def load_baselines(path: str = BASELINE_PATH) -> Dict[str, Dict[str, float]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(results: Dict[str, Dict[str, float]], path: str = BASELINE_PATH):
+    # Merged into the existing file, so one group can be re-baselined alone
+    baselines = load_baselines(path)
+    baselines.update(results)
+    with open(path, "w") as f:
+        json.dump(dict(sorted(baselines.items())), f, indent=2)
+        f.write("\n")
+
+
+def regressions(results: Dict[str, Dict[str, float]], baselines: Dict[str, Dict[str, float]],
+                tolerance: float = REGRESSION_TOLERANCE) -> List[tuple]:
+    # (name, baseline p50, current p50) for every benchmark slower than allowed
+    slower = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline and result["p50_us"] > baseline["p50_us"] * (1 + tolerance):
+            slower.append((name, baseline["p50_us"], result["p50_us"]))
+    return slower
+
+
+def report(results: Dict[str, Dict[str, float]], baselines: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    baselines = baselines or {}
+    width = max([len(name) for name in results] + [9])
+    lines = [f"{'benchmark':<{width}}  {'ops/s':>10}  {'p50 us':>10}  {'p99 us':>10}  {'vs base':>8}"]
+    for name, r in results.items():
+        base = baselines.get(name)
+        change = f"{r['p50_us'] / base['p50_us'] - 1:+.0%}" if base and base["p50_us"] else "-"
+        lines.append(f"{name:<{width}}  {r['ops_per_sec']:>10.0f}  {r['p50_us']:>10.1f}  {r['p99_us']:>10.1f}  {change:>8}")
+    return "\n".join(lines)
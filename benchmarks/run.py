@@ -0,0 +1,49 @@
+import argparse
+import sys
+
+from benchmarks import bench_http, bench_optimizer
+from benchmarks.harness import BASELINE_PATH, REGRESSION_TOLERANCE, load_baselines, regressions, report, save_baselines
+
+
+# Runs the optimizer microbenchmarks and the in-process HTTP load test, prints
+# throughput and p50/p99 next to the stored baselines, and optionally saves
+# new baselines or fails on regressions.
+#
+#   python -m benchmarks.run                 # everything, compared with baselines.json
+#   python -m benchmarks.run --quick --check # short run, exit 1 on a p50 regression
+#   python -m benchmarks.run --only http --llm-latency 0.5 --save
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="OptiVault benchmarks")
+    parser.add_argument("--only", choices=("optimizer", "http"))
+    parser.add_argument("--quick", action="store_true", help="fewer iterations and requests")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake Groq completion")
+    parser.add_argument("--baselines", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="store these results as the baselines")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any p50 regressed")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.only in (None, "optimizer"):
+        results.update(bench_optimizer.run(iterations=200 if args.quick else 2000))
+    if args.only in (None, "http"):
+        requests = min(args.requests, 200) if args.quick else args.requests
+        results.update(bench_http.run(requests=requests, concurrency=args.concurrency, llm_latency=args.llm_latency))
+
+    baselines = load_baselines(args.baselines)
+    print(report(results, baselines))
+    if args.save:
+        save_baselines(results, args.baselines)
+        print(f"Saved {len(results)} baselines to {args.baselines}")
+    if args.check:
+        slower = regressions(results, baselines, args.tolerance)
+        for name, base, current in slower:
+            print(f"REGRESSION {name}: p50 {base:.1f}us -> {current:.1f}us", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List
+
+from llm.async_client import GROQ_MAX_INFLIGHT
+
+# Interactive requests allowed to wait for an LLM slot; beyond this they are shed
+LLM_QUEUE_DEPTH = int(os.getenv("LLM_QUEUE_DEPTH", "64"))
+
+# Longest an interactive request waits in the queue before it is shed
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT_MS", "2000")) / 1000
+
+# What a shed request gets: "degrade" answers with the template explanation,
+# "reject" fails requests that would be shed up front with 503 + Retry-After
+LLM_SHED_MODE = os.getenv("LLM_SHED_MODE", "degrade")
+
+# Priorities, lowest value served first: a user is waiting on interactive
+# requests (inline and streamed), nobody is on deferred jobs
+INTERACTIVE = 0
+DEFERRED = 1
+
+
+class LoadShed(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"LLM queue {reason.replace('_', ' ')}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# Priority queue in front of the LLM. At most `concurrency` requests hold a
+# slot. Interactive requests wait FIFO, up to `max_depth` of them and for at
+# most `max_wait` seconds each; beyond that they are shed, so a user never
+# waits long however slow the upstream gets.
+#
+# Deferred jobs have nobody waiting on them, so shedding them would only turn
+# them into templates. They wait in their own FIFO lane, without a depth limit
+# or timeout, and get a slot whenever no interactive request is waiting. The
+# lane is bounded by the caller's job store.
+#
+# Loop-bound state is reset lazily for the running event loop.
+class AdmissionQueue:
+    def __init__(self, concurrency: int = GROQ_MAX_INFLIGHT, max_depth: int = LLM_QUEUE_DEPTH,
+                 max_wait: float = LLM_QUEUE_TIMEOUT):
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        self._loop = None
+        self._running = 0
+        # Interactive waiters as [priority, seq, future]; entries whose future is
+        # done are stale and skipped (timed out or cancelled waiters)
+        self._heap: List[list] = []
+        self._seq = itertools.count()
+        # Deferred waiters' futures, oldest first
+        self._deferred: Deque[asyncio.Future] = deque()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.queued = 0
+        self.shed: Dict[str, int] = {"queue_full": 0, "queue_timeout": 0, "rejected": 0}
+
+    def _ensure_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._running = 0
+            self._heap = []
+            self._deferred = deque()
+
+    @property
+    def retry_after(self) -> int:
+        # Whole seconds, as the Retry-After header wants
+        return max(1, math.ceil(self.max_wait))
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for entry in self._heap if not entry[2].done())
+
+    def _count(self, reason: str):
+        with self._lock:
+            self.shed[reason] += 1
+
+    @property
+    def deferred(self) -> int:
+        return sum(1 for future in self._deferred if not future.done())
+
+    def would_shed(self, priority: int) -> bool:
+        # True when a request of this priority arriving now would not get in
+        if priority >= DEFERRED:
+            return False
+        return self._running >= self.concurrency and self.depth >= self.max_depth
+
+    def reject(self):
+        # Shed up front by the caller (LLM_SHED_MODE=reject)
+        self._count("rejected")
+        raise LoadShed("rejected", self.retry_after)
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        self._ensure_loop()
+        if self._running < self.concurrency and self.depth == 0 and (priority < DEFERRED or self.deferred == 0):
+            self._running += 1
+            self.admitted += 1
+            return
+        if priority >= DEFERRED:
+            await self._wait_deferred()
+            return
+        if self.depth >= self.max_depth:
+            self._count("queue_full")
+            raise LoadShed("queue_full", self.retry_after)
+        if len(self._heap) > 2 * self.max_depth:
+            self._heap = [entry for entry in self._heap if not entry[2].done()]
+            heapq.heapify(self._heap)
+
+        future = self._loop.create_future()
+        heapq.heappush(self._heap, [priority, next(self._seq), future])
+        self.queued += 1
+        try:
+            # A slot handed over by release() resolves the future
+            await asyncio.wait_for(future, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._count("queue_timeout")
+            raise LoadShed("queue_timeout", self.retry_after)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Cancelled just after being handed the slot; pass it on
+                self.release()
+            raise
+        self.admitted += 1
+
+    async def _wait_deferred(self):
+        future = self._loop.create_future()
+        self._deferred.append(future)
+        self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        self.admitted += 1
+
+    def release(self):
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if not entry[2].done():
+                # The slot moves straight to the waiter, so _running is unchanged
+                entry[2].set_result(None)
+                return
+        while self._deferred:
+            future = self._deferred.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            shed = dict(self.shed)
+        return {
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "deferred": self.deferred,
+            "max_wait_seconds": self.max_wait,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": shed,
+        }
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import httpx
+from groq import AsyncGroq
+
+from llm.groq_api import GROQ_KEY, GROQ_BASE_URL, GROQ_MODEL, COMPLETION_OPTIONS, chunk_usage, record_usage
+
+GROQ_MAX_INFLIGHT = int(os.getenv("GROQ_MAX_INFLIGHT", "8"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+
+
+# Non-blocking Groq client shared by every request on the event loop.
+# - One pooled httpx.AsyncClient keeps connections warm between completions.
+# - A semaphore caps the number of completions in flight upstream.
+# - Identical prompts that are in flight at the same moment are coalesced
+#   into a single upstream call (single-flight); late callers await its result.
+# Loop-bound resources are (re)created lazily for the running event loop.
+class AsyncLLMClient:
+    def __init__(
+        self,
+        api_key: Optional[str] = GROQ_KEY,
+        base_url: Optional[str] = GROQ_BASE_URL,
+        max_inflight: int = GROQ_MAX_INFLIGHT,
+        max_connections: int = GROQ_MAX_CONNECTIONS,
+        timeout: float = GROQ_TIMEOUT,
+        max_retries: int = GROQ_MAX_RETRIES,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_inflight = max_inflight
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._transport = transport
+        self._loop = None
+        self._client: Optional[AsyncGroq] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        # Optional hook: on_timing(name, seconds) with "llm_first_token" and
+        # "llm_total", both measured from the call (so including queueing)
+        self.on_timing: Optional[Callable[[str, float], None]] = None
+
+    def _ensure_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._client is not None:
+            self._close_stale(self._client, self._loop, loop)
+        http_client = self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections),
+            timeout=self.timeout,
+            transport=self._transport,
+        )
+        self._client = AsyncGroq(
+            api_key=self.api_key, base_url=self.base_url, max_retries=self.max_retries,
+            http_client=http_client)
+        self._semaphore = asyncio.Semaphore(self.max_inflight)
+        self._inflight = {}
+        self._loop = loop
+
+    @staticmethod
+    def _close_stale(client: AsyncGroq, old_loop, loop):
+        # A client left on another event loop (e.g. a test client that was
+        # restarted) still holds its pool; close it where it lives if that loop
+        # is still running, otherwise from here
+        if old_loop is not None and old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.close(), old_loop)
+            return
+        task = loop.create_task(client.close())
+        # Its connections may belong to the dead loop; the pool is closed either way
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        self._ensure_loop()
+        started = time.perf_counter()
+        async with self._semaphore:
+            self.upstream_calls += 1
+            completion = await self._client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                **COMPLETION_OPTIONS
+            )
+            received = []
+            usage = None
+            try:
+                async for chunk in completion:
+                    usage = chunk_usage(chunk) or usage
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        if not received and self.on_timing is not None:
+                            self.on_timing("llm_first_token", time.perf_counter() - started)
+                        received.append(token)
+                        yield token
+            finally:
+                await completion.close()
+                record_usage(prompt, "".join(received), usage)
+                if self.on_timing is not None:
+                    self.on_timing("llm_total", time.perf_counter() - started)
+
+    async def _fetch(self, prompt: str) -> str:
+        return "".join([token async for token in self.stream(prompt)])
+
+    async def complete(self, prompt: str) -> str:
+        self._ensure_loop()
+        task = self._inflight.get(prompt)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(prompt))
+            self._inflight[prompt] = task
+            task.add_done_callback(lambda _: self._inflight.pop(prompt, None))
+        else:
+            self.coalesced_calls += 1
+        # Shielded so a cancelled caller doesn't cancel the shared upstream call
+        return await asyncio.shield(task)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+        self._client = None
+        self._http_client = None
+        self._loop = None
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+# Minimal stand-in for Groq's OpenAI-compatible chat completions API, for load
+# testing the LLM layer without network access. It streams `reply` word by word
+# after `latency` seconds (or fails with `status_code` when it isn't 200, to
+# simulate an outage) and records how many completions were served and the
+# peak number handled concurrently.
+#
+#   python -m llm.fake_groq --port 9001 --latency 0.5
+#   GROQ_BASE_URL=http://127.0.0.1:9001 GROQ_KEY=fake uvicorn main:app
+def create_fake_groq_app(reply: str = "Your payment was split across your cards to maximise Net Savings.",
+                         latency: float = 0.05, token_delay: float = 0.0, status_code: int = 200) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+    app.state.reply = reply
+    app.state.latency = latency
+    app.state.token_delay = token_delay
+    app.state.status_code = status_code
+    app.state.requests = 0
+    app.state.active = 0
+    app.state.peak_active = 0
+    app.state.prompts = []
+
+    def chunk(completion_id: str, model: str, content=None, finish_reason=None, usage=None) -> str:
+        delta = {} if content is None else {"role": "assistant", "content": content}
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage is not None:
+            payload["x_groq"] = {"id": completion_id, "usage": usage}
+        return f"data: {json.dumps(payload)}\n\n"
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        app.state.requests += 1
+        app.state.prompts.append(body["messages"][-1]["content"])
+        app.state.active += 1
+        app.state.peak_active = max(app.state.peak_active, app.state.active)
+
+        try:
+            await asyncio.sleep(app.state.latency)
+        except BaseException:
+            app.state.active -= 1
+            raise
+
+        if app.state.status_code != 200:
+            app.state.active -= 1
+            return JSONResponse({"error": {"message": "fake upstream failure", "type": "server_error"}},
+                                status_code=app.state.status_code)
+
+        words = app.state.reply.split(" ")
+        tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+        # One token per word is close enough for load testing
+        usage = {
+            "prompt_tokens": len(body["messages"][-1]["content"].split()),
+            "completion_tokens": len(tokens),
+            "total_tokens": len(body["messages"][-1]["content"].split()) + len(tokens),
+        }
+
+        if not body.get("stream"):
+            app.state.active -= 1
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": app.state.reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        async def events():
+            try:
+                for token in tokens:
+                    yield chunk(completion_id, model, token)
+                    if app.state.token_delay:
+                        await asyncio.sleep(app.state.token_delay)
+                yield chunk(completion_id, model, finish_reason="stop", usage=usage)
+                yield "data: [DONE]\n\n"
+            finally:
+                app.state.active -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a local fake Groq server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    uvicorn.run(create_fake_groq_app(latency=args.latency, token_delay=args.token_delay),
+                host=args.host, port=args.port)
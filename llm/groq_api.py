@@ -1,30 +1,78 @@
 from groq import Groq
 from dotenv import load_dotenv
-import os 
+import os
+
+from llm.token_usage import token_usage, estimate_tokens
 load_dotenv()
 
 GROQ_KEY = os.getenv("GROQ_KEY")
-client = Groq(api_key = GROQ_KEY)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
 
-def groq_api_call(prompt):
-    completion = client.chat.completions.create(
-        model="openai/gpt-oss-120b",
+# Shared by the blocking client below and the async client in llm.async_client.
+# Explanations are three sentences, so the completion budget is kept small and
+# low reasoning effort is enough; both cut latency and cost per transaction.
+GROQ_MODEL = "openai/gpt-oss-120b"
+COMPLETION_OPTIONS = dict(
+    temperature=1,
+    max_completion_tokens=int(os.getenv("EXPLANATION_COMPLETION_TOKENS", "512")),
+    top_p=1,
+    reasoning_effort=os.getenv("EXPLANATION_REASONING_EFFORT", "low"),
+    stop=None,
+)
+
+_client = None
+
+
+def get_client():
+    # Created on first use so importing the API doesn't require a key
+    global _client
+    if _client is None:
+        _client = Groq(api_key=GROQ_KEY, base_url=GROQ_BASE_URL)
+    return _client
+
+
+def chunk_usage(chunk):
+    # Groq reports usage on the final streamed chunk, under x_groq or usage
+    x_groq = getattr(chunk, "x_groq", None)
+    return getattr(x_groq, "usage", None) or getattr(chunk, "usage", None)
+
+
+def record_usage(prompt, completion_text, usage):
+    if usage is not None:
+        token_usage.record(usage.prompt_tokens, usage.completion_tokens)
+    else:
+        token_usage.record(estimate_tokens(prompt), estimate_tokens(completion_text), estimated=True)
+
+
+def groq_api_stream(prompt):
+    # Yields the completion text as it arrives instead of buffering it
+    completion = get_client().chat.completions.create(
+        model=GROQ_MODEL,
         messages=[
         {
             "role": "user",
             "content": prompt
         }
         ],
-        temperature=1,
-        max_completion_tokens=8192,
-        top_p=1,
-        reasoning_effort="medium",
         stream=True,
-        stop=None
+        **COMPLETION_OPTIONS
     )
-    text = ''
-    for chunk in completion:
-        # print(chunk.choices[0].delta.content or "", end="")
-        text += chunk.choices[0].delta.content or ""
-    # print('\n')
-    return text
\ No newline at end of file
+    received = []
+    usage = None
+    try:
+        for chunk in completion:
+            usage = chunk_usage(chunk) or usage
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                received.append(token)
+                yield token
+    finally:
+        # Release the HTTP connection if the consumer stops early
+        completion.close()
+        record_usage(prompt, "".join(received), usage)
+
+
+def groq_api_call(prompt):
+    return "".join(groq_api_stream(prompt))
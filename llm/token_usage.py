@@ -0,0 +1,56 @@
+import math
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+# Rough tokens-per-character ratio for English prose on GPT-style tokenizers;
+# only used when the upstream doesn't report usage.
+CHARS_PER_TOKEN = 4.0
+
+
+def estimate_tokens(text: str) -> int:
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+# Per-call and cumulative prompt/completion token counts for LLM calls.
+class TokenUsageTracker:
+    def __init__(self, history: int = 100):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history)
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated_calls = 0
+
+    def record(self, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            if estimated:
+                self.estimated_calls += 1
+            self._recent.append({
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "estimated": estimated,
+            })
+
+    def last(self) -> Optional[Dict[str, object]]:
+        with self._lock:
+            return dict(self._recent[-1]) if self._recent else None
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "avg_prompt_tokens": self.prompt_tokens / self.calls if self.calls else 0.0,
+                "avg_completion_tokens": self.completion_tokens / self.calls if self.calls else 0.0,
+                "estimated_calls": self.estimated_calls,
+                "recent": list(self._recent),
+            }
+
+
+# Process-wide tracker shared by the blocking and async Groq clients
+token_usage = TokenUsageTracker()
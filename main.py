@@ -1,12 +1,33 @@
-from fastapi import FastAPI, HTTPException, APIRouter
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, APIRouter, Depends, Header, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
+from typing import Callable, List, Optional, Tuple, TypeVar
+import asyncio
+import json
+import os
+import time
 
-from api.models import TransactionRequest, TransactionResponse, UpdateLimitRequest, UserPreferences, Sector, TotalBalanceResponse
-from api.data_seeding import seed_data
-from api.optimizer import CardOptimizer
+from api.models import TransactionRequest, TransactionResponse, UpdateLimitRequest, UserPreferences, Sector, TotalBalanceResponse, BatchOptimizeResponse, WhatIfRequest, WhatIfResponse, WhatIfSeries, PlanRequest, PlanResponse, ProjectionResponse, CommitMode, HoldResponse, LedgerResponse, ExplanationMode, ExplanationResponse, StateStoreStats, FxRatesResponse, ExplanationCacheStats, TokenUsageStats, DecisionAnalyticsResponse, DecisionLogStats, IdempotencyStats, AdmissionStats, FeedStats
+from api.optimizer import select_mode
+from api.state import StateStore, UserState, DEFAULT_USER_ID, storage_loader
+from api.storage import SQLiteStore, DB_PATH
+from api.shared import SharedStateCoordinator, VersionBoard
+from api.explanations import ExplanationService
+from llm.admission import LoadShed, INTERACTIVE
+from api.batch import optimize_batch
+from api.planner import PlanOptimizer
+from api.fx import FxRateTable, provider_from_env
+from api.decision_log import COMMITTED, DecisionLog
+from api.feed import ChangeFeed
+from api.idempotency import IdempotencyStore, IdempotencyConflict, IDEMPOTENCY_TTL
+from api.metrics import TimedRoute, render_metrics
+from api.projection import MAX_PROJECTION_DAYS
+from api.ledger import LedgerConflict, HoldClosed
+import numpy as np
+from llm.token_usage import token_usage
 
 app = FastAPI(title="Card Optimization POC")
 
@@ -19,11 +40,86 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for POC
-debit_cards, credit_cards, international_cards, user_preferences = seed_data()
+# Durable storage (SQLite, WAL) with write-behind, opened at startup when
+# OPTIVAULT_DB_PATH is set; without it state lives only in memory
+storage: Optional[SQLiteStore] = None
 
-# API router mounted at /api to keep SPA routes separate
-router = APIRouter(prefix="/api")
+# Per-user portfolios, loaded on first use and kept in an LRU
+states = StateStore()
+
+# Worker processes serving the app (uvicorn's --workers defaults to this too)
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# With storage and several workers, workers share per-user version counters
+# through this mmap-backed file and reload users another worker changed
+BOARD_PATH = os.getenv("OPTIVAULT_BOARD_PATH", DB_PATH + ".versions" if DB_PATH else "")
+coordinator: Optional[SharedStateCoordinator] = None
+
+# Shared FX rates (FX_RATES_PATH); international cards naming a currency follow them
+fx_rates = FxRateTable(provider_from_env())
+
+# Every decision, appended off the request path to a binary log
+# (OPTIVAULT_DECISION_LOG_PATH) with incrementally maintained rollups
+decision_log = DecisionLog()
+
+# Live deltas of card state, totals and preferences for connected dashboards
+feed = ChangeFeed(lookup=states.peek)
+
+# Responses per (user, Idempotency-Key), so client retries replay the first
+# result (allocations, explanation, hold) instead of running again
+idempotency = IdempotencyStore()
+
+# Commits re-optimize this many times when a concurrent commit took the headroom
+COMMIT_ATTEMPTS = 5
+
+# LLM explanations go through the async, pooled Groq client and never block the event loop
+explanation_service = ExplanationService()
+
+# API router mounted at /api to keep SPA routes separate; every route reports
+# per-stage timings in a Server-Timing header and on /metrics
+router = APIRouter(prefix="/api", route_class=TimedRoute)
+
+
+def housekeep(state: UserState):
+    state.refresh_ledger()
+    state.apply_rates(fx_rates)
+
+
+def user_state(x_user_id: str = Header(DEFAULT_USER_ID, max_length=128)) -> UserState:
+    # Callers identify the portfolio with an X-User-Id header. Due ledger
+    # housekeeping (month rollover, expired holds) runs before any endpoint
+    # reads the cards, so no path sees last month's spend. Stale FX rates are
+    # refreshed in the background and the last good ones used meanwhile.
+    fx_rates.refresh_if_stale()
+    if coordinator is None:
+        state = feed.attach(states.get(x_user_id))
+        housekeep(state)
+        return state
+    state = feed.attach(coordinator.get(x_user_id))
+    if state.housekeeping_due(fx_rates):
+        # Housekeeping writes whole card rows, so in shared mode it is a
+        # mutation like any other: under the user's lock, on a fresh copy
+        state = locked(x_user_id, lambda fresh: fresh)
+    return state
+
+
+T = TypeVar("T")
+
+
+def locked(user_id: str, change: Callable[[UserState], T]) -> T:
+    # Blocks on the user's cross-worker lock and the flush; call off the event loop
+    with coordinator.exclusive(user_id) as fresh:
+        housekeep(feed.attach(fresh))
+        return change(fresh)
+
+
+async def mutate(state: UserState, change: Callable[[UserState], T]) -> T:
+    # Runs every mutation. In shared mode the change runs in the threadpool
+    # under the user's cross-worker lock, against an up-to-date copy, and is
+    # flushed before the lock is released.
+    if coordinator is None:
+        return change(state)
+    return await run_in_threadpool(locked, state.user_id, change)
 
 
 @router.get("/")
@@ -32,52 +128,469 @@ async def api_root():
 
 
 @router.get("/cards/total-balance", response_model=TotalBalanceResponse)
-async def get_total_balance():
-    total_debit = sum(card.current_balance for card in debit_cards)
-    total_credit = sum(card.current_balance for card in credit_cards)
-    return {
-        "total_debit_balance": total_debit,
-        "total_credit_balance": total_credit,
-        "total_gbp_balance": total_debit + total_credit,
-    }
+async def get_total_balance(state: UserState = Depends(user_state)):
+    return state.registry.totals()
 
 
 @router.post("/cards/update-limit")
-async def update_limit(request: UpdateLimitRequest):
-    for card in debit_cards + credit_cards + international_cards:
-        if card.id == request.card_id:
-            card.monthly_spend_limit = request.new_limit
-            return {"status": "success", "message": f"Limit for {card.name} updated to {request.new_limit}"}
+async def update_limit(request: UpdateLimitRequest, state: UserState = Depends(user_state)):
+    def change(state: UserState):
+        card = state.registry.update_limit(request.card_id, request.new_limit)
+        if card is not None:
+            state.update_ranking(card.id)
+        return card
 
-    raise HTTPException(status_code=404, detail="Card not found")
+    card = await mutate(state, change)
+    if card is None:
+        raise HTTPException(status_code=404, detail="Card not found")
+    return {"status": "success", "message": f"Limit for {card.name} updated to {request.new_limit}"}
 
 
 @router.post("/user/update-preferences")
-async def update_preferences(prefs: UserPreferences):
-    global user_preferences
-    user_preferences = prefs
+async def update_preferences(prefs: UserPreferences, state: UserState = Depends(user_state)):
+    await mutate(state, lambda state: state.set_preferences(prefs))
     return {"status": "success", "message": "User priorities updated"}
 
 
+def record_decision(state: UserState, request: TransactionRequest, result: TransactionResponse, commit: CommitMode):
+    decision_log.append(state.user_id, request.category, request.amount, result.status, commit, result.allocations)
+    if storage is not None:
+        storage.record_decision(state.user_id, request.category, request.amount, result.status, commit.value,
+                                result.hold_id, [(a.card_id, a.amount_utilised) for a in result.allocations])
+
+
+async def run_optimizer(state: UserState, request: TransactionRequest,
+                        commit: CommitMode = CommitMode.NONE) -> TransactionResponse:
+    if commit == CommitMode.NONE:
+        return optimize_once(state, request, commit)
+    return await mutate(state, lambda state: optimize_once(state, request, commit))
+
+
+def optimize_once(state: UserState, request: TransactionRequest, commit: CommitMode) -> TransactionResponse:
+    optimizer = state.optimizer()
+    for _ in range(COMMIT_ATTEMPTS):
+        result = optimizer.optimize(request, explain=False)
+
+        if result.status == "insufficient_funds":
+            allocated = sum(a.amount_utilised for a in result.allocations)
+            shortfall = request.amount - allocated
+            raise HTTPException(
+                status_code=400,
+                detail=f"Insufficient total liquidity. Shortfall: £{shortfall:.2f}. Total available across all sources: £{allocated:.2f}",
+            )
+        # Projected against the balances before this transaction is applied
+        result.eom_impact = state.projections.eom_impact(result.allocations, request.category, request.amount)
+        if commit == CommitMode.NONE:
+            record_decision(state, request, result, commit)
+            return result
+
+        try:
+            hold = state.ledger.reserve(result.allocations)
+        except LedgerConflict:
+            # Another commit used this headroom first; optimize again
+            continue
+        if commit == CommitMode.SETTLE:
+            state.ledger.settle(hold.hold_id)
+        else:
+            result.hold_id = hold.hold_id
+        record_decision(state, request, result, commit)
+        return result
+
+    raise HTTPException(status_code=409, detail="Card limits changed concurrently, please retry")
+
+
+def commit_once(state: UserState, request: TransactionRequest, commit: CommitMode, key: str,
+                fingerprint: str) -> Tuple[TransactionResponse, bool]:
+    # Runs under the user's lock in shared mode: the key is checked against,
+    # and recorded in, the shared database in the same flush as the ledger
+    # change, so a retry reaching another worker gets this commit back instead
+    # of spending again. Returns (result, replayed).
+    stored = coordinator.storage.load_response(state.user_id, key)
+    if stored is not None:
+        if stored[0] != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+        return TransactionResponse.model_validate_json(stored[1]), True
+    result = optimize_once(state, request, commit)
+    coordinator.storage.save_response(state.user_id, key, fingerprint, result.model_dump_json(),
+                                      time.time() + IDEMPOTENCY_TTL)
+    return result, False
+
+
+def admit(priority: int):
+    # With LLM_SHED_MODE=reject, fail fast while the LLM queue is full, before
+    # anything is optimized or committed
+    try:
+        explanation_service.check_admission(priority)
+    except LoadShed as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
 @router.post("/optimize-transaction", response_model=TransactionResponse)
-async def optimize_transaction(request: TransactionRequest):
-    optimizer = CardOptimizer(
-        debit_cards, credit_cards, international_cards, user_preferences)
-    result = optimizer.optimize(request)
-
-    if result.status == "insufficient_funds":
-        allocated = sum(a.amount_utilised for a in result.allocations)
-        shortfall = request.amount - allocated
+async def optimize_transaction(request: TransactionRequest, response: Response,
+                               explanation: ExplanationMode = ExplanationMode.INLINE,
+                               commit: CommitMode = CommitMode.NONE, state: UserState = Depends(user_state),
+                               idempotency_key: Optional[str] = Header(None, max_length=255)):
+    # commit=settle applies the allocation to month-to-date spend and balances;
+    # commit=reserve places a hold to be settled or released later
+    fingerprint = (request.model_dump_json(), explanation.value, commit.value)
+    # With several workers, keyed commits are also deduplicated across them
+    shared_key = idempotency_key if commit != CommitMode.NONE and coordinator is not None else None
+    stored = False
+
+    async def compute() -> TransactionResponse:
+        nonlocal stored
+        if explanation == ExplanationMode.INLINE:
+            # Deferred explanations are never shed, so only inline ones can be refused
+            admit(INTERACTIVE)
+        if shared_key is None:
+            result = await run_optimizer(state, request, commit)
+        else:
+            result, stored = await mutate(state, lambda state: commit_once(
+                state, request, commit, shared_key, json.dumps(fingerprint)))
+            if stored:
+                # As far as the first request had got (its explanation is
+                # stored once it is ready)
+                return result
+
+        mode = select_mode(request.category)
+        if explanation == ExplanationMode.INLINE:
+            result.explanation, result.explanation_source = await explanation_service.explain(
+                result.allocations, request.amount, request.category, mode, budget_ms=request.latency_budget_ms)
+        elif explanation == ExplanationMode.DEFERRED:
+            result.explanation_id = explanation_service.submit(
+                result.allocations, request.amount, request.category, mode)
+        if shared_key is not None and explanation != ExplanationMode.NONE:
+            coordinator.storage.save_response(state.user_id, shared_key, json.dumps(fingerprint),
+                                              result.model_dump_json(), time.time() + IDEMPOTENCY_TTL)
+        return result
+
+    if idempotency_key is None:
+        return await compute()
+    # A retry with the same key gets the first response back, and one sent
+    # while the first is still running waits for it
+    try:
+        result, replayed = await idempotency.run((state.user_id, idempotency_key), fingerprint, compute)
+    except IdempotencyConflict as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    if replayed or stored:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+@router.post("/optimize-batch", response_model=BatchOptimizeResponse)
+async def optimize_batch_transactions(requests: List[TransactionRequest], explain: bool = False,
+                                      state: UserState = Depends(user_state)):
+    # Insufficient funds are reported per item rather than failing the batch.
+    # With explain=true each successful item gets a deferred explanation_id;
+    # the job store must be able to hold them all or earlier ids would vanish.
+    if explain and len(requests) > explanation_service.max_jobs:
         raise HTTPException(
             status_code=400,
-            detail=f"Insufficient total liquidity. Shortfall: £{shortfall:.2f}. Total available across all sources: £{allocated:.2f}",
-        )
+            detail=f"explain=true supports at most {explanation_service.max_jobs} transactions per batch")
+    results = optimize_batch(requests, state.ranking)
+    succeeded = 0
+    for request, result in zip(requests, results):
+        decision_log.append(state.user_id, request.category, request.amount, result.status, CommitMode.NONE,
+                            result.allocations)
+        if result.status != "success":
+            continue
+        succeeded += 1
+        if explain:
+            result.explanation_id = explanation_service.submit(
+                result.allocations, request.amount, request.category, select_mode(request.category))
+    return BatchOptimizeResponse.model_construct(
+        results=results, succeeded=succeeded, insufficient_funds=len(results) - succeeded)
+
+
+@router.post("/optimize/what-if", response_model=WhatIfResponse)
+async def what_if(request: WhatIfRequest, state: UserState = Depends(user_state)):
+    # Allocations over a whole grid of amounts in one call, for UI charts
+    if request.amounts is not None:
+        amounts = np.asarray(request.amounts, dtype=float)
+    elif request.stop is not None:
+        # points is bounded by the schema, so the grid size is capped before allocating
+        amounts = np.linspace(request.start, request.stop, request.points)
+    else:
+        raise HTTPException(status_code=400, detail="Provide either amounts or stop (with start and points)")
+
+    curve = state.curves.curve(request.category)
+    allocated, covered = curve.allocate_many(amounts)
+    interest = allocated * curve.interest_rate / 12
+    cashback_points = allocated * curve.cashback_rate + interest
+
+    series = [
+        WhatIfSeries(card_id=entry.card.id, card_name=entry.card.name, amounts=allocated[:, j].tolist())
+        for j, entry in enumerate(curve.entries)
+        if allocated[:, j].any()
+    ]
+    return WhatIfResponse(
+        category=request.category,
+        mode=select_mode(request.category),
+        amounts=amounts.tolist(),
+        breakpoints=curve.breakpoints(),
+        series=series,
+        cashback_points=cashback_points.sum(axis=1).tolist(),
+        interest_saved=interest.sum(axis=1).tolist(),
+        covered=covered.tolist(),
+    )
+
+
+@router.post("/projection", response_model=ProjectionResponse)
+async def project_transaction(request: TransactionRequest, horizon_days: int = Query(90, gt=0, le=MAX_PROJECTION_DAYS),
+                              state: UserState = Depends(user_state)):
+    # Day-by-day debit balance and net value of the optimized allocation next
+    # to the alternative strategies, for charting; nothing is committed
+    result = state.optimizer().optimize(request, explain=False)
+    return state.projections.projection(result.allocations, request.category, request.amount, horizon_days)
+
+
+@router.post("/plan", response_model=PlanResponse)
+async def plan_purchases(request: PlanRequest, state: UserState = Depends(user_state)):
+    # Joint allocation for a queue of upcoming purchases; nothing is committed
+    year, month = state.month.split("-")
+    return PlanOptimizer(state.ranking, (int(year), int(month))).plan(request.purchases)
+
+
+@router.post("/optimize-transaction/stream")
+async def optimize_transaction_stream(request: TransactionRequest, state: UserState = Depends(user_state)):
+    # Server-Sent Events: the allocations go out first, then explanation tokens
+    # are forwarded as the LLM produces them.
+    admit(INTERACTIVE)
+    result = await run_optimizer(state, request)
+    mode = select_mode(request.category)
 
+    async def events():
+        yield sse_event("allocations", result.model_dump_json())
+        try:
+            async for token in explanation_service.stream(
+                    result.allocations, request.amount, request.category, mode, budget_ms=request.latency_budget_ms):
+                yield sse_event("token", json.dumps({"text": token}))
+        except Exception as e:
+            yield sse_event("error", json.dumps({"detail": str(e)}))
+        yield sse_event("done", "{}")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/feed")
+async def change_feed(websocket: WebSocket, user_id: Optional[str] = Query(None, max_length=128),
+                      x_user_id: str = Header(DEFAULT_USER_ID, max_length=128)):
+    # Browsers can't set headers on a WebSocket, so ?user_id= takes precedence.
+    # A snapshot goes out first, then one delta per tick with changes.
+    state = await run_in_threadpool(user_state, user_id or x_user_id)
+    await websocket.accept()
+    subscription = feed.subscribe(state.user_id)
+
+    async def send():
+        await websocket.send_text(feed.snapshot(state.user_id))
+        while True:
+            text = await subscription.get()
+            if text is None:
+                # Resync after the user was evicted; load it again
+                await run_in_threadpool(user_state, state.user_id)
+                text = feed.snapshot(state.user_id)
+            await websocket.send_text(text)
+
+    async def receive():
+        # Clients send nothing; reading is how a quiet connection's close is noticed
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.ensure_future(send()), asyncio.ensure_future(receive())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
+
+
+@router.get("/feed/stream")
+async def change_feed_stream(state: UserState = Depends(user_state)):
+    # The same feed as Server-Sent Events, for clients without WebSockets
+    subscription = feed.subscribe(state.user_id)
+
+    async def events():
+        try:
+            yield sse_event("change", feed.snapshot(state.user_id))
+            while True:
+                event = await subscription.get_sse()
+                if event is None:
+                    await run_in_threadpool(user_state, state.user_id)
+                    event = sse_event("change", feed.snapshot(state.user_id))
+                yield event
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/feed/stats", response_model=FeedStats)
+async def get_feed_stats():
+    return feed.stats()
+
+
+@router.get("/ledger", response_model=LedgerResponse)
+async def get_ledger(state: UserState = Depends(user_state)):
+    return state.ledger.snapshot()
+
+
+def hold_response(hold) -> HoldResponse:
+    return HoldResponse(hold_id=hold.hold_id, status=hold.status, amounts=hold.amounts)
+
+
+@router.get("/holds/{hold_id}", response_model=HoldResponse)
+async def get_hold(hold_id: str, state: UserState = Depends(user_state)):
+    hold = state.ledger.get(hold_id)
+    if hold is None:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    return hold_response(hold)
+
+
+@router.post("/holds/{hold_id}/settle", response_model=HoldResponse)
+async def settle_hold(hold_id: str, state: UserState = Depends(user_state)):
+    try:
+        hold = await mutate(state, lambda state: state.ledger.settle(hold_id))
+    except HoldClosed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if hold is None:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    return hold_response(hold)
+
+
+@router.post("/holds/{hold_id}/release", response_model=HoldResponse)
+async def release_hold(hold_id: str, state: UserState = Depends(user_state)):
+    try:
+        hold = await mutate(state, lambda state: state.ledger.release(hold_id))
+    except HoldClosed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if hold is None:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    return hold_response(hold)
+
+
+@router.get("/state/stats", response_model=StateStoreStats)
+async def get_state_stats():
+    return states.stats()
+
+
+@router.get("/fx/rates", response_model=FxRatesResponse)
+async def get_fx_rates():
+    return fx_rates.stats()
+
+
+@router.get("/analytics/decisions", response_model=DecisionAnalyticsResponse)
+async def get_decision_analytics(month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+                                 card_id: Optional[str] = None, sector: Optional[Sector] = None,
+                                 commit: List[CommitMode] = Query(COMMITTED),
+                                 state: UserState = Depends(user_state)):
+    # Cashback and interest per card and sector for one month (default the
+    # current one, UTC), from rollups kept current as decisions are logged.
+    # Committed spend (settle, reserve) only, unless commit= says otherwise;
+    # add commit=none to include previews.
+    rollups = decision_log.rollup(state.user_id, month or state.month, card_id, sector, commit)
+    return DecisionAnalyticsResponse(
+        month=month or state.month,
+        commit_modes=commit,
+        rollups=rollups,
+        total_amount=sum(r["amount"] for r in rollups),
+        total_cashback=sum(r["cashback"] for r in rollups),
+        total_interest_saved=sum(r["interest_saved"] for r in rollups),
+    )
+
+
+@router.get("/analytics/decisions/stats", response_model=DecisionLogStats)
+async def get_decision_log_stats():
+    return decision_log.stats()
+
+
+@router.get("/idempotency/stats", response_model=IdempotencyStats)
+async def get_idempotency_stats():
+    return idempotency.stats()
+
+
+@router.get("/explanations/cache/stats", response_model=ExplanationCacheStats)
+async def get_explanation_cache_stats():
+    return explanation_service.cache.stats()
+
+
+@router.get("/llm/admission", response_model=AdmissionStats)
+async def get_llm_admission():
+    return explanation_service.admission.stats()
+
+
+@router.get("/llm/usage", response_model=TokenUsageStats)
+async def get_llm_usage():
+    return token_usage.stats()
+
+
+@router.get("/explanations/{explanation_id}", response_model=ExplanationResponse)
+async def get_explanation(explanation_id: str, wait: float = 0.0):
+    # `wait` long-polls for up to that many seconds before returning a pending status
+    result = await explanation_service.get(explanation_id, wait=min(max(wait, 0.0), 30.0))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Explanation not found")
     return result
 
 
 app.include_router(router)
 
+
+# Prometheus scrape target (outside /api, before the frontend mount shadows it)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("shutdown")
+async def shutdown_explanations():
+    await explanation_service.shutdown()
+
+
+@app.on_event("startup")
+def open_storage():
+    global storage, coordinator
+    if DB_PATH and storage is None:
+        storage = SQLiteStore(DB_PATH)
+        if WORKERS > 1:
+            coordinator = SharedStateCoordinator(states, storage, VersionBoard(BOARD_PATH), storage_loader(storage))
+            # Dashboards also follow what other workers change
+            feed.stale, feed.reload = coordinator.stale, coordinator.get
+        else:
+            # One worker owns the database: no version checks or cross-process locks
+            states.reset(storage_loader(storage), on_evict=lambda state: storage.flush())
+
+
+@app.on_event("startup")
+def load_fx_rates():
+    # The only time a request-independent fetch is allowed to block
+    if fx_rates.fetched_at is None:
+        fx_rates.refresh()
+
+
+@app.on_event("shutdown")
+def flush_storage():
+    # Only flush: the store outlives the app's lifespan (test clients restart it)
+    if storage is not None:
+        storage.flush()
+    decision_log.flush()
+
 # Serve frontend build (if present) from ui/dist
 dist_dir = Path(__file__).resolve().parent / "ui" / "dist"
 if dist_dir.exists():
@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import main
+from api.explanations import ExplanationService
+from llm.admission import DEFERRED, INTERACTIVE, AdmissionQueue, LoadShed
+from llm.async_client import AsyncLLMClient
+from llm.fake_groq import create_fake_groq_app
+
+
+def test_queue_serves_by_priority_and_sheds_when_full():
+    queue = AdmissionQueue(concurrency=1, max_depth=2, max_wait=5)
+    order = []
+
+    async def worker(name, priority):
+        try:
+            async with queue.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+        except LoadShed as exc:
+            order.append(f"{name}:{exc.reason}")
+
+    async def scenario():
+        await queue.acquire(INTERACTIVE)
+        tasks = [asyncio.ensure_future(worker(f"deferred-{i}", DEFERRED)) for i in range(5)]
+        tasks += [asyncio.ensure_future(worker(f"interactive-{i}", INTERACTIVE)) for i in range(2)]
+        await asyncio.sleep(0)
+        # Deferred jobs wait in their own lane, so they neither fill nor get shed from the bounded queue
+        assert queue.depth == 2 and queue.deferred == 5
+        assert queue.would_shed(INTERACTIVE) and not queue.would_shed(DEFERRED)
+        tasks.append(asyncio.ensure_future(worker("interactive-2", INTERACTIVE)))
+        await asyncio.sleep(0)
+        queue.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["interactive-2:queue_full", "interactive-0", "interactive-1"] + [f"deferred-{i}" for i in range(5)]
+    stats = queue.stats()
+    assert stats["shed"]["queue_full"] == 1 and stats["admitted"] == 8
+    assert stats["running"] == 0 and stats["depth"] == 0 and stats["deferred"] == 0
+
+
+def test_waiters_are_shed_after_the_queue_timeout():
+    queue = AdmissionQueue(concurrency=1, max_depth=4, max_wait=0.05)
+
+    async def scenario():
+        await queue.acquire()
+        with pytest.raises(LoadShed) as shed:
+            await queue.acquire()
+        assert shed.value.reason == "queue_timeout" and shed.value.retry_after == 1
+        queue.release()
+        # The timed-out waiter doesn't hold the slot
+        await asyncio.wait_for(queue.acquire(), timeout=1)
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def slow_groq(monkeypatch):
+    fake = create_fake_groq_app(reply="Paid with Capital One.", latency=0.5)
+    llm = AsyncLLMClient(api_key="test-key", base_url="http://fake-groq", max_retries=0,
+                         transport=httpx.ASGITransport(app=fake))
+    admission = AdmissionQueue(concurrency=2, max_depth=2, max_wait=0.1)
+    monkeypatch.setattr(main, "explanation_service", ExplanationService(llm=llm, admission=admission))
+    return fake
+
+
+def test_brownout_degrades_to_templates_and_keeps_cheap_endpoints_fast(slow_groq):
+    headers = {"X-User-Id": "brownout"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            optimize = [asyncio.ensure_future(client.post(
+                "/api/optimize-transaction", json={"amount": 100 + 40 * i, "category": "travel"}, headers=headers))
+                for i in range(12)]
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            balance = await client.get("/api/cards/total-balance", headers=headers)
+            balance_seconds = time.perf_counter() - started
+            return await asyncio.gather(*optimize), balance, balance_seconds
+
+    responses, balance, balance_seconds = asyncio.run(scenario())
+    assert balance.status_code == 200 and balance_seconds < 0.1
+    assert all(r.status_code == 200 for r in responses)
+    sources = [r.json()["explanation_source"] for r in responses]
+    assert sources.count("llm") == 2 and sources.count("template") == 10
+    assert slow_groq.state.requests == 2
+    shed = main.explanation_service.admission.stats()["shed"]
+    assert shed["queue_full"] == 8 and shed["queue_timeout"] == 2
+
+
+def test_reject_mode_answers_503_before_committing(slow_groq):
+    service = main.explanation_service
+    service.shed_mode = "reject"
+    service.admission.concurrency = 1
+    service.admission.max_depth = 1
+    headers = {"X-User-Id": "reject"}
+
+    async def scenario():
+        await service.admission.acquire()
+        waiter = asyncio.ensure_future(service.admission.acquire())
+        await asyncio.sleep(0)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            rejected = await client.post("/api/optimize-transaction?commit=settle",
+                                         json={"amount": 120, "category": "hotel"}, headers=headers)
+            plain = await client.post("/api/optimize-transaction?explanation=none",
+                                      json={"amount": 120, "category": "hotel"}, headers=headers)
+            ledger = (await client.get("/api/ledger", headers=headers)).json()
+            stats = (await client.get("/api/llm/admission")).json()
+        waiter.cancel()
+        return rejected, plain, ledger, stats
+
+    rejected, plain, ledger, stats = asyncio.run(scenario())
+    assert rejected.status_code == 503 and rejected.headers["Retry-After"] == "1"
+    assert plain.status_code == 200
+    assert sum(card["month_to_date_spend"] for card in ledger["cards"]) == 0
+    assert stats["shed"]["rejected"] == 1 and stats["depth"] == 1
+
+
+def test_deferred_batch_explanations_wait_instead_of_degrading(monkeypatch):
+    fake = create_fake_groq_app(reply="Paid with Capital One.", latency=0.01)
+    llm = AsyncLLMClient(api_key="test-key", base_url="http://fake-groq", max_retries=0,
+                         transport=httpx.ASGITransport(app=fake))
+    admission = AdmissionQueue(concurrency=2, max_depth=2, max_wait=0.05)
+    monkeypatch.setattr(main, "explanation_service", ExplanationService(llm=llm, admission=admission))
+    batch = [{"amount": 100 + i, "category": "travel"} for i in range(40)]
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/optimize-batch?explain=true", json=batch,
+                                         headers={"X-User-Id": "deferred-lane"})
+            ids = [result["explanation_id"] for result in response.json()["results"]]
+            return await asyncio.gather(*(client.get(f"/api/explanations/{i}?wait=10") for i in ids))
+
+    explanations = asyncio.run(scenario())
+    assert [e.json()["source"] for e in explanations] == ["llm"] * 40
+    assert fake.state.requests == 40
+    assert admission.stats()["shed"] == {"queue_full": 0, "queue_timeout": 0, "rejected": 0}
+
+
+def test_identical_prompts_share_one_admission_slot(slow_groq):
+    service = main.explanation_service
+    headers = {"X-User-Id": "single-flight"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/api/optimize-transaction", headers=headers,
+                                                      json={"amount": 230, "category": "travel"})
+                                          for _ in range(6)))
+
+    responses = asyncio.run(scenario())
+    assert [r.json()["explanation_source"] for r in responses] == ["llm"] * 6
+    assert service.admission.stats()["admitted"] == 1 and slow_groq.state.requests == 1
@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+
+from llm.async_client import AsyncLLMClient
+from llm.fake_groq import create_fake_groq_app
+from llm.token_usage import token_usage
+
+
+def make_client(fake, max_inflight=8):
+    return AsyncLLMClient(api_key="test-key", base_url="http://fake-groq", max_inflight=max_inflight,
+                          transport=httpx.ASGITransport(app=fake))
+
+
+def test_identical_prompts_are_coalesced():
+    fake = create_fake_groq_app(reply="Net Savings preserved.", latency=0.05)
+    llm = make_client(fake)
+
+    async def run():
+        results = await asyncio.gather(*[llm.complete("same prompt") for _ in range(20)])
+        await llm.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert results == ["Net Savings preserved."] * 20
+    assert fake.state.requests == 1
+    assert llm.coalesced_calls == 19
+    assert llm.inflight == 0
+
+
+def test_inflight_completions_are_capped():
+    fake = create_fake_groq_app(latency=0.02)
+    llm = make_client(fake, max_inflight=3)
+
+    async def run():
+        await asyncio.gather(*[llm.complete(f"prompt {i}") for i in range(30)])
+        await llm.aclose()
+
+    asyncio.run(run())
+    assert fake.state.requests == 30
+    assert fake.state.peak_active <= 3
+
+
+def test_stream_yields_tokens():
+    fake = create_fake_groq_app(reply="one two three", latency=0)
+    llm = make_client(fake)
+
+    async def run():
+        tokens = [token async for token in llm.stream("prompt")]
+        await llm.aclose()
+        return tokens
+
+    assert asyncio.run(run()) == ["one", " two", " three"]
+
+
+def test_token_usage_is_recorded_per_call():
+    fake = create_fake_groq_app(reply="one two three", latency=0)
+    llm = make_client(fake)
+    before = token_usage.calls
+
+    async def run():
+        await llm.complete("four word prompt here")
+        await llm.aclose()
+
+    asyncio.run(run())
+    assert token_usage.calls == before + 1
+    assert token_usage.last() == {"prompt_tokens": 4, "completion_tokens": 3, "estimated": False}
+
+
+def test_a_new_event_loop_closes_the_previous_pool():
+    fake = create_fake_groq_app(reply="ok", latency=0)
+    llm = make_client(fake)
+    asyncio.run(llm.complete("first loop"))
+    first = llm._http_client
+
+    async def second_loop():
+        result = await llm.complete("second loop")
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(second_loop()) == "ok"
+    assert first.is_closed and llm._http_client is not first
+    asyncio.run(llm.aclose())
@@ -0,0 +1,51 @@
+import random
+
+from fastapi.testclient import TestClient
+
+import main
+from api.batch import optimize_batch
+from api.data_seeding import seed_data
+from api.models import Sector, TransactionRequest
+from api.optimizer import CardOptimizer
+from api.ranking import RankingIndex
+
+
+def test_batch_matches_scalar_optimizer():
+    debit, credit, international, prefs = seed_data()
+    credit[0].monthly_spend_limit = 0
+    ranking = RankingIndex(debit, credit, international, prefs)
+    optimizer = CardOptimizer(debit, credit, international, prefs, ranking=ranking)
+
+    rng = random.Random(3)
+    requests = [TransactionRequest(amount=rng.choice([0, 5, 49.99, 50, 123.45, 999, 2500.5, 9000, 50000]),
+                                   category=rng.choice(list(Sector)))
+                for _ in range(500)]
+
+    batch = optimize_batch(requests, ranking)
+    for request, result in zip(requests, batch):
+        expected = optimizer.optimize(request, explain=False)
+        assert result.status == expected.status
+        assert result.total_amount == expected.total_amount
+        assert [a.model_dump() for a in result.allocations] == [a.model_dump() for a in expected.allocations]
+
+
+def test_batch_endpoint_reports_per_item_status():
+    client = TestClient(main.app)
+    response = client.post("/api/optimize-batch", json=[
+        {"amount": 100, "category": "hotel"},
+        {"amount": 10000000, "category": "travel"},
+    ])
+    assert response.status_code == 200
+    body = response.json()
+    assert body["succeeded"] == 1
+    assert body["insufficient_funds"] == 1
+    assert body["results"][0]["allocations"][0]["card_id"] == "cc_3"
+    assert body["results"][0]["explanation_id"] is None
+    assert body["results"][1]["status"] == "insufficient_funds"
+
+
+def test_batch_explanations_limited_to_job_store():
+    client = TestClient(main.app)
+    batch = [{"amount": 10, "category": "grocery"}] * (main.explanation_service.max_jobs + 1)
+    assert client.post("/api/optimize-batch?explain=true", json=batch).status_code == 400
+    assert client.post("/api/optimize-batch", json=batch).status_code == 200
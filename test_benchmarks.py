@@ -0,0 +1,37 @@
+import main
+from benchmarks import bench_http, bench_optimizer
+from benchmarks.harness import percentile, regressions, save_baselines, load_baselines, summarize
+
+
+def test_percentiles_and_summary():
+    samples = [i / 1000 for i in range(1, 101)]
+    assert percentile(samples, 50) == 0.05
+    assert percentile(samples, 99) == 0.099
+    summary = summarize(samples, wall=1.0)
+    assert summary["n"] == 100 and summary["ops_per_sec"] == 100
+    assert abs(summary["p50_us"] - 50000) < 1e-6
+
+
+def test_regressions_against_saved_baselines(tmp_path):
+    path = str(tmp_path / "baselines.json")
+    save_baselines({"a": {"p50_us": 100.0}, "b": {"p50_us": 10.0}}, path)
+    save_baselines({"b": {"p50_us": 20.0}}, path)
+    baselines = load_baselines(path)
+    assert baselines == {"a": {"p50_us": 100.0}, "b": {"p50_us": 20.0}}
+    current = {"a": {"p50_us": 124.0}, "b": {"p50_us": 26.0}, "new": {"p50_us": 1.0}}
+    assert regressions(current, baselines, tolerance=0.25) == [("b", 20.0, 26.0)]
+
+
+def test_optimizer_benchmarks_run():
+    results = bench_optimizer.run(sizes=(8, 300), iterations=5)
+    assert len(results) == 2 * len(bench_optimizer.CASES) * 2
+    assert all(r["n"] >= 5 and r["p99_us"] >= r["p50_us"] > 0 for r in results.values())
+
+
+def test_http_benchmark_runs_against_the_fake_llm():
+    saved = main.explanation_service
+    results = bench_http.run(requests=20, concurrency=4, llm_latency=0.0,
+                             only=["total_balance", "optimize/inline_llm"])
+    assert set(results) == {"http/total_balance", "http/optimize/inline_llm"}
+    assert results["http/optimize/inline_llm"]["n"] == 20
+    assert main.explanation_service is saved
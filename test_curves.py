@@ -0,0 +1,66 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+import main
+from api.curves import CurveEngine
+from api.data_seeding import seed_data
+from api.models import Sector, TransactionRequest
+from api.optimizer import CardOptimizer
+from api.ranking import RankingIndex
+from api.registry import CardRegistry
+
+
+def build():
+    debit, credit, international, prefs = seed_data()
+    registry = CardRegistry(debit, credit, international)
+    ranking = RankingIndex(debit, credit, international, prefs)
+    optimizer = CardOptimizer(debit, credit, international, prefs, ranking=ranking)
+    return registry, ranking, optimizer, CurveEngine(registry, ranking)
+
+
+def test_curve_lookup_matches_optimizer():
+    _, _, optimizer, engine = build()
+    for category in Sector:
+        curve = engine.curve(category)
+        for amount in [10, 49.99, 50, 499.5, 500, 1234.56, 4000, 8000, 30000]:
+            expected = optimizer.optimize(TransactionRequest(amount=amount, category=category), explain=False)
+            allocated, covered = curve.allocate_many(np.array([amount]))
+            used = [(j, x) for j, x in enumerate(allocated[0]) if x > 0]
+            assert covered[0] == (expected.status == "success")
+            assert [curve.entries[j].card.id for j, _ in used] == [a.card_id for a in expected.allocations]
+            for (j, x), e in zip(used, expected.allocations):
+                interest = x * curve.interest_rate[j] / 12
+                assert abs(x - e.amount_utilised) < 1e-9
+                assert abs(x * curve.cashback_rate[j] + interest - e.cashback_points) < 1e-9
+
+
+def test_curves_rebuild_after_limit_change():
+    registry, ranking, _, engine = build()
+    before = engine.curve(Sector.HOTEL)
+    assert engine.curve(Sector.HOTEL) is before
+    registry.update_limit("cc_3", 50)
+    after = engine.curve(Sector.HOTEL)
+    assert after is not before
+    allocated, _ = after.allocate_many(np.array([500]))
+    capital_one = next(j for j, e in enumerate(after.entries) if e.card.id == "cc_3")
+    assert allocated[0][capital_one] == 50
+
+
+def test_what_if_endpoint_grid():
+    response = TestClient(main.app).post("/api/optimize/what-if",
+                                         json={"category": "shopping", "start": 0, "stop": 2000, "points": 5})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["amounts"] == [0.0, 500.0, 1000.0, 1500.0, 2000.0]
+    capital_one = next(s for s in body["series"] if s["card_id"] == "cc_3")
+    assert capital_one["amounts"] == [0.0, 500.0, 500.0, 500.0, 500.0]
+    assert 500.0 in body["breakpoints"]
+    assert all(body["covered"])
+
+
+def test_what_if_rejects_oversized_grids():
+    client = TestClient(main.app)
+    response = client.post("/api/optimize/what-if", json={"category": "hotel", "stop": 100, "points": 10**11})
+    assert response.status_code == 422
+    response = client.post("/api/optimize/what-if", json={"category": "hotel", "amounts": [1.0] * 5001})
+    assert response.status_code == 422
@@ -0,0 +1,147 @@
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+import main
+from api.decision_log import RECORD, DecisionLog, DecisionLogReader, month_number
+from api.models import Allocation, CommitMode, Sector
+
+OCT = datetime(2026, 10, 5, tzinfo=timezone.utc).timestamp()
+NOV = datetime(2026, 11, 2, tzinfo=timezone.utc).timestamp()
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def allocation(card_id: str, amount: float, cashback: float, interest: float) -> Allocation:
+    return Allocation(card_id=card_id, card_name=card_id, amount_utilised=amount,
+                      interest_saved=interest, cashback_points=cashback + interest)
+
+
+def populate(log: DecisionLog, clock: FakeClock):
+    log.append("u1", Sector.HOTEL, 300, "success", CommitMode.SETTLE,
+               [allocation("cc_amex", 200, 6.0, 0.5), allocation("dc_1", 100, 0.0, 0.1)])
+    log.append("u1", Sector.HOTEL, 50, "success", CommitMode.NONE, [allocation("cc_amex", 50, 1.5, 0.1)])
+    log.append("u1", Sector.FUEL, 900, "insufficient_funds", CommitMode.NONE, [allocation("cc_amex", 400, 4.0, 0.0)])
+    log.append("u2", Sector.HOTEL, 80, "success", CommitMode.SETTLE, [allocation("cc_amex", 80, 2.4, 0.0)])
+    clock.now = NOV
+    log.append("u1", Sector.HOTEL, 10, "success", CommitMode.SETTLE, [allocation("cc_amex", 10, 0.3, 0.0)])
+
+
+def test_rollups_per_card_sector_month():
+    clock = FakeClock(OCT)
+    log = DecisionLog(path="", flush_interval=60, clock=clock)
+    populate(log, clock)
+    assert log.rollup("u1", "2026-10") == []
+    log.flush()
+
+    amex = log.rollup("u1", "2026-10", "cc_amex", Sector.HOTEL, list(CommitMode))
+    assert amex == [{"card_id": "cc_amex", "sector": Sector.HOTEL, "allocations": 2,
+                     "amount": 250.0, "cashback": 7.5, "interest_saved": 0.6}]
+    # Previews (commit=none) are left out by default
+    committed = log.rollup("u1", "2026-10", "cc_amex", Sector.HOTEL)
+    assert committed[0]["allocations"] == 1 and committed[0]["cashback"] == 6.0
+    # Unfunded decisions are logged but not rolled up
+    assert log.rollup("u1", "2026-10", sector=Sector.FUEL, commit_modes=list(CommitMode)) == []
+    assert {r["card_id"] for r in log.rollup("u1", "2026-10")} == {"cc_amex", "dc_1"}
+    assert log.rollup("u1", "2026-11")[0]["amount"] == 10
+    assert log.stats()["decisions"] == 5 and log.stats()["records"] == 6
+    log.close()
+
+
+def test_binary_log_reopens_with_the_same_rollups(tmp_path):
+    path = str(tmp_path / "decisions.bin")
+    clock = FakeClock(OCT)
+    log = DecisionLog(path=path, flush_interval=60, clock=clock)
+    populate(log, clock)
+    log.close()
+    expected = log.rollup("u1", "2026-10")
+
+    with DecisionLogReader(path) as reader:
+        assert len(reader) == 6
+        assert reader.ids[reader.records["card"][0]] == "cc_amex"
+        assert set(reader.records["month"].tolist()) == {month_number(OCT), month_number(NOV)}
+        assert reader.records["cashback"].sum() == 6.0 + 1.5 + 4.0 + 2.4 + 0.3
+
+    # A torn trailing record is dropped and appends continue the sequence
+    with open(path, "ab") as f:
+        f.write(b"\x00" * (RECORD.size // 2))
+    reopened = DecisionLog(path=path, flush_interval=60, clock=clock)
+    assert reopened.rollup("u1", "2026-10") == expected
+    assert reopened.stats()["decisions"] == 5
+    reopened.append("u3", Sector.TRAVEL, 20, "success", CommitMode.NONE, [allocation("cc_x", 20, 0.2, 0.0)])
+    reopened.close()
+    with DecisionLogReader(path) as reader:
+        assert len(reader) == 7
+        assert reader.records["seq"][-1] == 5
+        assert reader.ids[reader.records["user"][-1]] == "u3"
+
+
+
+
+def test_decisions_without_records_are_still_counted(tmp_path):
+    path = str(tmp_path / "decisions.bin")
+    log = DecisionLog(path=path, flush_interval=60)
+    log.append("u1", Sector.HOTEL, 500, "insufficient_funds", CommitMode.NONE, [])
+    log.append("u1", Sector.HOTEL, 20, "success", CommitMode.SETTLE, [allocation("cc_amex", 20, 0.6, 0.0)])
+    log.close()
+    reopened = DecisionLog(path=path, flush_interval=60)
+    assert reopened.stats()["decisions"] == 2 and reopened.stats()["records"] == 1
+    reopened.close()
+
+def test_workers_append_to_their_own_segments_and_merge_them(tmp_path):
+    path = str(tmp_path / "decisions.bin")
+    clock = FakeClock(OCT)
+    first = DecisionLog(path=path, flush_interval=60, clock=clock)
+    second = DecisionLog(path=path, flush_interval=60, clock=clock)
+    assert (first.segment, second.segment) == (path, path + ".1")
+    first.append("u1", Sector.HOTEL, 200, "success", CommitMode.SETTLE, [allocation("cc_amex", 200, 6.0, 0.0)])
+    second.append("u1", Sector.HOTEL, 100, "success", CommitMode.SETTLE, [allocation("cc_amex", 100, 3.0, 0.0)])
+    second.append("u2", Sector.FUEL, 40, "success", CommitMode.NONE, [allocation("dc_1", 40, 0.0, 0.1)])
+    first.flush()
+    second.flush()
+
+    # Each worker folds in the other's segment as it grows
+    first._follow()
+    assert first.rollup("u1", "2026-10")[0]["amount"] == 300
+    assert first.stats()["decisions"] == 3 and first.stats()["segments"] == 2
+
+    with DecisionLogReader(path) as reader:
+        assert len(reader) == 3
+        assert sorted(reader.ids[i] for i in reader.records["user"]) == ["u1", "u1", "u2"]
+        assert sorted(reader.ids[i] for i in reader.records["card"]) == ["cc_amex", "cc_amex", "dc_1"]
+
+    first.close()
+    second.close()
+    reopened = DecisionLog(path=path, flush_interval=60, clock=clock)
+    assert reopened.segment == path
+    assert reopened.rollup("u1", "2026-10")[0]["amount"] == 300
+    assert reopened.rollup("u2", "2026-10", commit_modes=[CommitMode.NONE])[0]["interest_saved"] == 0.1
+    reopened.close()
+
+def test_analytics_endpoint_reports_logged_decisions(monkeypatch):
+    monkeypatch.setattr(main, "decision_log", DecisionLog(path="", flush_interval=60))
+    headers = {"X-User-Id": "analytics"}
+    with TestClient(main.app) as client:
+        for amount in (120, 80):
+            response = client.post("/api/optimize-transaction?explanation=none&commit=settle",
+                                   json={"amount": amount, "category": "hotel"}, headers=headers)
+            assert response.status_code == 200
+        client.post("/api/optimize-transaction?explanation=none", json={"amount": 40, "category": "hotel"},
+                    headers=headers)
+        main.decision_log.flush()
+
+        body = client.get("/api/analytics/decisions", headers=headers).json()
+        assert body["total_amount"] == 200 and body["commit_modes"] == ["settle", "reserve"]
+        everything = client.get("/api/analytics/decisions?commit=none&commit=settle", headers=headers).json()
+        assert everything["total_amount"] == 240
+        settled = client.get("/api/analytics/decisions?commit=settle&sector=hotel", headers=headers).json()
+        assert settled["total_amount"] == 200 and settled["commit_modes"] == ["settle"]
+        assert settled["total_cashback"] > 0
+        assert client.get("/api/analytics/decisions?month=2026-13", headers=headers).status_code == 422
+        assert client.get("/api/analytics/decisions/stats").json()["decisions"] == 3
@@ -0,0 +1,56 @@
+from api.cache import TTLCache
+from api.explanation_cache import ExplanationCache
+from api.models import Allocation, Sector
+
+
+def hotel_allocation(amount):
+    interest = amount * 0.05 / 12
+    return [Allocation(
+        card_id="cc_3",
+        card_name="Capital One Credit",
+        amount_utilised=amount,
+        interest_saved=interest,
+        cashback_points=amount * 0.08 + interest,
+        cashback_sector=Sector.HOTEL,
+    )]
+
+
+def test_near_identical_allocations_share_entry_with_exact_amounts():
+    cache = ExplanationCache()
+    first = hotel_allocation(100.0)
+    text = "You paid £100.00 on Capital One, earning £8.00 cashback and £0.42 in Net Savings at 8%."
+    assert cache.store(first, 100.0, Sector.HOTEL, "balanced", text)
+
+    second = hotel_allocation(105.0)
+    assert cache.lookup(second, 105.0, Sector.HOTEL, "balanced") == (
+        "You paid £105.00 on Capital One, earning £8.40 cashback and £0.44 in Net Savings at 8%."
+    )
+    assert cache.stats()["hits"] == 1
+
+
+def test_different_shape_misses():
+    cache = ExplanationCache()
+    cache.store(hotel_allocation(100.0), 100.0, Sector.HOTEL, "balanced", "You paid £100.00.")
+    assert cache.lookup(hotel_allocation(400.0), 400.0, Sector.HOTEL, "balanced") is None
+    assert cache.lookup(hotel_allocation(100.0), 100.0, Sector.SHOPPING, "balanced") is None
+
+
+def test_untraceable_numbers_are_not_cached():
+    cache = ExplanationCache()
+    assert not cache.store(hotel_allocation(100.0), 100.0, Sector.HOTEL, "balanced", "That is about £12.50 a week.")
+    assert cache.stats()["uncacheable"] == 1
+
+
+def test_ttl_cache_lru_and_expiry():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+
+    now[0] = 11
+    assert cache.get("a") is None
+    assert cache.expirations == 1
@@ -0,0 +1,167 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from api.explanations import ExplanationService
+from api.models import Allocation, Sector
+from llm.circuit_breaker import CircuitBreaker
+from llm.async_client import AsyncLLMClient
+from llm.fake_groq import create_fake_groq_app
+
+
+@pytest.fixture
+def fake_groq(monkeypatch):
+    fake = create_fake_groq_app(reply="Paid with Capital One.", latency=0.01)
+    llm = AsyncLLMClient(api_key="test-key", base_url="http://fake-groq", max_retries=0,
+                         transport=httpx.ASGITransport(app=fake))
+    monkeypatch.setattr(main, "explanation_service", ExplanationService(llm=llm))
+    return fake
+
+
+@pytest.fixture
+def client(fake_groq):
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_inline_explanation(client, fake_groq):
+    response = client.post("/api/optimize-transaction", json={"amount": 100, "category": "hotel"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["explanation"] == "Paid with Capital One."
+    assert body["explanation_source"] == "llm"
+    assert body["explanation_id"] is None
+    assert fake_groq.state.requests == 1
+
+
+def test_inline_explanation_reports_llm_stages(client, fake_groq):
+    response = client.post("/api/optimize-transaction", json={"amount": 333, "category": "fuel"})
+    timing = response.headers["Server-Timing"]
+    for name in ("llm_prompt", "llm_first_token", "llm_total"):
+        assert f"{name};dur=" in timing
+
+
+def test_deferred_explanation_returns_handle(client, fake_groq):
+    fake_groq.state.latency = 0.5
+    response = client.post("/api/optimize-transaction?explanation=deferred", json={"amount": 100, "category": "hotel"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["explanation"] is None
+    assert body["allocations"]
+
+    explanation_id = body["explanation_id"]
+    pending = client.get(f"/api/explanations/{explanation_id}").json()
+    assert pending["status"] == "pending"
+
+    ready = client.get(f"/api/explanations/{explanation_id}?wait=5").json()
+    assert ready["status"] == "ready"
+    assert ready["explanation"] == "Paid with Capital One."
+
+
+def test_no_explanation_skips_llm(client, fake_groq):
+    response = client.post("/api/optimize-transaction?explanation=none", json={"amount": 20, "category": "grocery"})
+    assert response.status_code == 200
+    assert response.json()["explanation"] is None
+    assert fake_groq.state.requests == 0
+
+
+def test_unknown_explanation_id(client):
+    assert client.get("/api/explanations/missing").status_code == 404
+
+
+def test_streamed_explanation(client):
+    with client.stream("POST", "/api/optimize-transaction/stream", json={"amount": 100, "category": "hotel"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+
+    events = [block for block in body.split("\n\n") if block]
+    assert events[0].startswith("event: allocations")
+    allocations = json.loads(events[0].split("data: ", 1)[1])
+    assert allocations["allocations"][0]["card_id"] == "cc_3"
+    tokens = [json.loads(e.split("data: ", 1)[1])["text"] for e in events if e.startswith("event: token")]
+    assert "".join(tokens) == "Paid with Capital One."
+    assert events[-1].startswith("event: done")
+
+
+def test_stream_rejects_insufficient_funds(client):
+    response = client.post("/api/optimize-transaction/stream", json={"amount": 10000000, "category": "travel"})
+    assert response.status_code == 400
+
+
+def test_slow_llm_falls_back_to_template_within_budget(client, fake_groq):
+    fake_groq.state.latency = 0.5
+    response = client.post("/api/optimize-transaction", json={"amount": 100, "category": "hotel", "latency_budget_ms": 50})
+    body = response.json()
+    assert body["explanation_source"] == "template"
+    assert body["explanation"].startswith("Your £100.00 hotel payment goes entirely on Capital One Credit.")
+
+
+def test_circuit_breaker_stops_calling_failing_llm(client, fake_groq):
+    fake_groq.state.status_code = 500
+    fake_groq.state.latency = 0
+    threshold = main.explanation_service.breaker.failure_threshold
+    for _ in range(threshold + 3):
+        body = client.post("/api/optimize-transaction", json={"amount": 100, "category": "hotel"}).json()
+        assert body["explanation_source"] == "template"
+    assert fake_groq.state.requests == threshold
+    assert main.explanation_service.breaker.state == "open"
+
+
+def test_caller_budget_overruns_do_not_trip_breaker(client, fake_groq):
+    fake_groq.state.latency = 0.2
+    threshold = main.explanation_service.breaker.failure_threshold
+    for _ in range(threshold + 1):
+        body = client.post("/api/optimize-transaction",
+                           json={"amount": 100, "category": "hotel", "latency_budget_ms": 0}).json()
+        assert body["explanation_source"] == "template"
+    assert main.explanation_service.breaker.state == "closed"
+
+    body = client.post("/api/optimize-transaction",
+                       json={"amount": 100, "category": "hotel", "latency_budget_ms": 10000}).json()
+    assert body["explanation_source"] in ("llm", "cache")
+
+
+def test_cancelled_half_open_trial_frees_the_breaker(fake_groq):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    service = ExplanationService(llm=main.explanation_service.llm, breaker=breaker)
+    allocations = [Allocation(card_id="cc_3", card_name="Capital One Credit", amount_utilised=100)]
+    breaker.record_failure()
+    now[0] = 20
+    fake_groq.state.latency = 5
+
+    async def run():
+        async def consume():
+            return [t async for t in service.stream(allocations, 100, Sector.HOTEL, "balanced", budget_ms=10000)]
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await service.llm.aclose()
+
+    asyncio.run(run())
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_dropped_deferred_jobs_are_cancelled(fake_groq):
+    fake_groq.state.latency = 5
+    service = ExplanationService(llm=main.explanation_service.llm, max_jobs=1)
+    allocations = [Allocation(card_id="cc_3", card_name="Capital One Credit", amount_utilised=100)]
+
+    async def run():
+        first = service.submit(allocations, 100, Sector.HOTEL, "balanced")
+        task = service._jobs[first]
+        service.submit(allocations, 200, Sector.HOTEL, "balanced")
+        await asyncio.sleep(0)
+        assert task.cancelled()
+        assert await service.get(first) is None
+        await service.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from api.feed import ChangeFeed
+from api.models import Sector, UserPreferences
+from api.state import StateStore
+
+
+def test_changes_in_a_tick_coalesce_into_one_shared_message():
+    states = StateStore()
+    feed = ChangeFeed(lookup=states.peek, tick=0.01)
+    state = feed.attach(states.get("feed"))
+
+    async def scenario():
+        first, second = feed.subscribe("feed"), feed.subscribe("feed")
+        state.registry.update_limit("dc_1", 900)
+        state.registry.update_limit("dc_1", 950)
+        state.registry.update_balance("cc_1", 10)
+        state.set_preferences(UserPreferences(point_priority=[Sector.FUEL]))
+        await asyncio.sleep(0.05)
+        a, b = first.queue.get_nowait(), second.queue.get_nowait()
+        assert first.queue.empty()
+        first.close()
+        second.close()
+        return a, b
+
+    a, b = asyncio.run(scenario())
+    # Serialized once, the same object queued for both subscribers
+    assert a is b
+    delta = json.loads(a.text)
+    assert delta["type"] == "delta" and delta["seq"] == 1
+    assert {card["id"] for card in delta["cards"]} == {"dc_1", "cc_1"}
+    assert next(c for c in delta["cards"] if c["id"] == "dc_1")["monthly_spend_limit"] == 950
+    assert delta["preferences"] == {"point_priority": ["fuel"]}
+    assert delta["totals"] == state.registry.totals()
+    assert a.sse.startswith("event: change\ndata: ")
+    assert feed.stats()["published"] == 1 and feed.stats()["delivered"] == 2
+
+
+def test_slow_subscriber_resyncs_with_a_snapshot():
+    states = StateStore()
+    feed = ChangeFeed(lookup=states.peek, tick=60, queue_size=2)
+    state = feed.attach(states.get("slow"))
+
+    async def scenario():
+        subscription = feed.subscribe("slow")
+        for limit in (500, 600, 700):
+            state.registry.update_limit("dc_1", limit)
+            feed.publish()
+        text = await subscription.get()
+        subscription.close()
+        return text
+
+    message = json.loads(asyncio.run(scenario()))
+    assert message["type"] == "snapshot" and message["seq"] == 3
+    assert next(c for c in message["cards"] if c["id"] == "dc_1")["monthly_spend_limit"] == 700
+    assert feed.stats()["resyncs"] == 1
+
+
+def test_unwatched_users_are_not_tracked():
+    states = StateStore()
+    feed = ChangeFeed(lookup=states.peek)
+    feed.attach(states.get("nobody")).registry.update_limit("dc_1", 10)
+    assert feed._dirty == {}
+
+
+def test_websocket_pushes_limit_and_preference_changes():
+    headers = {"X-User-Id": "ws-feed"}
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/api/feed?user_id=ws-feed") as websocket:
+            snapshot = websocket.receive_json()
+            assert snapshot["type"] == "snapshot"
+            assert snapshot["totals"] == client.get("/api/cards/total-balance", headers=headers).json()
+
+            client.post("/api/cards/update-limit", json={"card_id": "dc_2", "new_limit": 90}, headers=headers)
+            delta = websocket.receive_json()
+            assert [card["id"] for card in delta["cards"]] == ["dc_2"]
+            assert delta["cards"][0]["available_gbp"] == 90
+            assert delta["totals"] == client.get("/api/cards/total-balance", headers=headers).json()
+
+            client.post("/api/user/update-preferences", json={"point_priority": ["hotel"]}, headers=headers)
+            delta = websocket.receive_json()
+            assert delta["preferences"] == {"point_priority": ["hotel"]} and delta["cards"] == []
+            assert client.get("/api/feed/stats").json()["subscribers"] == 1
+
+
+def test_closed_websocket_unsubscribes_while_idle():
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/api/feed?user_id=ws-idle") as websocket:
+            assert websocket.receive_json()["type"] == "snapshot"
+            assert client.get("/api/feed/stats").json()["subscribers"] == 1
+        # Nothing changed, so the handler was waiting on the feed when the client left
+        deadline = time.monotonic() + 5
+        while client.get("/api/feed/stats").json()["subscribers"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.get("/api/feed/stats").json()["subscribers"] == 0
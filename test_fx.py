@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import main
+from api.fx import FileRateProvider, FxRateTable, StaticRateProvider
+from api.models import Sector, TransactionRequest
+from api.ranking import INTERNATIONAL
+from api.state import seed_user_state
+from api.storage import card_from_row, card_row
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_refresh_bumps_version_only_on_change():
+    provider = StaticRateProvider({"INR": 120.0, "USD": 1.25})
+    table = FxRateTable(provider, ttl=60)
+    assert table.refresh()
+    assert table.version == 1 and table.rate("INR") == 120.0
+    assert not table.refresh()
+    assert table.version == 1
+    provider.rates["INR"] = 110.0
+    assert table.refresh()
+    assert table.version == 2 and table.rate("USD") == 1.25
+
+
+def test_failed_refresh_keeps_last_good_rates():
+    rates = {"INR": 120.0}
+
+    def provider():
+        if rates is None:
+            raise OSError("rates unavailable")
+        return rates
+
+    table = FxRateTable(provider, ttl=60)
+    table.refresh()
+    rates = None
+    assert not table.refresh()
+    assert table.rate("INR") == 120.0
+    assert table.failures == 1 and "unavailable" in table.last_error
+
+
+def test_stale_rates_refresh_in_background_without_blocking():
+    release = threading.Event()
+    calls = []
+
+    def slow_provider():
+        calls.append(1)
+        release.wait(5)
+        return {"INR": 100.0 + len(calls)}
+
+    clock = FakeClock()
+    table = FxRateTable(slow_provider, ttl=60, clock=clock)
+    release.set()
+    table.refresh()
+    release.clear()
+
+    clock.now = 61
+    started = time.perf_counter()
+    for _ in range(10):
+        table.refresh_if_stale()
+    assert time.perf_counter() - started < 0.5
+    # One refresh in flight, and the old rate is served meanwhile
+    assert len(calls) == 2
+    assert table.rate("INR") == 101.0
+    release.set()
+    for _ in range(100):
+        if table.rate("INR") == 102.0:
+            break
+        time.sleep(0.01)
+    assert table.rate("INR") == 102.0 and not table.stale
+
+
+def test_file_provider(tmp_path):
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps({"inr": 121, "EUR": 1.17}))
+    assert FileRateProvider(str(path))() == {"INR": 121.0, "EUR": 1.17}
+
+
+def test_state_applies_rates_to_cards_and_totals():
+    state = seed_user_state("fx")
+    card = state.registry.get("ic_1")
+    assert card.currency == "INR"
+    before = state.registry.total_available(INTERNATIONAL)
+    table = FxRateTable(StaticRateProvider({"INR": 100.0}))
+    table.refresh()
+    state.apply_rates(table)
+    assert card.gbp_conversion == 100.0
+    assert abs(state.registry.total_available(INTERNATIONAL) - before * 122.5 / 100.0) < 1e-9
+    # Curves are rebuilt against the new rate
+    allocated, covered = state.curves.curve(Sector.HOTEL).allocate_many(np.array([5000]))
+    version = state.registry.version
+    state.apply_rates(table)
+    assert state.registry.version == version
+    assert covered[0] and allocated[0].sum() == 5000
+
+
+def test_currency_survives_storage_rows():
+    card = seed_user_state("fx").registry.get("ic_1")
+    kind, _, restored = card_from_row(card_row("fx", card, INTERNATIONAL, 0))
+    assert kind == INTERNATIONAL and restored.currency == "INR"
+
+
+def test_endpoints_use_the_shared_table(monkeypatch):
+    table = FxRateTable(StaticRateProvider({"INR": 100.0}))
+    monkeypatch.setattr(main, "fx_rates", table)
+    with TestClient(main.app) as client:
+        headers = {"X-User-Id": "fx-endpoint"}
+        rates = client.get("/api/fx/rates").json()
+        assert rates["rates"] == {"INR": 100.0} and not rates["stale"]
+        totals = client.get("/api/cards/total-balance", headers=headers).json()
+        assert abs(totals["total_international_available_gbp"] - 100000 / 100.0) < 1e-9
+        result = asyncio.run(main.run_optimizer(main.states.get("fx-endpoint"),
+                                                TransactionRequest(amount=4000, category=Sector.HOTEL)))
+        assert result.status == "success"
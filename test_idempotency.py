@@ -0,0 +1,126 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from api.explanations import ExplanationService
+from api.idempotency import IdempotencyConflict, IdempotencyStore
+from api.shared import SharedStateCoordinator, VersionBoard
+from api.state import StateStore, storage_loader
+from api.storage import SQLiteStore
+from llm.async_client import AsyncLLMClient
+from llm.fake_groq import create_fake_groq_app
+
+
+@pytest.fixture
+def fake_groq(monkeypatch):
+    fake = create_fake_groq_app(reply="Paid with Capital One.", latency=0.1)
+    llm = AsyncLLMClient(api_key="test-key", base_url="http://fake-groq", max_retries=0,
+                         transport=httpx.ASGITransport(app=fake))
+    monkeypatch.setattr(main, "explanation_service", ExplanationService(llm=llm))
+    monkeypatch.setattr(main, "idempotency", IdempotencyStore())
+    return fake
+
+
+def test_store_runs_once_and_rejects_reuse():
+    store = IdempotencyStore()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"n": len(calls)}
+
+    async def scenario():
+        results = await asyncio.gather(*(store.run("k", "body", compute) for _ in range(5)))
+        assert [r for r, _ in results] == [{"n": 1}] * 5
+        assert sorted(replayed for _, replayed in results) == [False] + [True] * 4
+        assert await store.run("k", "body", compute) == ({"n": 1}, True)
+        with pytest.raises(IdempotencyConflict):
+            await store.run("k", "other body", compute)
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+    stats = store.stats()
+    assert stats["executed"] == 1 and stats["coalesced"] == 4 and stats["replayed"] == 1 and stats["conflicts"] == 1
+
+
+def test_failures_are_not_stored():
+    store = IdempotencyStore()
+    attempts = []
+
+    async def compute():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream")
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await store.run("k", "body", compute)
+        assert await store.run("k", "body", compute) == ("ok", False)
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_retries_share_one_llm_call(fake_groq):
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = {"X-User-Id": "idem", "Idempotency-Key": "retry-1"}
+            body = {"amount": 417, "category": "travel"}
+            return await asyncio.gather(*(client.post("/api/optimize-transaction", json=body, headers=headers)
+                                          for _ in range(5)))
+
+    responses = asyncio.run(scenario())
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.text for r in responses}) == 1
+    assert responses[0].json()["explanation"] == "Paid with Capital One."
+    assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in responses) == 4
+    assert fake_groq.state.requests == 1
+
+
+def test_retried_commit_settles_once(fake_groq):
+    headers = {"X-User-Id": "idem-commit", "Idempotency-Key": "pay-1"}
+    url = "/api/optimize-transaction?explanation=none&commit=settle"
+    with TestClient(main.app) as client:
+        first = client.post(url, json={"amount": 120, "category": "hotel"}, headers=headers)
+        retry = client.post(url, json={"amount": 120, "category": "hotel"}, headers=headers)
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        spent = sum(card["month_to_date_spend"] for card in client.get("/api/ledger", headers=headers).json()["cards"])
+        assert abs(spent - 120) < 1e-9
+
+        conflict = client.post(url, json={"amount": 121, "category": "hotel"}, headers=headers)
+        assert conflict.status_code == 422
+        # Keys are per user
+        other = client.post(url, json={"amount": 121, "category": "hotel"},
+                            headers={**headers, "X-User-Id": "idem-other"})
+        assert other.status_code == 200 and "Idempotent-Replayed" not in other.headers
+        assert client.get("/api/idempotency/stats").json()["replayed"] == 1
+
+
+def test_commit_keys_are_shared_between_workers(fake_groq, tmp_path, monkeypatch):
+    def worker():
+        storage = SQLiteStore(str(tmp_path / "optivault.db"), flush_interval=0.01)
+        board = VersionBoard(str(tmp_path / "optivault.db.versions"))
+        return SharedStateCoordinator(StateStore(), storage, board, storage_loader(storage))
+
+    first, second = worker(), worker()
+    headers = {"X-User-Id": "idem-shared", "Idempotency-Key": "pay-2"}
+    url = "/api/optimize-transaction?explanation=none&commit=settle"
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(main, "coordinator", first)
+        committed = client.post(url, json={"amount": 130, "category": "hotel"}, headers=headers)
+        # The retry lands on another worker, with its own in-memory keys
+        monkeypatch.setattr(main, "coordinator", second)
+        monkeypatch.setattr(main, "idempotency", IdempotencyStore())
+        retry = client.post(url, json={"amount": 130, "category": "hotel"}, headers=headers)
+        conflict = client.post(url, json={"amount": 131, "category": "hotel"}, headers=headers)
+    assert retry.json() == committed.json() and retry.headers["Idempotent-Replayed"] == "true"
+    assert conflict.status_code == 422
+    cards = second.get("idem-shared").registry
+    spent = sum(card.month_to_date_spend for card in (*cards.debit_cards, *cards.credit_cards, *cards.international_cards))
+    assert abs(spent - 130) < 1e-9
@@ -0,0 +1,123 @@
+import threading
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+import main
+from api.data_seeding import seed_data
+from api.ledger import LedgerConflict, SpendLedger
+from api.models import Allocation, HoldStatus, Sector, TransactionRequest
+from api.optimizer import CardOptimizer
+from api.registry import CardRegistry
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now.timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+def build(clock=None):
+    debit, credit, international, prefs = seed_data()
+    registry = CardRegistry(debit, credit, international)
+    ledger = SpendLedger(registry, hold_ttl=60, clock=clock or FakeClock(datetime(2026, 3, 10, tzinfo=timezone.utc)))
+    return registry, ledger, CardOptimizer(debit, credit, international, prefs)
+
+
+def alloc(card_id, amount):
+    return Allocation(card_id=card_id, card_name=card_id, amount_utilised=amount)
+
+
+def test_settle_counts_against_monthly_limit():
+    registry, ledger, _ = build()
+    hold = ledger.reserve([alloc("dc_2", 100)])
+    card = registry.get("dc_2")
+    assert card.reserved == 100
+    ledger.settle(hold.hold_id)
+    assert (card.current_balance, card.month_to_date_spend, card.reserved) == (100.0, 100.0, 0.0)
+    # Limit 150 with 100 spent leaves 50, even though the balance is 100
+    try:
+        ledger.reserve([alloc("dc_2", 60)])
+        assert False, "expected a conflict"
+    except LedgerConflict:
+        pass
+    assert ledger.get(hold.hold_id).status == HoldStatus.SETTLED
+
+
+def test_release_expiry_and_rollover():
+    clock = FakeClock(datetime(2026, 3, 31, 23, 59, tzinfo=timezone.utc))
+    registry, ledger, _ = build(clock)
+    released = ledger.reserve([alloc("dc_1", 200)])
+    ledger.release(released.hold_id)
+    assert registry.get("dc_1").reserved == 0
+
+    ledger.commit([alloc("dc_1", 300)])
+    stale = ledger.reserve([alloc("dc_1", 50)])
+    clock.now += 120
+    assert ledger.get(stale.hold_id).status == HoldStatus.EXPIRED
+    card = registry.get("dc_1")
+    assert ledger.month == "2026-04"
+    assert (card.month_to_date_spend, card.reserved, card.current_balance) == (0.0, 0.0, 1500.0)
+
+
+def test_concurrent_commits_never_oversubscribe():
+    registry, ledger, optimizer = build()
+    total = registry.total_available("debit")
+    committed = []
+
+    def worker():
+        for _ in range(20):
+            result = optimizer.optimize(TransactionRequest(amount=75, category=Sector.GENERAL), explain=False)
+            if result.status != "success":
+                return
+            try:
+                ledger.commit(result.allocations)
+                committed.append(75)
+            except LedgerConflict:
+                pass
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(committed) <= total
+    for card in registry.debit_cards:
+        assert card.month_to_date_spend <= card.monthly_spend_limit + 1e-9
+        assert card.current_balance >= -1e-9
+
+
+def test_reserve_and_release_over_http():
+    with TestClient(main.app) as client:
+        response = client.post("/api/optimize-transaction?explanation=none&commit=reserve",
+                               json={"amount": 40, "category": "general"})
+        assert response.status_code == 200
+        hold_id = response.json()["hold_id"]
+        card_id = response.json()["allocations"][0]["card_id"]
+
+        ledger = client.get("/api/ledger").json()
+        entry = next(c for c in ledger["cards"] if c["card_id"] == card_id)
+        assert entry["reserved"] == 40
+
+        assert client.post(f"/api/holds/{hold_id}/release").json()["status"] == "released"
+        assert client.post(f"/api/holds/{hold_id}/settle").status_code == 409
+        assert client.post("/api/holds/unknown/settle").status_code == 404
+        ledger = client.get("/api/ledger").json()
+        assert next(c for c in ledger["cards"] if c["card_id"] == card_id)["reserved"] == 0
+
+
+def test_month_rollover_applies_before_optimizing():
+    with TestClient(main.app) as client:
+        headers = {"X-User-Id": "test-ledger-rollover"}
+        state = main.states.get("test-ledger-rollover")
+        for card in state.debit_cards:
+            state.registry.update_spend(card.id, card.current_balance, card.monthly_spend_limit, 0.0)
+        state.ledger.month = "2000-01"
+
+        response = client.post("/api/optimize-transaction?explanation=none&commit=settle",
+                               json={"amount": 100, "category": "general"}, headers=headers)
+        assert response.status_code == 200
+        assert state.ledger.month != "2000-01"
@@ -0,0 +1,55 @@
+from fastapi.testclient import TestClient
+
+import main
+from api.metrics import Histogram, stage, stage_seconds
+
+
+def server_timing(response) -> dict:
+    stages = {}
+    for entry in response.headers["Server-Timing"].split(", "):
+        name, dur = entry.split(";dur=")
+        stages[name] = float(dur)
+    return stages
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test.", "stage", buckets=(0.1, 1.0))
+    histogram.observe("a", 0.05)
+    histogram.observe("a", 0.5)
+    histogram.observe("a", 5.0)
+    text = histogram.render()
+    assert '# TYPE test_seconds histogram' in text
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{stage="a"} 3' in text
+    assert histogram.count("a") == 3 and histogram.count("b") == 0
+
+
+def test_stage_context_manager_records_outside_requests():
+    before = stage_seconds.count("test_stage")
+    with stage("test_stage"):
+        pass
+    assert stage_seconds.count("test_stage") == before + 1
+
+
+def test_optimize_reports_server_timing_stages():
+    with TestClient(main.app) as client:
+        response = client.post("/api/optimize-transaction?explanation=none",
+                               json={"amount": 2500, "category": "shopping"},
+                               headers={"X-User-Id": "metrics"})
+        assert response.status_code == 200
+        stages = server_timing(response)
+        for name in ("validation", "ranking", "allocation", "serialization", "total"):
+            assert name in stages and stages[name] >= 0
+        assert stages["total"] >= stages["ranking"] + stages["allocation"]
+
+
+def test_metrics_endpoint_exposes_histograms():
+    with TestClient(main.app) as client:
+        client.get("/api/cards/total-balance", headers={"X-User-Id": "metrics"})
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'optivault_stage_seconds_bucket{stage="validation"' in response.text
+        assert 'optivault_request_seconds_count{route="/api/cards/total-balance"}' in response.text
@@ -0,0 +1,83 @@
+import time
+from collections import defaultdict
+from datetime import date
+
+from fastapi.testclient import TestClient
+
+import main
+from api.data_seeding import seed_data
+from api.models import PlannedPurchase, Sector
+from api.planner import PlanOptimizer
+from api.ranking import RankingIndex
+
+
+def build():
+    debit, credit, international, prefs = seed_data()
+    ranking = RankingIndex(debit, credit, international, prefs)
+    return PlanOptimizer(ranking, (2026, 3)), {c.id: c for c in debit + credit + international}
+
+
+def test_plan_keeps_capital_one_for_the_bigger_shopping_purchase():
+    # Greedy puts the hotel spend on Capital One (8%) and leaves the shopping
+    # purchase next week without its 15%
+    planner, _ = build()
+    purchases = [
+        PlannedPurchase(amount=500, category=Sector.HOTEL, date=date(2026, 3, 10)),
+        PlannedPurchase(amount=500, category=Sector.SHOPPING, date=date(2026, 3, 17)),
+    ]
+    plan = planner.plan(purchases)
+    assert plan.unfunded == 0
+    shopping = plan.purchases[1]
+    assert [(a.card_id, a.amount_utilised) for a in shopping.allocations] == [("cc_3", 500)]
+    assert "cc_3" not in {a.card_id for a in plan.purchases[0].allocations}
+    # +£55 on shopping (15% vs Chase 4%) for -£25 on the hotel (Amex 3% vs 8%)
+    assert abs(plan.total_value - plan.greedy_value - 30) < 1e-6
+
+
+def test_plan_never_worse_than_greedy_and_respects_limits():
+    planner, cards = build()
+    sectors = list(Sector)
+    purchases = [
+        PlannedPurchase(amount=20 + (i * 37) % 400, category=sectors[i % len(sectors)], date=date(2026, 3 + i % 3, 1 + i % 28))
+        for i in range(300)
+    ]
+    started = time.perf_counter()
+    plan = planner.plan(purchases)
+    assert time.perf_counter() - started < 2.0
+    assert plan.total_value >= plan.greedy_value - 1e-6
+
+    used = defaultdict(float)
+    for purchase, planned in zip(purchases, plan.purchases):
+        assert abs(sum(a.amount_utilised for a in planned.allocations) + planned.shortfall - purchase.amount) < 1e-6
+        for a in planned.allocations:
+            used[(a.card_id, purchase.date.month)] += a.amount_utilised
+    for (card_id, _), amount in used.items():
+        assert amount <= min(cards[card_id].monthly_spend_limit, cards[card_id].current_balance) + 1e-6
+    for card_id, card in cards.items():
+        assert sum(v for (c, _), v in used.items() if c == card_id) <= card.current_balance + 1e-6
+
+
+def test_interest_only_sectors_plan_on_debit_only():
+    planner, _ = build()
+    plan = planner.plan([PlannedPurchase(amount=300, category=Sector.GROCERY, date=date(2026, 3, 5))])
+    assert plan.purchases[0].allocations
+    assert all(a.card_id.startswith("dc_") for a in plan.purchases[0].allocations)
+
+
+def test_plan_endpoint():
+    with TestClient(main.app) as client:
+        response = client.post("/api/plan", headers={"X-User-Id": "planner"}, json={"purchases": [
+            {"amount": 500, "category": "hotel", "date": "2026-03-10"},
+            {"amount": 500, "category": "shopping", "date": "2026-03-17"},
+        ]})
+        assert response.status_code == 200
+        body = response.json()
+        assert len(body["purchases"]) == 2
+        assert body["total_value"] >= body["greedy_value"]
+
+        # Planning commits nothing
+        ledger = client.get("/api/ledger", headers={"X-User-Id": "planner"}).json()
+        assert all(card["reserved"] == 0 for card in ledger["cards"])
+
+        too_many = [{"amount": 1, "category": "general", "date": "2026-03-01"}] * 1001
+        assert client.post("/api/plan", json={"purchases": too_many}).status_code == 422
@@ -0,0 +1,97 @@
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import main
+from api.data_seeding import seed_data
+from api.models import Sector, TransactionRequest
+from api.optimizer import CardOptimizer
+from api.projection import OPTIMIZED, PRIMARY_ACCOUNT, ProjectionEngine, days_to_month_end
+from api.ranking import RankingIndex
+from api.registry import CardRegistry
+
+NOW = datetime(2026, 3, 10, tzinfo=timezone.utc).timestamp()
+
+
+def build(horizon_days=90):
+    debit, credit, international, prefs = seed_data()
+    registry = CardRegistry(debit, credit, international)
+    ranking = RankingIndex(debit, credit, international, prefs)
+    optimizer = CardOptimizer(debit, credit, international, prefs, ranking=ranking)
+    return registry, optimizer, ProjectionEngine(registry, ranking, clock=lambda: NOW, horizon_days=horizon_days)
+
+
+def test_days_to_month_end():
+    assert days_to_month_end(NOW) == 22
+    assert days_to_month_end(datetime(2026, 12, 31, tzinfo=timezone.utc).timestamp()) == 1
+
+
+def test_closed_form_matches_day_by_day_simulation():
+    registry, optimizer, engine = build(horizon_days=60)
+    request = TransactionRequest(amount=800, category=Sector.SHOPPING)
+    result = optimizer.optimize(request, explain=False)
+    names, statement, total_balance, interest, value, cashback, fees = engine.simulate(
+        result.allocations, request.category, request.amount)
+
+    # Step the optimized strategy one day at a time
+    debit = {c.id: c for c in registry.debit_cards}
+    balances = {c.id: c.current_balance for c in registry.debit_cards}
+    best = max(registry.debit_cards, key=lambda c: c.annual_interest_rate).id
+    credit_spend = 0.0
+    for a in result.allocations:
+        if a.card_id in debit:
+            balances[a.card_id] -= a.amount_utilised
+        elif registry.kind_of(a.card_id) == "credit":
+            credit_spend += a.amount_utilised
+    s = names.index(OPTIMIZED)
+    for day in range(61):
+        if day == statement:
+            balances[best] -= credit_spend
+        assert abs(sum(balances.values()) - total_balance[s, day]) < 1e-6
+        for card_id in balances:
+            balances[card_id] *= 1 + debit[card_id].annual_interest_rate / 365
+    assert cashback[s] > 0
+    assert value[s, statement] - value[s, statement - 1] > cashback[s] - 1
+
+
+def test_eom_impact_prefers_cashback_over_primary_account():
+    _, optimizer, engine = build()
+    request = TransactionRequest(amount=300, category=Sector.SHOPPING)
+    result = optimizer.optimize(request, explain=False)
+    impact = engine.eom_impact(result.allocations, request.category, request.amount)
+    assert impact.eom_day == 22
+    assert {s.strategy for s in impact.strategies} == {OPTIMIZED, PRIMARY_ACCOUNT, "debit_only"}
+    # £300 on Capital One at 15%, and the Santander balance keeps earning until the statement
+    assert abs(impact.total_cashback_earned - 45) < 1e-9
+    assert impact.total_interest_saved > 0
+    assert impact.net_eom_benefit > 45
+    assert impact.net_horizon_benefit > impact.net_eom_benefit
+
+
+def test_projection_is_fast_enough_for_every_response():
+    _, optimizer, engine = build()
+    request = TransactionRequest(amount=1200, category=Sector.TRAVEL)
+    result = optimizer.optimize(request, explain=False)
+    engine.eom_impact(result.allocations, request.category, request.amount)
+    started = time.perf_counter()
+    for _ in range(200):
+        engine.eom_impact(result.allocations, request.category, request.amount)
+    assert (time.perf_counter() - started) / 200 < 0.005
+
+
+def test_optimize_response_carries_eom_impact():
+    with TestClient(main.app) as client:
+        response = client.post("/api/optimize-transaction?explanation=none", headers={"X-User-Id": "projection"},
+                               json={"amount": 120, "category": "hotel"})
+        assert response.status_code == 200
+        impact = response.json()["eom_impact"]
+        assert impact["horizon_days"] == 90
+        assert impact["total_cashback_earned"] > 0
+
+        series = client.post("/api/projection?horizon_days=30", headers={"X-User-Id": "projection"},
+                             json={"amount": 120, "category": "hotel"}).json()["series"]
+        assert len(series) == 3 and all(len(s["value"]) == 31 for s in series)
+        assert np.all(np.diff(series[0]["debit_balance"][:2]) > 0)
+        assert client.post("/api/projection?horizon_days=5000", json={"amount": 1, "category": "hotel"}).status_code == 422
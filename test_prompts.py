@@ -0,0 +1,26 @@
+from api.models import Allocation, Sector
+from api.prompts import build_explanation_prompt
+from llm.token_usage import estimate_tokens
+
+
+def allocation(i, amount):
+    return Allocation(card_id=f"dc_{i}", card_name=f"Account {i}", amount_utilised=amount,
+                      interest_saved=amount * 0.01 / 12, cashback_points=amount * 0.01 / 12)
+
+
+def test_prompt_is_compact_table():
+    prompt = build_explanation_prompt([allocation(1, 123.456789)], 123.456789, Sector.GROCERY, "interest_only")
+    lines = prompt.splitlines()
+    assert lines[1] == "Payment: £123.46 grocery (interest_only)"
+    assert lines[2] == "card|amount|cashback|net_savings"
+    assert lines[3] == "Account 1|123.46|0.00|0.10"
+    assert "Allocation(" not in prompt
+
+
+def test_prompt_respects_token_budget():
+    allocations = [allocation(i, 10.0) for i in range(200)]
+    prompt = build_explanation_prompt(allocations, 2000.0, Sector.GENERAL, "interest_only", max_tokens=150)
+    assert estimate_tokens(prompt) <= 150
+    folded = prompt.splitlines()[-1]
+    assert folded.startswith(f"{200 - (len(prompt.splitlines()) - 4)} other sources|")
+    assert sum(float(line.split("|")[1]) for line in prompt.splitlines()[3:]) == 2000.0
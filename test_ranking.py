@@ -0,0 +1,86 @@
+from api.data_seeding import seed_data
+from api.models import Sector, TransactionRequest, UserPreferences
+from api.optimizer import CardOptimizer
+from api.ranking import RankingIndex, lazy_ranked
+
+
+def order(index, category):
+    return [entry.card.id for entry in index.ranked(category)]
+
+
+def test_ranking_matches_benefit_order():
+    debit, credit, international, prefs = seed_data()
+    index = RankingIndex(debit, credit, international, prefs)
+    assert order(index, Sector.HOTEL) == ["cc_3", "cc_1", "cc_2", "dc_2", "dc_3", "dc_4", "dc_1", "ic_1"]
+    assert order(index, Sector.GROCERY) == ["dc_2", "dc_3", "dc_4", "dc_1"]
+    assert index.best_debit_rate == 0.05
+
+
+def test_incremental_updates_match_fresh_index():
+    debit, credit, international, prefs = seed_data()
+    index = RankingIndex(debit, credit, international, prefs)
+
+    credit[1].cashback_rates[Sector.HOTEL] = 0.09
+    index.update_card("cc_2")
+    debit[0].annual_interest_rate = 0.01
+    index.update_card("dc_1")
+    new_prefs = UserPreferences(point_priority=[Sector.FUEL, Sector.SHOPPING])
+    index.set_preferences(new_prefs)
+
+    fresh = RankingIndex(debit, credit, international, new_prefs)
+    for category in Sector:
+        assert order(index, category) == order(fresh, category)
+        assert [e.benefit for e in index.ranked(category)] == [e.benefit for e in fresh.ranked(category)]
+    assert index.best_debit_rate == fresh.best_debit_rate == 0.035
+
+
+def test_limit_change_reroutes_through_index():
+    debit, credit, international, prefs = seed_data()
+    index = RankingIndex(debit, credit, international, prefs)
+    optimizer = CardOptimizer(debit, credit, international, prefs, ranking=index)
+    request = TransactionRequest(amount=500, category=Sector.HOTEL)
+    assert optimizer.optimize(request, explain=False).allocations[0].card_id == "cc_3"
+
+    credit[2].monthly_spend_limit = 50
+    index.update_card("cc_3")
+    allocations = optimizer.optimize(request, explain=False).allocations
+    assert [a.card_id for a in allocations] == ["cc_3", "cc_1"]
+    assert [a.amount_utilised for a in allocations] == [50, 450]
+
+
+def large_portfolio(n):
+    # n of each card type, with repeated rates so ties are exercised
+    debit, credit, international, prefs = seed_data()
+    debits = [d.model_copy(update={"id": f"dc_{i}", "annual_interest_rate": (i % 7) / 100,
+                                   "monthly_spend_limit": 5.0 + i % 3}) for i, d in enumerate(debit * (n // len(debit)))]
+    credits = [c.model_copy(update={"id": f"cc_{i}", "cashback_rates": {Sector.HOTEL: (i % 5) / 100, Sector.SHOPPING: (i % 11) / 100},
+                                    "monthly_spend_limit": 5.0 + i % 4}) for i, c in enumerate(credit * (n // len(credit)))]
+    intl = [international[0].model_copy(update={"id": f"ic_{i}", "markup_rate": (i % 4) / 100}) for i in range(n)]
+    return debits, credits, intl, prefs
+
+
+def test_lazy_ranking_matches_index_on_large_portfolios():
+    debit, credit, international, prefs = large_portfolio(3000)
+    index = RankingIndex(debit, credit, international, prefs)
+    for category in (Sector.HOTEL, Sector.GROCERY):
+        lazy = list(lazy_ranked(debit, credit, international, prefs, category))
+        assert [e.card.id for e in lazy] == order(index, category)
+        assert [e.benefit for e in lazy] == [e.benefit for e in index.ranked(category)]
+
+    indexed = CardOptimizer(debit, credit, international, prefs, ranking=index)
+    heap = CardOptimizer(debit, credit, international, prefs)
+    for amount, category in [(20, Sector.HOTEL), (40, Sector.GROCERY), (300, Sector.SHOPPING), (60000, Sector.FUEL)]:
+        request = TransactionRequest(amount=amount, category=category)
+        expected = indexed.optimize(request, explain=False)
+        actual = heap.optimize(request, explain=False)
+        assert actual.status == expected.status
+        assert [(a.card_id, a.amount_utilised) for a in actual.allocations] == \
+            [(a.card_id, a.amount_utilised) for a in expected.allocations]
+
+
+def test_lazy_ranking_only_orders_what_is_consumed():
+    debit, credit, international, prefs = large_portfolio(3000)
+    walk = lazy_ranked(debit, credit, international, prefs, Sector.SHOPPING)
+    first = [next(walk) for _ in range(3)]
+    assert all(e.card.cashback_rates[Sector.SHOPPING] == 0.10 for e in first)
+    assert len(walk.gi_frame.f_locals["heap"]) == len(debit) + len(credit) + len(international) - 3
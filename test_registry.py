@@ -0,0 +1,44 @@
+import math
+import random
+
+from fastapi.testclient import TestClient
+
+import main
+from api.data_seeding import seed_data
+from api.models import DebitCard, CardType
+from api.ranking import CREDIT, DEBIT, INTERNATIONAL
+from api.registry import CardRegistry, card_available_gbp
+
+
+def test_running_totals_track_mutations():
+    debit, credit, international, _ = seed_data()
+    registry = CardRegistry(debit, credit, international)
+    rng = random.Random(7)
+    for i in range(2000):
+        card_id = rng.choice(["dc_1", "dc_2", "dc_3", "dc_4", "cc_1", "cc_2", "cc_3", "ic_1"])
+        if rng.random() < 0.5:
+            registry.update_limit(card_id, rng.uniform(0, 5000))
+        else:
+            registry.update_balance(card_id, rng.uniform(0, 5000))
+    registry.add_card(DebitCard(id="dc_5", name="New Account", type=CardType.DEBIT, monthly_spend_limit=10,
+                                current_balance=20, annual_interest_rate=0.01), DEBIT)
+    registry.remove_card("cc_2")
+
+    for kind, cards in ((DEBIT, registry.debit_cards), (CREDIT, registry.credit_cards), (INTERNATIONAL, registry.international_cards)):
+        assert math.isclose(registry.total_balance(kind), sum(c.current_balance for c in cards), abs_tol=1e-6)
+        assert math.isclose(registry.total_available(kind), sum(card_available_gbp(c, kind) for c in cards), abs_tol=1e-6)
+    assert registry.get("dc_5").name == "New Account"
+    assert registry.get("cc_2") is None
+
+
+def test_total_balance_endpoint():
+    body = TestClient(main.app).get("/api/cards/total-balance").json()
+    assert body["total_debit_balance"] == 2070.0
+    assert body["total_credit_balance"] == 3000.0
+    assert body["total_gbp_balance"] == 5070.0
+    assert body["total_international_available_gbp"] == 100000.0 / 122.5
+
+
+def test_update_limit_unknown_card():
+    response = TestClient(main.app).post("/api/cards/update-limit", json={"card_id": "nope", "new_limit": 10})
+    assert response.status_code == 404
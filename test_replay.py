@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from api.models import ReplayScenario, TransactionRequest
+from api.replay import BASELINE, build_optimizer, load_scenarios, main, replay
+
+LOG = [json.dumps({"amount": 20 + i * 37 % 3000, "category": category})
+       for i in range(300) for category in ("hotel", "fuel", "grocery")]
+
+
+def expected(scenario: ReplayScenario):
+    optimizer = build_optimizer(scenario)
+    cashback = interest = 0.0
+    shortfalls = 0
+    for line in LOG:
+        result = optimizer.optimize(TransactionRequest.model_validate_json(line), explain=False)
+        cashback += sum(a.cashback_points - a.interest_saved for a in result.allocations)
+        interest += sum(a.interest_saved for a in result.allocations)
+        shortfalls += result.status != "success"
+    return cashback, interest, shortfalls
+
+
+def test_replay_matches_optimizer_per_scenario():
+    scenarios = {
+        BASELINE: ReplayScenario(),
+        "tight": ReplayScenario.model_validate({"cards": {"dc_1": {"monthly_spend_limit": 100}}}),
+        "fuel_first": ReplayScenario.model_validate({"preferences": {"point_priority": ["fuel"]}}),
+    }
+    report = replay(LOG + ["", "not json", '{"amount": 5}'], scenarios, workers=0, chunk_size=100)
+    assert report.lines == len(LOG) + 2 and report.invalid == 2
+    for name, scenario in scenarios.items():
+        totals = report.scenarios[name]
+        cashback, interest, shortfalls = expected(scenario)
+        assert totals.transactions == len(LOG)
+        assert abs(totals.cashback - cashback) < 1e-6
+        assert abs(totals.interest_saved - interest) < 1e-6
+        assert totals.shortfalls == shortfalls
+    assert report.scenarios["tight"].shortfalls > report.scenarios[BASELINE].shortfalls
+
+
+def test_process_pool_gives_the_same_totals():
+    inline = replay(iter(LOG), workers=0, chunk_size=64)
+    pooled = replay(iter(LOG), workers=2, chunk_size=64)
+    assert pooled.lines == inline.lines
+    a, b = inline.scenarios[BASELINE], pooled.scenarios[BASELINE]
+    assert a.transactions == b.transactions and a.shortfalls == b.shortfalls
+    assert abs(a.cashback - b.cashback) < 1e-6
+
+
+def test_unknown_card_override_is_rejected():
+    with pytest.raises(ValueError, match="cc_missing"):
+        replay(LOG, {"bad": ReplayScenario.model_validate({"cards": {"cc_missing": {"current_balance": 1}}})}, workers=0)
+
+
+def test_cli_reads_log_and_scenarios(tmp_path, capsys):
+    log = tmp_path / "log.jsonl"
+    log.write_text("\n".join(LOG[:30]) + "\n")
+    scenarios = tmp_path / "scenarios.json"
+    scenarios.write_text(json.dumps({"hotel_first": {"preferences": {"point_priority": ["hotel"]}}}))
+    assert set(load_scenarios(str(scenarios))) == {BASELINE, "hotel_first"}
+    assert main([str(log), "--scenarios", str(scenarios), "--workers", "0", "--json"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["lines"] == 30
+    assert report["scenarios"]["hotel_first"]["transactions"] == 30
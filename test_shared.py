@@ -0,0 +1,122 @@
+import asyncio
+import json
+import multiprocessing
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from api.feed import ChangeFeed
+from api.shared import SharedStateCoordinator, VersionBoard
+from api.state import StateStore, storage_loader
+from api.storage import SQLiteStore
+
+
+def worker(tmp_path):
+    storage = SQLiteStore(str(tmp_path / "optivault.db"), flush_interval=0.01)
+    board = VersionBoard(str(tmp_path / "optivault.db.versions"))
+    return SharedStateCoordinator(StateStore(), storage, board, storage_loader(storage))
+
+
+def test_workers_see_each_others_updates(tmp_path):
+    a, b = worker(tmp_path), worker(tmp_path)
+    assert b.get("carol").registry.get("cc_3").monthly_spend_limit == 500
+
+    with a.exclusive("carol") as state:
+        state.registry.update_limit("cc_3", 75)
+        state.ranking.update_card("cc_3")
+    assert b.get("carol").registry.get("cc_3").monthly_spend_limit == 75
+    assert b.reloads == 1
+    # A's own write doesn't make A reload
+    assert a.get("carol").registry.get("cc_3").monthly_spend_limit == 75
+    assert a.reloads == 0
+
+
+def test_write_behind_changes_reach_other_workers_within_a_flush(tmp_path):
+    a, b = worker(tmp_path), worker(tmp_path)
+    b.get("dave")
+    a.get("dave").registry.update_limit("dc_1", 42)
+    deadline = time.monotonic() + 5
+    while b.get("dave").registry.get("dc_1").monthly_spend_limit != 42 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert b.get("dave").registry.get("dc_1").monthly_spend_limit == 42
+
+
+def _update_in_other_process(tmp_path):
+    with worker(tmp_path).exclusive("erin") as state:
+        state.registry.update_limit("dc_2", 11)
+
+
+def test_update_from_another_process(tmp_path):
+    local = worker(tmp_path)
+    local.get("erin")
+    process = multiprocessing.get_context("fork").Process(target=_update_in_other_process, args=(tmp_path,))
+    process.start()
+    process.join(10)
+    assert process.exitcode == 0
+    assert local.get("erin").registry.get("dc_2").monthly_spend_limit == 11
+
+
+def test_due_housekeeping_runs_under_the_users_lock(tmp_path, monkeypatch):
+    coordinator = worker(tmp_path)
+    monkeypatch.setattr(main, "coordinator", coordinator)
+    locked = []
+    exclusive = coordinator.exclusive
+
+    def spy(user_id):
+        locked.append(user_id)
+        return exclusive(user_id)
+
+    monkeypatch.setattr(coordinator, "exclusive", spy)
+    main.user_state("gina")
+    assert locked == []
+    # A month rollover rewrites every card, so it waits for the lock
+    coordinator.get("gina").ledger.month = "2000-01"
+    state = main.user_state("gina")
+    assert locked == ["gina"] and state.ledger.month != "2000-01"
+    assert coordinator.storage.stats()["pending"] == 0
+
+
+def test_endpoints_mutate_under_the_lock_in_shared_mode(tmp_path, monkeypatch):
+    a, b = worker(tmp_path), worker(tmp_path)
+    monkeypatch.setattr(main, "coordinator", a)
+    with TestClient(main.app) as client:
+        response = client.post("/api/cards/update-limit", json={"card_id": "dc_1", "new_limit": 70},
+                               headers={"X-User-Id": "hana"})
+        assert response.status_code == 200
+    # Flushed before the lock was released, so the other worker sees it at once
+    assert b.get("hana").registry.get("dc_1").monthly_spend_limit == 70
+
+
+def test_a_single_worker_runs_without_the_coordinator(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_PATH", str(tmp_path / "optivault.db"))
+    monkeypatch.setattr(main, "WORKERS", 1)
+    monkeypatch.setattr(main, "storage", None)
+    monkeypatch.setattr(main, "coordinator", None)
+    monkeypatch.setattr(main, "states", StateStore())
+    main.open_storage()
+    assert main.coordinator is None
+    main.user_state("ivy").registry.update_limit("dc_1", 12)
+    main.storage.close()
+    reopened = SQLiteStore(str(tmp_path / "optivault.db"))
+    assert reopened.load_user("ivy").cards["debit"][0].monthly_spend_limit == 12
+    reopened.close()
+
+
+def test_feed_publishes_changes_made_by_other_workers(tmp_path):
+    a, b = worker(tmp_path), worker(tmp_path)
+    feed = ChangeFeed(lookup=a.states.peek, tick=0.01)
+    feed.stale, feed.reload = a.stale, a.get
+    feed.attach(a.get("kim"))
+
+    async def scenario():
+        subscription = feed.subscribe("kim")
+        with b.exclusive("kim") as state:
+            state.registry.update_limit("dc_1", 55)
+        text = await asyncio.wait_for(subscription.get(), timeout=5)
+        subscription.close()
+        return json.loads(text)
+
+    delta = asyncio.run(scenario())
+    assert next(c for c in delta["cards"] if c["id"] == "dc_1")["monthly_spend_limit"] == 55
+    assert a.reloads == 1
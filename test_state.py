@@ -0,0 +1,71 @@
+from fastapi.testclient import TestClient
+
+import main
+from api.data_seeding import seed_data
+from api.models import Sector, TransactionRequest, UserPreferences
+from api.optimizer import CardOptimizer
+from api.state import StateStore, seed_user_state
+
+
+def test_users_have_separate_portfolios():
+    client = TestClient(main.app)
+    alice = {"X-User-Id": "test-state-alice"}
+    bob = {"X-User-Id": "test-state-bob"}
+    assert client.post("/api/cards/update-limit", json={"card_id": "cc_3", "new_limit": 0}, headers=alice).status_code == 200
+
+    request = {"amount": 100, "category": "shopping"}
+    alice_result = client.post("/api/optimize-transaction?explanation=none", json=request, headers=alice).json()
+    bob_result = client.post("/api/optimize-transaction?explanation=none", json=request, headers=bob).json()
+    assert "cc_3" not in [a["card_id"] for a in alice_result["allocations"]]
+    assert bob_result["allocations"][0]["card_id"] == "cc_3"
+
+
+def test_store_evicts_least_recently_used():
+    evicted = []
+    store = StateStore(maxsize=2, on_evict=lambda state: evicted.append(state.user_id))
+    first = store.get("a")
+    store.get("b")
+    assert store.get("a") is first
+    store.get("c")
+    assert evicted == ["b"]
+    assert store.peek("b") is None
+    assert store.stats() == {"size": 2, "maxsize": 2, "hits": 1, "loads": 3, "evictions": 1}
+
+
+def test_compact_records_optimize_like_models():
+    state = seed_user_state("compact")
+    assert not hasattr(state.credit_cards[0], "__dict__")
+    # Identical cashback tables are shared between users
+    assert seed_user_state("other").credit_cards[0].cashback_rates is state.credit_cards[0].cashback_rates
+
+    debit, credit, international, prefs = seed_data()
+    reference = CardOptimizer(debit, credit, international, prefs)
+    for category in Sector:
+        request = TransactionRequest(amount=750, category=category)
+        assert state.optimizer().optimize(request, explain=False) == reference.optimize(request, explain=False)
+
+
+def test_store_keeps_unpersisted_changes_resident():
+    store = StateStore(maxsize=1)
+    changed = store.get("changed")
+    changed.registry.update_limit("dc_1", 5)
+    store.get("a")
+    store.get("b")
+    assert store.peek("changed") is changed
+    assert store.peek("a") is None
+    assert len(store) == 2
+
+
+def test_ranking_and_ledger_are_built_on_first_use():
+    state = seed_user_state("lazy")
+    state.registry.update_limit("cc_3", 250)
+    state.update_ranking("cc_3")
+    state.set_preferences(UserPreferences(point_priority=[Sector.FUEL]))
+    state.refresh_ledger()
+    assert state.registry.totals() and state.month
+    # Read-only and limit traffic leaves the heavy structures unbuilt
+    assert "ranking" not in vars(state) and "ledger" not in vars(state)
+
+    result = state.optimizer().optimize(TransactionRequest(amount=100, category=Sector.FUEL), explain=False)
+    assert result.status == "success" and "ranking" in vars(state)
+    assert state.ledger.month == state.month
@@ -0,0 +1,53 @@
+import time
+
+from api.models import Allocation, HoldStatus, Sector, UserPreferences
+from api.state import storage_loader
+from api.storage import SQLiteStore
+
+
+def test_state_survives_reopening_the_database(tmp_path):
+    path = str(tmp_path / "optivault.db")
+    storage = SQLiteStore(path)
+    state = storage_loader(storage)("alice")
+    state.registry.update_limit("cc_3", 250)
+    state.set_preferences(UserPreferences(point_priority=[Sector.FUEL, Sector.HOTEL]))
+    hold = state.ledger.reserve([Allocation(card_id="dc_1", card_name="dc_1", amount_utilised=120)])
+    settled = state.ledger.reserve([Allocation(card_id="dc_2", card_name="dc_2", amount_utilised=30)])
+    state.ledger.settle(settled.hold_id)
+    state.ledger.month = "2026-01"
+    state.ledger.on_rollover("2026-01")
+    storage.close()
+
+    reopened = SQLiteStore(path)
+    restored = storage_loader(reopened)("alice")
+    assert restored.registry.get("cc_3").monthly_spend_limit == 250
+    assert restored.preferences.point_priority == [Sector.FUEL, Sector.HOTEL]
+    assert restored.registry.get("dc_1").reserved == 120
+    assert restored.registry.get("dc_2").month_to_date_spend == 30
+    assert restored.ledger.month == "2026-01"
+    assert [c.id for c in restored.credit_cards] == [c.id for c in state.credit_cards]
+    # The open hold comes back and can still be released
+    assert restored.ledger.get(hold.hold_id).status == HoldStatus.RESERVED
+    restored.ledger.release(hold.hold_id)
+    assert restored.registry.get("dc_1").reserved == 0
+    reopened.close()
+
+
+def test_write_behind_flushes_off_the_request_path(tmp_path):
+    storage = SQLiteStore(str(tmp_path / "optivault.db"), flush_interval=0.01)
+    state = storage_loader(storage)("bob")
+    storage.record_decision("bob", Sector.HOTEL, 100.0, "success", "none", None, [("cc_3", 100.0)])
+    state.registry.update_limit("dc_1", 10)
+
+    deadline = time.monotonic() + 5
+    while storage.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert storage.stats()["pending"] == 0
+    assert storage.flushes >= 1
+    assert storage.decision_count("bob") == 1
+
+    # Read back through a second store, as another process would
+    other = SQLiteStore(storage.path)
+    assert other.load_user("bob").cards["debit"][0].monthly_spend_limit == 10
+    other.close()
+    storage.close()
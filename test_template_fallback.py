@@ -0,0 +1,35 @@
+from api.models import Allocation, Sector
+from api.template_explainer import template_explanation
+from llm.circuit_breaker import CircuitBreaker
+
+
+def test_template_explanation_for_split_payment():
+    allocations = [
+        Allocation(card_id="cc_3", card_name="Capital One Credit", amount_utilised=500.0,
+                   interest_saved=2.08, cashback_points=77.08, cashback_sector=Sector.SHOPPING),
+        Allocation(card_id="dc_1", card_name="Santander Current Account", amount_utilised=100.0,
+                   interest_saved=0.0, cashback_points=0.0),
+    ]
+    text = template_explanation(allocations, 600.0, Sector.SHOPPING, "balanced")
+    assert text == (
+        "Your £600.00 shopping payment is split across 2 sources: Capital One Credit (£500.00) and "
+        "Santander Current Account (£100.00). This earns £75.00 cashback on shopping spend and keeps £2.08 "
+        "in Net Savings by leaving your best savings balance untouched."
+    )
+
+
+def test_circuit_breaker_opens_and_recovers():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    assert breaker.allow()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    now[0] = 10
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial call while half open
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()